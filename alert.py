@@ -1,19 +1,25 @@
 from twilio.rest import Client
+import logging
 import os
 from dotenv import load_dotenv
-import time
 import requests
 from urllib.parse import quote
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Your Twilio Account SID and Auth Token
 account_sid = os.getenv('TWILIO_ACCOUNT_SID')
 auth_token = os.getenv('TWILIO_AUTH_TOKEN')
 client = Client(account_sid, auth_token)
+# Point the client at another Twilio-compatible API, e.g. fakes.FakeTwilioServer
+if os.getenv('TWILIO_API_URL'):
+    client.api.base_url = os.getenv('TWILIO_API_URL').rstrip('/')
 
 def send_whatsapp_alert(message, snapshot_path=None):
+    """Send one WhatsApp message, raises on failure so the caller can retry"""
     try:
         # Your Twilio WhatsApp number (with country code)
         from_whatsapp_number = os.getenv('TWILIO_WHATSAPP_NUMBER')
@@ -21,7 +27,7 @@ def send_whatsapp_alert(message, snapshot_path=None):
         to_whatsapp_number = os.getenv('RECIPIENT_WHATSAPP_NUMBER')
         
         if not from_whatsapp_number or not to_whatsapp_number:
-            print("❌ Error: WhatsApp numbers not configured in .env file")
+            logger.error("❌ Error: WhatsApp numbers not configured in .env file")
             return
             
         # Format WhatsApp numbers
@@ -47,20 +53,16 @@ def send_whatsapp_alert(message, snapshot_path=None):
                 to=to_whatsapp_number
             )
             
-        print(f"✅ WhatsApp alert sent successfully: {message.sid}")
+        logger.info(f"✅ WhatsApp alert sent successfully: {message.sid}")
         
     except Exception as e:
         error_msg = str(e)
         if "exceeded the null daily messages limit" in error_msg:
-            print("⚠️ Twilio daily message limit reached. Please try again later.")
+            logger.warning("⚠️ Twilio daily message limit reached. Please try again later.")
         elif "HTTP Error" in error_msg:
-            print("❌ Twilio API Error: Please check your account credentials and permissions")
-            print(f"Error details: {error_msg}")
+            logger.error("❌ Twilio API Error: Please check your account credentials and permissions")
+            logger.error(f"Error details: {error_msg}")
         else:
-            print(f"❌ Error sending WhatsApp alert: {error_msg}")
-            # Print more detailed error information
-            import traceback
-            print(traceback.format_exc())
-        
-        # Add a delay before retrying to avoid rate limiting
-        time.sleep(5)
+            # Log with the full traceback for more detailed error information
+            logger.exception(f"❌ Error sending WhatsApp alert: {error_msg}")
+        raise
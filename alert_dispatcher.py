@@ -0,0 +1,183 @@
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_FILE = "alerts_dead_letter.jsonl"
+DISPATCH_WORKERS = 2
+QUEUE_SIZE = 100
+MAX_ATTEMPTS = 5
+BASE_RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+
+_STOP = object()
+
+def backoff_delay(attempt, base=BASE_RETRY_DELAY, maximum=MAX_RETRY_DELAY):
+    """Exponential backoff with full jitter for the given (1-based) failed attempt"""
+    return random.uniform(0, min(maximum, base * 2 ** (attempt - 1)))
+
+class AlertDispatcher:
+    """Delivers alerts from a bounded queue on a fixed pool of worker threads.
+
+    deliver(message, snapshot_path) must raise on failure. Failed deliveries are
+    retried with exponential backoff, and alerts that still fail, or that arrive
+    while the queue is full, are appended to a dead-letter spool on disk which is
+    replayed the next time the dispatcher starts. record(alert) is called once
+    per alert, before its first delivery attempt.
+    """
+
+    def __init__(self, deliver, record=None, workers=DISPATCH_WORKERS, queue_size=QUEUE_SIZE,
+                 max_attempts=MAX_ATTEMPTS, base_delay=BASE_RETRY_DELAY, max_delay=MAX_RETRY_DELAY,
+                 spool_file=DEAD_LETTER_FILE):
+        self.deliver = deliver
+        self.record = record
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.spool_file = spool_file
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.accepting = False
+        self._threads = []
+        self._spool_lock = threading.Lock()
+        self._abort = threading.Event()
+
+        REGISTRY.gauge("alert_queue_depth", "Alerts waiting for a dispatch worker", read=self.queue.qsize)
+        self.latency = REGISTRY.histogram("alert_delivery_latency_seconds",
+                                          "Time from an alert being raised to its delivery")
+        self.delivered = REGISTRY.counter("alerts_delivered_total", "Alerts delivered")
+        self.retries = REGISTRY.counter("alert_retries_total", "Failed alert deliveries that were retried")
+        self.dead_lettered = REGISTRY.counter("alerts_dead_lettered_total", "Alerts written to the dead-letter spool")
+
+    def start(self):
+        self._abort.clear()
+        self.accepting = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"alert-dispatch-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._replay_spool()
+        return self
+
+    def submit(self, message, snapshot_path=None):
+        """Queue an alert without blocking, returns False if it went to the spool instead"""
+        alert = {"id": uuid.uuid4().hex, "message": message, "snapshot": snapshot_path,
+                 "created_at": time.time(), "attempts": 0, "recorded": False}
+        return self._enqueue(alert)
+
+    def _enqueue(self, alert):
+        if not self.accepting:
+            self._dead_letter(alert, "dispatcher is not running")
+            return False
+        try:
+            self.queue.put_nowait(alert)
+        except queue.Full:
+            self._dead_letter(alert, "dispatch queue is full")
+            return False
+        return True
+
+    def _work(self):
+        while True:
+            alert = self.queue.get()
+            try:
+                if alert is _STOP:
+                    return
+                self._dispatch(alert)
+            finally:
+                self.queue.task_done()
+
+    def _dispatch(self, alert):
+        if not alert["recorded"] and self.record is not None:
+            try:
+                self.record(alert)
+            except Exception as e:
+                logger.exception(f"❌ Error recording alert: {str(e)}")
+            alert["recorded"] = True
+
+        while not self._abort.is_set():
+            alert["attempts"] += 1
+            try:
+                self.deliver(alert["message"], alert["snapshot"])
+            except Exception as e:
+                if alert["attempts"] >= self.max_attempts:
+                    self._dead_letter(alert, str(e))
+                    return
+                delay = backoff_delay(alert["attempts"], self.base_delay, self.max_delay)
+                logger.warning(f"⚠️ Alert delivery failed ({str(e)}), retry {alert['attempts']} in {delay:.1f}s")
+                self.retries.inc()
+                self._abort.wait(delay)
+                continue
+            self.delivered.inc()
+            self.latency.observe(time.time() - alert["created_at"])
+            return
+        self._dead_letter(alert, "dispatcher shut down")
+
+    def _dead_letter(self, alert, reason):
+        logger.error(f"❌ Alert could not be delivered ({reason}), spooled to {self.spool_file}")
+        self.dead_lettered.inc()
+        with self._spool_lock:
+            with open(self.spool_file, "a") as f:
+                f.write(json.dumps({**alert, "reason": reason}) + "\n")
+
+    def _replay_spool(self):
+        """Take every spooled alert out of the spool file and queue it again"""
+        with self._spool_lock:
+            if not os.path.exists(self.spool_file):
+                return
+            with open(self.spool_file, "r") as f:
+                lines = f.readlines()
+            os.remove(self.spool_file)
+
+        alerts = []
+        for line in lines:
+            try:
+                alerts.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"⚠️ Skipping corrupt line in {self.spool_file}")
+        if alerts:
+            logger.info(f"🔄 Replaying {len(alerts)} undelivered alerts")
+        for alert in alerts:
+            alert.pop("reason", None)
+            alert["attempts"] = 0
+            self._enqueue(alert)
+
+    def shutdown(self, timeout=10.0):
+        """Stop accepting alerts, deliver what is queued and spool whatever is left after timeout"""
+        if not self.accepting:
+            return
+        self.accepting = False
+        deadline = time.monotonic() + timeout
+        # Stop markers queue behind the pending alerts, so those are delivered first
+        for _ in self._threads:
+            try:
+                self.queue.put(_STOP, timeout=max(0.01, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+        if any(thread.is_alive() for thread in self._threads):
+            # Cut retries short and spool the rest
+            self._abort.set()
+            while True:
+                try:
+                    alert = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if alert is not _STOP:
+                    self._dead_letter(alert, "dispatcher shut down")
+                self.queue.task_done()
+            for thread in self._threads:
+                if thread.is_alive():
+                    self.queue.put_nowait(_STOP)
+            for thread in self._threads:
+                thread.join(timeout=1.0)
+        self._threads = []
@@ -0,0 +1,81 @@
+import time
+
+from metrics import REGISTRY
+
+# Seconds before the same alert may fire again for the same suppression key
+ALERT_COOLDOWNS = {
+    "guest_with_known": 600,
+    "known_person": 600,
+    "high_threat": 60,
+    "normal_threat": 300,
+    "motion": 120,
+}
+DEFAULT_COOLDOWN = 300
+
+# Alerts of a category that follow a sent one within this window are folded into one digest
+DIGEST_WINDOW = 60
+
+ALERTS_SUPPRESSED = REGISTRY.counter("alerts_suppressed_total", "Alerts dropped by a cooldown")
+ALERTS_DIGESTED = REGISTRY.counter("alerts_digested_total", "Alerts folded into a digest")
+
+class AlertPolicy:
+    """Decides which alerts of one camera go out, replacing fire-once-per-process flags.
+
+    Each alert has a category (e.g. "high_threat") and an optional key, such
+    as a track id. The same category and key stay quiet for the category's
+    cooldown, so a lingering person does not re-alert every frame while a new
+    person does. Alerts for new keys arriving within digest_window of the
+    last one sent in that category are counted instead, and due_digests()
+    later turns them into a single message with the first frame as its
+    snapshot. digest_window=None sends every new key at once.
+    """
+
+    def __init__(self, cooldowns=None, default_cooldown=DEFAULT_COOLDOWN, digest_window=DIGEST_WINDOW):
+        self.cooldowns = {**ALERT_COOLDOWNS, **(cooldowns or {})}
+        self.default_cooldown = default_cooldown
+        self.digest_window = digest_window
+        self.last_fired = {}
+        self.category_sent = {}
+        self.digests = {}
+
+    def cooldown(self, category):
+        return self.cooldowns.get(category, self.default_cooldown)
+
+    def check(self, category, message, frame, key=None, now=None):
+        """Returns True if the alert should be sent now"""
+        now = time.time() if now is None else now
+        suppression_key = (category, key)
+        if now - self.last_fired.get(suppression_key, float("-inf")) < self.cooldown(category):
+            ALERTS_SUPPRESSED.inc()
+            return False
+        self.last_fired[suppression_key] = now
+
+        last_sent = self.category_sent.get(category, float("-inf"))
+        in_window = bool(self.digest_window) and now - last_sent < self.digest_window
+        # A digest that is due but not yet sent takes this alert too
+        if in_window or category in self.digests:
+            digest = self.digests.setdefault(category, {"count": 0, "message": message, "frame": frame})
+            digest["count"] += 1
+            ALERTS_DIGESTED.inc()
+            return False
+
+        self.category_sent[category] = now
+        return True
+
+    def due_digests(self, now=None):
+        """(category, message, frame) for every digest whose window has closed"""
+        now = time.time() if now is None else now
+        due = []
+        for category, digest in list(self.digests.items()):
+            if now - self.category_sent[category] < self.digest_window:
+                continue
+            del self.digests[category]
+            self.category_sent[category] = now
+            message = f"{digest['message']} ({digest['count']} similar alerts in the last {self.digest_window}s)"
+            due.append((category, message, digest["frame"]))
+
+        # Forget keys whose cooldown has passed, track ids never come back
+        expired = [k for k, fired in self.last_fired.items() if now - fired >= self.cooldown(k[0])]
+        for suppression_key in expired:
+            del self.last_fired[suppression_key]
+        return due
@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from stats_service import get_stats
+
+logger = logging.getLogger(__name__)
+
+ALERTS_DB = "alerts.db"
+LEGACY_ALERTS_FILE = "alerts.json"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def _to_epoch(value):
+    """Accept epoch seconds or a datetime"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+def _row_to_alert(row):
+    alert_id, created_at, message, snapshot = row
+    return {
+        "id": alert_id,
+        "created_at": created_at,
+        "timestamp": datetime.fromtimestamp(created_at).strftime(TIMESTAMP_FORMAT),
+        "message": message,
+        "snapshot": snapshot,
+    }
+
+class AlertStore:
+    """Append-only alert log in SQLite (WAL mode), indexed by time.
+
+    Alerts come back as dicts with the same "timestamp", "message" and
+    "snapshot" keys alerts.json used, plus "id" and "created_at" (epoch seconds).
+    On first open an existing alerts.json is imported and renamed. Writes
+    are also counted in stats, if given, for the dashboard summary.
+    """
+
+    def __init__(self, path=ALERTS_DB, legacy_file=LEGACY_ALERTS_FILE, stats=None):
+        self.path = path
+        self.stats = stats
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                message TEXT NOT NULL,
+                snapshot TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS alerts_created_at ON alerts (created_at)")
+        if legacy_file and os.path.exists(legacy_file):
+            self.migrate_json(legacy_file)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def append(self, message, snapshot=None, created_at=None):
+        """Store one alert and return its id"""
+        created_at = time.time() if created_at is None else _to_epoch(created_at)
+        with self._lock:
+            cursor = self._conn.execute("INSERT INTO alerts (created_at, message, snapshot) VALUES (?, ?, ?)",
+                                        (created_at, message, snapshot))
+        if self.stats:
+            self.stats.record_alert(message, created_at)
+        return cursor.lastrowid
+
+    def last_n(self, n):
+        """The n most recent alerts, oldest first"""
+        rows = self._query("SELECT id, created_at, message, snapshot FROM alerts "
+                           "ORDER BY created_at DESC, id DESC LIMIT ?", (n,))
+        return [_row_to_alert(row) for row in reversed(rows)]
+
+    def range(self, start=None, end=None, limit=None):
+        """Alerts with start <= created_at < end, oldest first"""
+        sql = "SELECT id, created_at, message, snapshot FROM alerts WHERE created_at >= ? AND created_at < ? " \
+              "ORDER BY created_at, id"
+        params = [float("-inf") if start is None else _to_epoch(start),
+                  float("inf") if end is None else _to_epoch(end)]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [_row_to_alert(row) for row in self._query(sql, params)]
+
+    def after(self, last_id, limit=100):
+        """Alerts added after the one with id last_id, oldest first"""
+        rows = self._query("SELECT id, created_at, message, snapshot FROM alerts WHERE id > ? ORDER BY id LIMIT ?",
+                           (last_id, limit))
+        return [_row_to_alert(row) for row in rows]
+
+    def last_id(self):
+        return self._query("SELECT COALESCE(MAX(id), 0) FROM alerts")[0][0]
+
+    def count(self, since=None, contains=None):
+        """Number of alerts, optionally only newer than since or whose message contains a word"""
+        sql = "SELECT COUNT(*) FROM alerts WHERE created_at >= ?"
+        params = [float("-inf") if since is None else _to_epoch(since)]
+        if contains:
+            sql += " AND message LIKE ?"
+            params.append(f"%{contains}%")
+        return self._query(sql, params)[0][0]
+
+    def first(self):
+        """The oldest alert, or None"""
+        rows = self._query("SELECT id, created_at, message, snapshot FROM alerts ORDER BY created_at, id LIMIT 1")
+        return _row_to_alert(rows[0]) if rows else None
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM alerts")
+        if self.stats:
+            self.stats.reset_alerts()
+
+    def migrate_json(self, legacy_file=LEGACY_ALERTS_FILE):
+        """Import alerts from the old alerts.json in one transaction.
+
+        The file is renamed to alerts.json.migrated first, which claims it, so
+        the import happens once even if several processes open the store.
+        """
+        migrated_file = legacy_file + ".migrated"
+        try:
+            os.replace(legacy_file, migrated_file)
+        except FileNotFoundError:
+            return 0
+        try:
+            with open(migrated_file, "r") as f:
+                content = f.read()
+            alerts = json.loads(content) if content.strip() else []
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"⚠️ Could not read {migrated_file} for migration: {str(e)}")
+            return 0
+
+        rows = []
+        for alert in alerts:
+            try:
+                created_at = datetime.strptime(alert["timestamp"], TIMESTAMP_FORMAT).timestamp()
+            except (KeyError, TypeError, ValueError):
+                continue
+            rows.append((created_at, alert.get("message", ""), alert.get("snapshot")))
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT INTO alerts (created_at, message, snapshot) VALUES (?, ?, ?)", rows)
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        if self.stats:
+            for created_at, message, _ in rows:
+                self.stats.record_alert(message, created_at)
+        logger.info(f"✅ Migrated {len(rows)} alerts from {legacy_file} to {self.path}")
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """The process-wide alert store"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AlertStore(stats=get_stats())
+        return _store
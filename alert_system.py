@@ -1,60 +1,53 @@
-import json
-import os
+import atexit
+import logging
 import threading
-from datetime import datetime
-import cv2
 from alert import send_whatsapp_alert
+from alert_dispatcher import AlertDispatcher
+from alert_store import get_store
+from metrics import REGISTRY, stage_timer
+from snapshot_service import get_snapshot_service
 
-# Constants
-SNAPSHOT_DIR = "snapshots"
-ALERTS_FILE = "alerts.json"
+logger = logging.getLogger(__name__)
 
-def take_snapshot(frame, label):
-    """Take a snapshot of the current frame"""
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    snapshot_path = f"{SNAPSHOT_DIR}/{label}_{timestamp}.jpg"
-    cv2.imwrite(snapshot_path, frame)
-    return snapshot_path
+DISPATCH_SECONDS = stage_timer("alert_dispatch")
+ALERTS_SENT = REGISTRY.counter("alerts_sent_total", "Alerts dispatched")
+
+# How long a delivery waits for its snapshot to reach the disk
+SNAPSHOT_WAIT_SECONDS = 10.0
+
+def take_snapshot(frame, label, camera=None):
+    """Queue a snapshot of the frame and return its path, the file is written in the background"""
+    return get_snapshot_service().save(frame, label, camera=camera)
+
+def record_alert(alert):
+    """Append an alert to the alert store read by the dashboard"""
+    get_store().append(alert["message"], alert["snapshot"], created_at=alert["created_at"])
+
+def deliver_alert(message, snapshot_path=None):
+    """Send one alert over WhatsApp once its snapshot is on disk, raises if Twilio rejects it"""
+    if snapshot_path and not get_snapshot_service().wait(snapshot_path, timeout=SNAPSHOT_WAIT_SECONDS):
+        logger.warning(f"⚠️ Snapshot {snapshot_path} is not on disk, sending the alert without it")
+        snapshot_path = None
+    with DISPATCH_SECONDS.time():
+        send_whatsapp_alert(message, snapshot_path)
+    ALERTS_SENT.inc()
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher():
+    """The process-wide alert dispatcher, started on first use and drained at exit"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = AlertDispatcher(deliver_alert, record=record_alert).start()
+            atexit.register(_dispatcher.shutdown)
+        return _dispatcher
 
 def send_alert_in_background(message, snapshot_path=None):
-    """Send alert in background thread"""
-    def send():
-        try:
-            # Print alert to terminal
-            print(f"\n🔔 Alert: {message}")
-            if snapshot_path:
-                print(f"📸 Snapshot saved: {snapshot_path}")
-            
-            # Send WhatsApp alert
-            send_whatsapp_alert(message, snapshot_path)
-            
-            # Update alerts file
-            alerts = []
-            if os.path.exists(ALERTS_FILE):
-                try:
-                    with open(ALERTS_FILE, "r") as f:
-                        content = f.read()
-                        if content.strip():  # Check if file is not empty
-                            alerts = json.loads(content)
-                except json.JSONDecodeError:
-                    # If file is corrupted or empty, start with empty list
-                    alerts = []
-            
-            alerts.append({
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "message": message,
-                "snapshot": snapshot_path
-            })
-            
-            with open(ALERTS_FILE, "w") as f:
-                json.dump(alerts, f, indent=4)
-                
-        except Exception as e:
-            print(f"Error sending alert: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-    
-    # Start alert thread
-    alert_thread = threading.Thread(target=send)
-    alert_thread.daemon = True
-    alert_thread.start() 
\ No newline at end of file
+    """Queue an alert for delivery by the dispatcher workers"""
+    # Log alert to terminal
+    logger.info(f"🔔 Alert: {message}")
+    if snapshot_path:
+        logger.info(f"📸 Snapshot saved: {snapshot_path}")
+    get_dispatcher().submit(message, snapshot_path)
@@ -2,21 +2,38 @@ git hub vision guard app.py
 
 
 import streamlit as st
-import cloudinary.api
+import cloudinary.uploader
+import cloudinary.utils
 import config
 import time
 from datetime import datetime
 import pytz
 from PIL import Image
 import requests
+import requests.adapters
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from io import BytesIO
-import os
-import json
+from datetime import timedelta
+from alert_store import AlertStore
+from database import get_catalog, UPLOAD_DONE
+from stats_service import get_stats
+from thumbnails import THUMBNAIL_SIZES, thumbnail_public_id
 
 # Constants
 STANDARD_WIDTH = 400
 STANDARD_HEIGHT = 300
 
+# A gallery page listing is reused for this many seconds across reruns
+LISTING_TTL = 10
+GALLERY_PAGE_SIZE = 12
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+THUMBNAIL_CACHE_SIZE = 256
+FETCH_WORKERS = 8
+# (connect, read) timeouts for image downloads
+FETCH_TIMEOUT = (3.05, 10)
+
 # Page Configuration
 st.set_page_config(
     page_title="CCTV Surveillance System",
@@ -102,30 +119,29 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_alert_store():
+    """One alert store connection shared by every dashboard session"""
+    return AlertStore(stats=get_stats())
+
+@st.cache_resource
+def get_stats_service():
+    """The stats the alert and snapshot writers keep up to date, built from history the first time"""
+    stats = get_stats()
+    if not stats.is_built():
+        stats.rebuild(get_alert_store(), get_catalog())
+    return stats
+
 def get_system_stats():
     """Get system statistics"""
     try:
-        # Get number of snapshots
-        snapshots = [f for f in os.listdir("snapshots") if f.endswith(('.jpg', '.jpeg', '.png'))]
-        num_snapshots = len(snapshots)
-        
-        # Get latest alerts
-        alerts = []
-        if os.path.exists("alerts.json"):
-            with open("alerts.json", "r") as f:
-                alerts = json.load(f)
-        
-        # Calculate statistics
-        total_alerts = len(alerts)
-        recent_alerts = len([a for a in alerts if (datetime.now() - datetime.strptime(a["timestamp"], "%Y-%m-%d %H:%M:%S")).days < 1])
-        threat_alerts = len([a for a in alerts if "threat" in a["message"].lower()])
-        
+        summary = get_stats_service().summary()
         return {
-            "num_snapshots": num_snapshots,
-            "total_alerts": total_alerts,
-            "recent_alerts": recent_alerts,
-            "threat_alerts": threat_alerts,
-            "system_uptime": get_system_uptime()
+            "num_snapshots": summary["num_snapshots"],
+            "total_alerts": summary["total_alerts"],
+            "recent_alerts": summary["recent_alerts"],
+            "threat_alerts": summary["threat_alerts"],
+            "system_uptime": get_system_uptime(summary)
         }
     except Exception as e:
         st.error(f"Error getting system stats: {str(e)}")
@@ -137,27 +153,32 @@ def get_system_stats():
             "system_uptime": "0:00:00"
         }
 
-def get_system_uptime():
+def get_system_uptime(summary=None):
     """Calculate system uptime"""
     try:
-        if os.path.exists("alerts.json"):
-            with open("alerts.json", "r") as f:
-                alerts = json.load(f)
-                if alerts:
-                    first_alert = datetime.strptime(alerts[0]["timestamp"], "%Y-%m-%d %H:%M:%S")
-                    uptime = datetime.now() - first_alert
-                    hours = int(uptime.total_seconds() // 3600)
-                    minutes = int((uptime.total_seconds() % 3600) // 60)
-                    seconds = int(uptime.total_seconds() % 60)
-                    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        first_alert = (summary or get_stats_service().summary())["first_alert"]
+        if first_alert:
+            uptime = datetime.now() - datetime.fromtimestamp(first_alert)
+            hours = int(uptime.total_seconds() // 3600)
+            minutes = int((uptime.total_seconds() % 3600) // 60)
+            seconds = int(uptime.total_seconds() % 60)
+            return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
     except:
         pass
     return "00:00:00"
 
-def delete_image(public_id):
+def delete_image(public_id, filepath=None):
     try:
         result = cloudinary.uploader.destroy(public_id)
         if result.get('result') == 'ok':
+            # Every derivative the uploader pushed along with the original
+            for size in THUMBNAIL_SIZES:
+                cloudinary.uploader.destroy(thumbnail_public_id(public_id, size))
+            get_thumbnail_cache().discard(public_id)
+            if filepath:
+                get_catalog().delete(filepath)
+                get_catalog().flush(2.0)
+            list_snapshot_page.clear()
             st.success("Image deleted successfully!")
             time.sleep(1)
             st.rerun()
@@ -186,45 +207,162 @@ def time_difference(timestamp_str):
         days = minutes // 1440
         return f"{days} days ago"
 
-def fetch_latest_images():
+class ThumbnailCache:
+    """Bounded LRU of decoded dashboard tiles by public_id, uploaded snapshots never change"""
+
+    def __init__(self, maxsize=THUMBNAIL_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, public_id, image_url, pool):
+        """A future for the tile, shared with a fetch of it that is already in flight (e.g. a prefetch)"""
+        with self._lock:
+            future = self._pending.get(public_id)
+            if future is not None:
+                return future
+            future = pool.submit(get_thumbnail, public_id, image_url)
+            self._pending[public_id] = future
+        future.add_done_callback(lambda done: self._settle(public_id, done))
+        return future
+
+    def _settle(self, public_id, future):
+        with self._lock:
+            self._pending.pop(public_id, None)
+        if future.exception() is None:
+            self.put(public_id, future.result())
+
+    def get(self, public_id):
+        with self._lock:
+            image = self._items.get(public_id)
+            if image is not None:
+                self._items.move_to_end(public_id)
+            return image
+
+    def put(self, public_id, image):
+        with self._lock:
+            self._items[public_id] = image
+            self._items.move_to_end(public_id)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def discard(self, public_id):
+        with self._lock:
+            self._items.pop(public_id, None)
+
+@st.cache_resource
+def get_thumbnail_cache():
+    return ThumbnailCache()
+
+@st.cache_resource
+def get_http_session():
+    """Keep-alive connections to the CDN, shared by every session and fetch thread"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=FETCH_WORKERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+@st.cache_resource
+def get_fetch_pool():
+    return ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="thumbnail-fetch")
+
+@st.cache_data(ttl=LISTING_TTL, show_spinner=False)
+def list_snapshot_page(cursor=None, label=None, since=None, until=None):
+    """One page of uploaded snapshots from the catalog, newest first, and the cursor of the next page"""
+    rows, next_cursor = get_catalog().page_after(
+        cursor,
+        per_page=GALLERY_PAGE_SIZE,
+        label=label,
+        since=since,
+        until=until,
+        upload_status=UPLOAD_DONE,
+        extensions=IMAGE_EXTENSIONS
+    )
+    
+    return [(
+        row['remote_url'],
+        row['timestamp'].replace(' ', 'T') + 'Z',
+        datetime.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S'),
+        row['public_id'],
+        row['filepath']
+    ) for row in rows], next_cursor
+
+def fetch_snapshot_page(cursor=None, label=None, since=None, until=None):
+    """A gallery page from a listing cached for LISTING_TTL seconds, ([], None) on error"""
     try:
-        resources = cloudinary.api.resources(
-            type="upload",
-            prefix="surveillance_",
-            max_results=12,
-            sort_by="created_at",
-            direction="desc"
-        )
-        
-        sorted_resources = sorted(
-            resources['resources'],
-            key=lambda x: datetime.strptime(x['created_at'], '%Y-%m-%dT%H:%M:%SZ'),
-            reverse=True
-        )
-        
-        return [(
-            res['secure_url'],
-            res['created_at'],
-            datetime.strptime(res['created_at'], '%Y-%m-%dT%H:%M:%SZ'),
-            res['public_id']
-        ) for res in sorted_resources]
+        return list_snapshot_page(cursor, label, since, until)
     except Exception as e:
         st.error(f"Error fetching images: {str(e)}")
-        return []
+        return [], None
 
 def get_resized_image(image_url):
+    """Download a full-size image and letterbox it to the tile size, raises on failure"""
+    response = get_http_session().get(image_url, timeout=FETCH_TIMEOUT)
+    response.raise_for_status()
+    img = Image.open(BytesIO(response.content))
+    img.thumbnail((STANDARD_WIDTH, STANDARD_HEIGHT), Image.Resampling.LANCZOS)
+    new_img = Image.new("RGB", (STANDARD_WIDTH, STANDARD_HEIGHT), "white")
+    paste_x = (STANDARD_WIDTH - img.width) // 2
+    paste_y = (STANDARD_HEIGHT - img.height) // 2
+    new_img.paste(img, (paste_x, paste_y))
+    return new_img
+
+def get_thumbnail(public_id, image_url):
+    """The 400x300 derivative uploaded with the snapshot, resized from the original if there is none"""
+    thumb_url = cloudinary.utils.cloudinary_url(
+        thumbnail_public_id(public_id, (STANDARD_WIDTH, STANDARD_HEIGHT)), secure=True, format="jpg")[0]
     try:
-        response = requests.get(image_url)
-        img = Image.open(BytesIO(response.content))
-        img.thumbnail((STANDARD_WIDTH, STANDARD_HEIGHT), Image.Resampling.LANCZOS)
-        new_img = Image.new("RGB", (STANDARD_WIDTH, STANDARD_HEIGHT), "white")
-        paste_x = (STANDARD_WIDTH - img.width) // 2
-        paste_y = (STANDARD_HEIGHT - img.height) // 2
-        new_img.paste(img, (paste_x, paste_y))
-        return new_img
-    except Exception as e:
-        st.error(f"Error processing image: {str(e)}")
-        return None
+        response = get_http_session().get(thumb_url, timeout=FETCH_TIMEOUT)
+        if response.status_code == 200:
+            img = Image.open(BytesIO(response.content))
+            img.load()
+            return img
+    except requests.RequestException:
+        pass
+    # Snapshots uploaded before thumbnails existed
+    return get_resized_image(image_url)
+
+def load_thumbnails(images):
+    """Tiles for gallery entries by public_id, fetching the missing ones concurrently"""
+    cache = get_thumbnail_cache()
+    tiles = {}
+    futures = {}
+    for img_url, _, _, public_id, _ in images:
+        tile = cache.get(public_id)
+        if tile is not None:
+            tiles[public_id] = tile
+        elif public_id not in tiles:
+            futures[cache.fetch(public_id, img_url, get_fetch_pool())] = public_id
+
+    for future in as_completed(futures):
+        public_id = futures[future]
+        try:
+            tiles[public_id] = future.result()
+        except Exception as e:
+            st.error(f"Error processing image: {str(e)}")
+    return tiles
+
+def prefetch_thumbnails(images):
+    """Start fetching the tiles of a page in the background so opening it is instant"""
+    cache = get_thumbnail_cache()
+    for img_url, _, _, public_id, _ in images:
+        if cache.get(public_id) is None:
+            cache.fetch(public_id, img_url, get_fetch_pool())
+
+def gallery_filters():
+    """(label, since, until) chosen above the snapshot grid"""
+    filter_col1, filter_col2 = st.columns(2)
+    with filter_col1:
+        label = st.selectbox("Label", ["All"] + get_catalog().labels())
+    with filter_col2:
+        dates = st.date_input("Date range", value=())
+    since = until = None
+    if dates:
+        since = datetime.combine(dates[0], datetime.min.time())
+        until = datetime.combine(dates[-1], datetime.min.time()) + timedelta(days=1)
+    return (None if label == "All" else label), since, until
 
 # Navigation
 page = st.sidebar.radio("Navigation", ["Home", "Surveillance Dashboard"])
@@ -352,8 +490,7 @@ else:  # Surveillance Dashboard
             st.rerun()
     with col2:
         if st.button('🗑️ Clear Alerts', use_container_width=True):
-            if os.path.exists("alerts.json"):
-                os.remove("alerts.json")
+            get_alert_store().clear()
             st.success("Alerts cleared successfully!")
             st.rerun()
 
@@ -362,40 +499,48 @@ else:  # Surveillance Dashboard
     
     with col1:
         st.markdown("### 📹 Live Camera Feed")
-        latest_images = fetch_latest_images()
-        if latest_images:
-            latest_img = get_resized_image(latest_images[0][0])
+        latest = fetch_snapshot_page()[0][:1]
+        if latest:
+            latest_img = load_thumbnails(latest).get(latest[0][3])
             if latest_img:
                 st.image(latest_img, use_container_width=True)
-                st.markdown(f"**Last Updated:** {time_difference(latest_images[0][1])}")
+                st.markdown(f"**Last Updated:** {time_difference(latest[0][1])}")
         else:
             st.info("No camera feed available")
 
     with col2:
         st.markdown("### ⚠️ Recent Alerts")
-        if os.path.exists("alerts.json"):
-            with open("alerts.json", "r") as f:
-                alerts = json.load(f)
-                for alert in alerts[-5:]:  # Show last 5 alerts
-                    st.markdown(f"""
-                        <div class='alert-card'>
-                            <strong>{alert['timestamp']}</strong><br>
-                            {alert['message']}
-                        </div>
-                    """, unsafe_allow_html=True)
+        alerts = get_alert_store().last_n(5)  # Show last 5 alerts
+        if alerts:
+            for alert in alerts:
+                st.markdown(f"""
+                    <div class='alert-card'>
+                        <strong>{alert['timestamp']}</strong><br>
+                        {alert['message']}
+                    </div>
+                """, unsafe_allow_html=True)
         else:
             st.info("No alerts available")
 
-    # Snapshots Grid
+    # Snapshots Grid, one page at a time
     st.markdown("### 📸 Recent Snapshots")
-    images = fetch_latest_images()
-    
+    filters = gallery_filters()
+    # Cursors of the pages visited so far, the last one is on screen
+    if st.session_state.get("gallery_filters") != filters:
+        st.session_state.gallery_filters = filters
+        st.session_state.gallery_cursors = [None]
+    cursors = st.session_state.gallery_cursors
+    images, next_cursor = fetch_snapshot_page(cursors[-1], *filters)
+    tiles = load_thumbnails(images)
+    if next_cursor:
+        prefetch_thumbnails(fetch_snapshot_page(next_cursor, *filters)[0])
+
     if images:
         cols = st.columns(3)
-        for i, (img_url, created_at, timestamp, public_id) in enumerate(images):
+        for i, (img_url, created_at, timestamp, public_id, filepath) in enumerate(images):
             with cols[i % 3]:
                 with st.container():
-                    resized_img = get_resized_image(img_url)
+                    resized_img = tiles.get(public_id)
                     if resized_img:
                         st.image(resized_img, use_container_width=True)
                     
@@ -410,10 +555,22 @@ else:  # Surveillance Dashboard
                     """, unsafe_allow_html=True)
                     
                     if st.button("🗑️ Delete", key=f"delete_{public_id}", use_container_width=True):
-                        delete_image(public_id)
+                        delete_image(public_id, filepath)
                     
                     st.markdown("---")
     else:
         st.info("No snapshots available")
 
+    nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+    with nav_col1:
+        if len(cursors) > 1 and st.button("⬅️ Newer", use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with nav_col2:
+        st.markdown(f"<div style='text-align: center;'>Page {len(cursors)}</div>", unsafe_allow_html=True)
+    with nav_col3:
+        if next_cursor and st.button("Older ➡️", use_container_width=True):
+            cursors.append(next_cursor)
+            st.rerun()
+
     st.text(f"Last updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -0,0 +1,65 @@
+import argparse
+import time
+import numpy as np
+
+from face_index import BruteForceIndex, IVFIndex
+
+ENCODING_SIZE = 128
+SAMPLES_PER_IDENTITY = 10
+
+def make_synthetic_gallery(size, seed=0):
+    """Synthetic 128-d encodings grouped into identities, roughly like a real enrollment gallery"""
+    rng = np.random.default_rng(seed)
+    n_identities = max(1, size // SAMPLES_PER_IDENTITY)
+    centers = rng.normal(0, 0.1, (n_identities, ENCODING_SIZE)).astype(np.float32)
+    labels = rng.integers(0, n_identities, size)
+    encodings = centers[labels] + rng.normal(0, 0.03, (size, ENCODING_SIZE)).astype(np.float32)
+    return encodings.astype(np.float32)
+
+def make_queries(encodings, n_queries, seed=1):
+    """Noisy copies of gallery entries, like new frames of enrolled people"""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(encodings), n_queries)
+    return (encodings[picks] + rng.normal(0, 0.03, (n_queries, ENCODING_SIZE))).astype(np.float32)
+
+def time_search(index, queries):
+    """Search one query at a time, like the per-frame matcher, and return results plus latencies in ms"""
+    indices = np.empty(len(queries), dtype=np.int64)
+    latencies = np.empty(len(queries))
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        result, _ = index.search(query[None, :])
+        latencies[i] = (time.perf_counter() - start) * 1000
+        indices[i] = result[0]
+    return indices, latencies
+
+def benchmark(size, n_queries, n_probe):
+    encodings = make_synthetic_gallery(size)
+    queries = make_queries(encodings, n_queries)
+
+    exact = BruteForceIndex(encodings)
+    start = time.perf_counter()
+    ivf = IVFIndex(encodings, n_probe=n_probe)
+    build_time = time.perf_counter() - start
+
+    exact_indices, exact_latencies = time_search(exact, queries)
+    ivf_indices, ivf_latencies = time_search(ivf, queries)
+    recall = np.mean(exact_indices == ivf_indices)
+
+    print(f"\n📊 {size:,} encodings, {n_queries} queries")
+    print(f"   brute_force: mean {exact_latencies.mean():.3f} ms, p95 {np.percentile(exact_latencies, 95):.3f} ms")
+    print(f"   ivf ({ivf.n_lists} lists, probe {ivf.n_probe}): mean {ivf_latencies.mean():.3f} ms, "
+          f"p95 {np.percentile(ivf_latencies, 95):.3f} ms, recall@1 {recall:.3f}, build {build_time:.2f} s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark face matching indexes on synthetic encodings")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--probe", type=int, default=8)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        benchmark(size, args.queries, args.probe)
+
+if __name__ == "__main__":
+    main()
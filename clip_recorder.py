@@ -0,0 +1,164 @@
+import collections
+import logging
+import queue
+import threading
+import cv2
+import numpy as np
+
+from metrics import REGISTRY
+from snapshot_service import get_snapshot_service
+
+logger = logging.getLogger(__name__)
+
+CLIP_PRE_SECONDS = 5.0
+CLIP_POST_SECONDS = 5.0
+# Upper bound for the compressed frames kept in the ring buffer
+CLIP_MEMORY_BUDGET = 32 * 1024 * 1024
+CLIP_SCALE = 0.5
+CLIP_JPEG_QUALITY = 80
+CLIP_CODEC = "mp4v"
+CLIP_EXTENSION = "mp4"
+DEFAULT_CLIP_FPS = 10.0
+
+class _Clip:
+    def __init__(self, path, label, start, end):
+        self.path = path
+        self.label = label
+        self.start = start
+        self.end = end
+        self.frames = []
+
+class ClipRecorder:
+    """Keeps the last seconds of a camera as JPEG-compressed frames and writes clips around events.
+
+    add() hands a frame to the recorder thread without blocking, frames are
+    dropped rather than queued when it falls behind. trigger() returns the
+    clip path at once. The clip covers pre_seconds before and post_seconds
+    after the event and is written through the snapshot service, so it is
+    stored, registered and uploaded like a snapshot.
+    """
+
+    def __init__(self, service=None, camera=None, pre_seconds=CLIP_PRE_SECONDS, post_seconds=CLIP_POST_SECONDS,
+                 memory_budget=CLIP_MEMORY_BUDGET, scale=CLIP_SCALE, quality=CLIP_JPEG_QUALITY,
+                 codec=CLIP_CODEC, extension=CLIP_EXTENSION):
+        self.service = service or get_snapshot_service()
+        self.camera = camera
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.memory_budget = memory_budget
+        self.scale = scale
+        self.quality = quality
+        self.codec = codec
+        self.extension = extension
+        self.ring = collections.deque()
+        self.memory_bytes = 0
+        self._frames = queue.Queue(maxsize=8)
+        self._triggers = []
+        self._clips = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        REGISTRY.gauge("clip_buffer_bytes", "Memory held by the clip ring buffer", read=lambda: self.memory_bytes)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="clip-recorder", daemon=True)
+        self._thread.start()
+        return self
+
+    def add(self, frame, timestamp):
+        try:
+            self._frames.put_nowait((frame, timestamp))
+        except queue.Full:
+            pass
+
+    def trigger(self, label):
+        """Start a clip around the latest frame and return the path it will be written to"""
+        path = self.service.reserve_path(label, self.extension, camera=self.camera)
+        with self._lock:
+            self._triggers.append((path, label))
+        return path
+
+    def _compress(self, frame):
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return encoded.tobytes() if ok else None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                frame, timestamp = self._frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            # The pipeline can hand back a detected frame after a newer one that skipped detection
+            if self.ring and timestamp <= self.ring[-1][0]:
+                continue
+            data = self._compress(frame)
+            if data is None:
+                continue
+            self._append(timestamp, data)
+            self._start_clips(timestamp)
+            self._extend_clips(timestamp, data)
+
+        for clip in self._clips:
+            self._write(clip)
+        self._clips = []
+
+    def _append(self, timestamp, data):
+        self.ring.append((timestamp, data))
+        self.memory_bytes += len(data)
+        # Drop frames that are too old for any future clip, or that exceed the budget
+        while self.ring and (self.memory_bytes > self.memory_budget
+                             or self.ring[0][0] < timestamp - self.pre_seconds):
+            _, old = self.ring.popleft()
+            self.memory_bytes -= len(old)
+
+    def _start_clips(self, timestamp):
+        with self._lock:
+            triggers, self._triggers = self._triggers, []
+        for path, label in triggers:
+            clip = _Clip(path, label, timestamp - self.pre_seconds, timestamp + self.post_seconds)
+            # The ring already holds the current frame, _extend_clips adds the ones after it
+            clip.frames = [(ts, data) for ts, data in self.ring if ts >= clip.start]
+            self._clips.append(clip)
+
+    def _extend_clips(self, timestamp, data):
+        active = []
+        for clip in self._clips:
+            if timestamp > clip.end:
+                self._write(clip)
+                continue
+            if not clip.frames or clip.frames[-1][0] < timestamp:
+                clip.frames.append((timestamp, data))
+            active.append(clip)
+        self._clips = active
+
+    def _write(self, clip):
+        if not clip.frames:
+            logger.warning(f"⚠️ No frames buffered for clip {clip.path}")
+            return
+        logger.info(f"🎬 Writing clip {clip.path} ({len(clip.frames)} frames)")
+        frames = clip.frames
+        self.service.write(clip.path, lambda tmp_path: self._encode_clip(frames, tmp_path),
+                           label=clip.label, camera=self.camera)
+
+    def _encode_clip(self, frames, tmp_path):
+        duration = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / duration if duration > 0 else DEFAULT_CLIP_FPS
+        first = cv2.imdecode(np.frombuffer(frames[0][1], np.uint8), cv2.IMREAD_COLOR)
+        height, width = first.shape[:2]
+        writer = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*self.codec), min(max(fps, 1.0), 60.0),
+                                 (width, height))
+        if not writer.isOpened():
+            raise IOError(f"Could not open a {self.codec} writer for {tmp_path}")
+        try:
+            for _, data in frames:
+                writer.write(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR))
+        finally:
+            writer.release()
+
+    def stop(self):
+        """Stop recording and write the clips that are still collecting frames"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,145 @@
+import json
+import logging
+import math
+import queue
+import socket
+import socketserver
+import threading
+
+CONTROL_HOST = "127.0.0.1"
+CONTROL_PORT = 5002
+
+logger = logging.getLogger(__name__)
+
+COMMANDS = ("status", "pause", "resume", "stop", "reload_faces", "set_threshold")
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+    """Reads one JSON command per line and answers with the resulting state"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.channel.apply(json.loads(line))
+            except (ValueError, KeyError, TypeError) as e:
+                reply = {"error": str(e)}
+            self.wfile.write((json.dumps(reply) + "\n").encode())
+
+class _CommandServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+class ControlChannel:
+    """In-memory surveillance state, updated by commands pushed to it.
+
+    Commands arrive as JSON like {"command": "pause"} or
+    {"command": "set_threshold", "value": 0.5}, either on a local TCP socket
+    (see send_command) or on a multiprocessing queue, so the capture loop only
+    ever reads a flag. {"command": "status"} only returns the state.
+    """
+
+    def __init__(self, host=CONTROL_HOST, port=CONTROL_PORT, command_queue=None, state=None):
+        self.host = host
+        self.port = port
+        self.command_queue = command_queue
+        self.running = True
+        self.paused = False
+        self.threshold = None
+        if state:
+            self.paused = state.get("paused", False)
+            self.threshold = state.get("threshold")
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._stop_event = threading.Event()
+
+    def on(self, command, handler):
+        """Call handler(message) after a command is applied, "*" matches every command"""
+        self._handlers.setdefault(command, []).append(handler)
+        return self
+
+    def state(self):
+        return {"running": self.running, "paused": self.paused, "threshold": self.threshold}
+
+    def apply(self, message):
+        """Apply one command message and return the new state, raises ValueError for invalid messages"""
+        if not isinstance(message, dict):
+            raise ValueError(f"Expected a JSON object, got {type(message).__name__}")
+        command = message.get("command")
+        if command not in COMMANDS:
+            raise ValueError(f"Unknown command: {command}")
+        if command == "set_threshold":
+            value = message.get("value")
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise ValueError(f"set_threshold needs a number, got {value!r}")
+            value = float(value)
+            if not math.isfinite(value):
+                raise ValueError(f"set_threshold needs a finite number, got {value}")
+
+        with self._lock:
+            if command == "pause":
+                self.paused = True
+            elif command == "resume":
+                self.paused = False
+            elif command == "stop":
+                self.running = False
+            elif command == "set_threshold":
+                self.threshold = value
+            state = self.state()
+
+        for handler in self._handlers.get(command, []) + self._handlers.get("*", []):
+            try:
+                handler(message)
+            except Exception as e:
+                logger.error(f"❌ Error handling control command {command}: {str(e)}")
+        return state
+
+    def start(self):
+        if self.port is not None:
+            try:
+                self._server = _CommandServer((self.host, self.port), _CommandHandler)
+            except OSError as e:
+                logger.warning(f"⚠️ Control channel could not listen on {self.host}:{self.port}: {str(e)}")
+            else:
+                self._server.channel = self
+                threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        if self.command_queue is not None:
+            threading.Thread(target=self._read_queue, daemon=True).start()
+        return self
+
+    def _read_queue(self):
+        while not self._stop_event.is_set():
+            try:
+                message = self.command_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.apply(message)
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"⚠️ Ignoring invalid control command {message}: {str(e)}")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+def send_command(command, value=None, host=CONTROL_HOST, port=CONTROL_PORT, timeout=2.0):
+    """Push a command to a running ControlChannel and return its new state"""
+    message = {"command": command}
+    if value is not None:
+        message["value"] = value
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall((json.dumps(message) + "\n").encode())
+        sock.shutdown(socket.SHUT_WR)
+        reply = sock.makefile("r").readline()
+    return json.loads(reply)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Send a command to the running surveillance system")
+    parser.add_argument("command", choices=COMMANDS)
+    parser.add_argument("value", nargs="?", help="New matching tolerance for set_threshold")
+    args = parser.parse_args()
+    print(send_command(args.command, args.value))
@@ -1,37 +1,285 @@
+import atexit
+import logging
+import os
+import queue
 import sqlite3
+import threading
+from datetime import timezone
+
+from stats_service import get_stats, SNAPSHOTS, SNAPSHOT_EXTENSIONS
+
+logger = logging.getLogger(__name__)
 
 DB_FILE = "snapshots.db"
 
-def init_db():
+# Queued writes are committed together, at most this many or this often
+WRITE_BATCH_SIZE = 100
+WRITE_INTERVAL = 0.25
+
+PAGE_SIZE = 12
+
+UPLOAD_PENDING = "pending"
+UPLOAD_DONE = "uploaded"
+UPLOAD_FAILED = "failed"
+# Rows from before upload tracking, resume() leaves them alone
+UPLOAD_UNKNOWN = "unknown"
+
+COLUMNS = ("id", "filepath", "timestamp", "label", "camera", "size", "upload_status", "remote_url", "public_id")
+
+# Columns added after the first release, older databases get them on open
+_NEW_COLUMNS = {
+    "label": "TEXT",
+    "camera": "TEXT",
+    "size": "INTEGER",
+    "upload_status": f"TEXT DEFAULT '{UPLOAD_PENDING}'",
+    "remote_url": "TEXT",
+    "public_id": "TEXT",
+}
+
+def _utc_text(value):
+    """Datetimes as the UTC text CURRENT_TIMESTAMP stores, strings are passed through"""
+    if hasattr(value, "astimezone"):
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+def init_db(conn):
     """Database initialize karta hai."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("""
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS snapshots (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             filepath TEXT NOT NULL,
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     """)
-    conn.commit()
-    conn.close()
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(snapshots)")}
+    for column, definition in _NEW_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE snapshots ADD COLUMN {column} {definition}")
+            if column == "upload_status":
+                # The column default would mark every old snapshot as waiting to be uploaded again
+                conn.execute("UPDATE snapshots SET upload_status = ?", (UPLOAD_UNKNOWN,))
+    for column in ("timestamp", "label", "camera", "filepath", "upload_status"):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS snapshots_{column} ON snapshots ({column})")
+
+class SnapshotCatalog:
+    """Catalog of every snapshot and clip on disk and its upload state.
+
+    Each thread reads through its own long-lived WAL connection. Writes go
+    through a queue to one writer thread that commits them in batches, in
+    the order they were made, so an upload update never overtakes the
+    insert it refers to. flush() waits for queued writes and reports
+    whether any were lost. Images added and deleted are also counted in
+    stats, if given, for the dashboard summary, once their writes commit.
+    """
+
+    def __init__(self, path=DB_FILE, batch_size=WRITE_BATCH_SIZE, write_interval=WRITE_INTERVAL, stats=None):
+        self.path = path
+        self.stats = stats
+        self.batch_size = batch_size
+        self.write_interval = write_interval
+        self._local = threading.local()
+        self._writes = queue.Queue()
+        self.lost_writes = 0
+        init_db(self.connection())
+        self._writer = threading.Thread(target=self._write_loop, name="snapshot-catalog", daemon=True)
+        self._writer.start()
+
+    def connection(self):
+        """This thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _write_loop(self):
+        while True:
+            batch = [self._writes.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._writes.get(timeout=self.write_interval))
+            except queue.Empty:
+                pass
+
+            done = [item for item in batch if isinstance(item, threading.Event)]
+            statements = [item for item in batch if not isinstance(item, threading.Event)]
+            lost = len(statements)
+            try:
+                lost = self._commit(statements)
+            except Exception as e:
+                logger.exception(f"❌ Error writing catalog updates: {str(e)}")
+            finally:
+                # Waiters are released whatever happened, flush() tells them if writes were lost
+                self.lost_writes += lost
+                for event in done:
+                    event.set()
+
+    def _commit(self, statements):
+        """Commit statements in one transaction, or one by one if that fails, returns how many were lost"""
+        conn = self.connection()
+        try:
+            conn.execute("BEGIN")
+            counted = sum(sign * conn.execute(sql, params).rowcount for sql, params, sign in statements)
+            conn.execute("COMMIT")
+            self._count_snapshots(counted)
+            return 0
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Catalog batch failed ({str(e)}), writing it one statement at a time")
+        try:
+            conn.execute("ROLLBACK")
+        except sqlite3.Error as e:
+            # Nothing to roll back when BEGIN itself failed, e.g. with "database is locked"
+            if conn.in_transaction:
+                logger.error(f"❌ Could not roll back catalog batch, dropping {len(statements)} writes: {str(e)}")
+                # Closing rolls back, the next batch gets a fresh connection
+                self._local.conn = None
+                conn.close()
+                return len(statements)
+
+        # Retry one by one so a single bad write does not lose the whole batch
+        lost, counted = 0, 0
+        for sql, params, sign in statements:
+            try:
+                counted += sign * conn.execute(sql, params).rowcount
+            except sqlite3.Error as e:
+                logger.error(f"❌ Error writing catalog update: {str(e)}")
+                lost += 1
+        self._count_snapshots(counted)
+        return lost
+
+    def _count_snapshots(self, amount):
+        if self.stats and amount:
+            self.stats.adjust(SNAPSHOTS, amount)
+
+    def _write(self, sql, params, sign=0):
+        """Queue a write, the rows it affects are added to the snapshot count times sign once it commits"""
+        self._writes.put((sql, params, sign))
+
+    def flush(self, timeout=None):
+        """Wait until every queued write is committed, returns False on timeout or if a write was lost"""
+        lost_before = self.lost_writes
+        done = threading.Event()
+        self._writes.put(done)
+        return done.wait(timeout) and self.lost_writes == lost_before
+
+    def add(self, filepath, label=None, camera=None, size=None):
+        if size is None and os.path.exists(filepath):
+            size = os.path.getsize(filepath)
+        self._write("INSERT INTO snapshots (filepath, label, camera, size, upload_status) VALUES (?, ?, ?, ?, ?)",
+                    (filepath, label, camera, size, UPLOAD_PENDING), sign=self._snapshot_sign(filepath))
+
+    def set_upload_status(self, filepath, status, remote_url=None, public_id=None):
+        self._write("UPDATE snapshots SET upload_status = ?, remote_url = COALESCE(?, remote_url), "
+                    "public_id = COALESCE(?, public_id) WHERE filepath = ?",
+                    (status, remote_url, public_id, filepath))
+
+    def delete(self, filepath):
+        self._write("DELETE FROM snapshots WHERE filepath = ?", (filepath,), sign=-self._snapshot_sign(filepath))
+
+    @staticmethod
+    def _snapshot_sign(filepath):
+        return 1 if filepath.lower().endswith(SNAPSHOT_EXTENSIONS) else 0
+
+    def _where(self, label=None, camera=None, since=None, until=None, upload_status=None, extensions=None):
+        clauses, params = [], []
+        for column, value in (("label", label), ("camera", camera), ("upload_status", upload_status)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if extensions:
+            clauses.append("(" + " OR ".join("filepath LIKE ?" for _ in extensions) + ")")
+            params.extend(f"%{extension}" for extension in extensions)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(_utc_text(since))
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(_utc_text(until))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def page(self, page=1, per_page=PAGE_SIZE, **filters):
+        """One page of snapshots, newest first, filtered by label, camera, since, until, upload_status or extensions"""
+        where, params = self._where(**filters)
+        rows = self.connection().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM snapshots{where} ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+            params + [per_page, (page - 1) * per_page]).fetchall()
+        return [dict(row) for row in rows]
+
+    def page_after(self, cursor=None, per_page=PAGE_SIZE, **filters):
+        """One page of snapshots, newest first, starting after cursor, returns (rows, next_cursor).
+
+        The cursor is the (timestamp, id) of the last row of the previous
+        page and next_cursor is None on the last page. Unlike page() the
+        query walks the timestamp index from the cursor, so a page a week
+        back costs the same as the first one.
+        """
+        where, params = self._where(**filters)
+        if cursor is not None:
+            where += (" AND" if where else " WHERE") + " (timestamp, id) < (?, ?)"
+            params += list(cursor)
+        rows = self.connection().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM snapshots{where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+            params + [per_page + 1]).fetchall()
+        rows = [dict(row) for row in rows]
+        if len(rows) <= per_page:
+            return rows, None
+        rows = rows[:per_page]
+        return rows, (rows[-1]["timestamp"], rows[-1]["id"])
+
+    def labels(self):
+        """Every label in the catalog, for filter choices"""
+        rows = self.connection().execute("SELECT DISTINCT label FROM snapshots WHERE label IS NOT NULL "
+                                         "ORDER BY label").fetchall()
+        return [row[0] for row in rows]
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        return self.connection().execute(f"SELECT COUNT(*) FROM snapshots{where}", params).fetchone()[0]
+
+    def latest(self, **filters):
+        rows = self.page(1, 1, **filters)
+        return rows[0] if rows else None
+
+    def iter_rows(self, batch_size=500, **filters):
+        """Every matching row, oldest first, read in batches"""
+        where, params = self._where(**filters)
+        where = where + (" AND" if where else " WHERE") + " id > ?"
+        last_id = 0
+        while True:
+            rows = self.connection().execute(
+                f"SELECT {', '.join(COLUMNS)} FROM snapshots{where} ORDER BY id LIMIT ?",
+                params + [last_id, batch_size]).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            last_id = rows[-1]["id"]
+
+    def get(self, filepath):
+        row = self.connection().execute(f"SELECT {', '.join(COLUMNS)} FROM snapshots WHERE filepath = ? "
+                                        "ORDER BY id DESC LIMIT 1", (filepath,)).fetchone()
+        return dict(row) if row else None
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_catalog():
+    """The process-wide snapshot catalog, opened on first use"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = SnapshotCatalog(stats=get_stats())
+            atexit.register(_catalog.flush, 5.0)
+        return _catalog
 
-def save_snapshot(filepath):
+def save_snapshot(filepath, label=None, camera=None, size=None):
     """Snapshot ka path database me store karta hai."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO snapshots (filepath) VALUES (?)", (filepath,))
-    conn.commit()
-    conn.close()
+    get_catalog().add(filepath, label=label, camera=camera, size=size)
 
 def get_latest_snapshot():
     """Database se latest snapshot ka path fetch karta hai."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT filepath FROM snapshots ORDER BY timestamp DESC LIMIT 1")
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else None
-
-# Initialize DB
-init_db()
+    latest = get_catalog().latest()
+    return latest["filepath"] if latest else None
@@ -1,92 +1,239 @@
+import argparse
 import face_recognition
 import cv2
+import hashlib
 import numpy as np
 import os
-import pickle
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 import time
 
+from face_detection import ENCODING_SIZE, GALLERY_FILE, LABELS_FILE, load_gallery_labels, save_gallery
+from face_index import BruteForceIndex, build_index, save_index, INDEX_FILE
+
 # Define directories
 KNOWN_FACES_DIR = "dataset/known_faces"
 AUGMENTED_FACES_DIR = "augmented_faces"
 MODELS_DIR = "models"
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Encodings of every image by content hash, only valid for the same detection settings
+CACHE_FILE = os.path.join(MODELS_DIR, "encoding_cache.npz")
+FACE_MODEL = "hog"
+UPSAMPLE_TIMES = 1
+ENCODING_SETTINGS = f"{FACE_MODEL}-upsample{UPSAMPLE_TIMES}-{ENCODING_SIZE}"
+
+# Images are sent to the worker processes in chunks, and only a few chunks
+# per worker are in flight so finished encodings never pile up in memory
+ENCODE_WORKERS = os.cpu_count() or 1
+CHUNK_SIZE = 8
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
 
 # Create models directory if it doesn't exist
 os.makedirs(MODELS_DIR, exist_ok=True)
 
-def process_single_image(image_path, label_prefix=""):
-    """Process a single image and extract face encodings"""
+def encode_image(image_path, label_prefix=""):
+    """Extract the face encodings of one image, returns (encodings, label, warning).
+
+    Runs in the worker processes, so problems are returned as a warning
+    instead of printed or raised, one bad image never stops the run.
+    encodings is empty if there is no face and None if the image failed.
+    """
+    name = os.path.basename(image_path)
     try:
         # Load image
         image = cv2.imread(image_path)
         
         if image is None:
-            print(f"⚠️ Could not load image: {os.path.basename(image_path)}")
-            return None, None
+            return None, None, f"Could not load image: {name}"
             
         # Convert BGR to RGB
         image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         
         # Find face locations with a smaller upsample factor
-        face_locations = face_recognition.face_locations(image, model="hog", number_of_times_to_upsample=1)
+        face_locations = face_recognition.face_locations(image, model=FACE_MODEL,
+                                                         number_of_times_to_upsample=UPSAMPLE_TIMES)
+        
+        # Get label from filename (remove extension)
+        label = os.path.splitext(name)[0]
+        if label_prefix:
+            label = label_prefix + label
         
         if not face_locations:
-            print(f"⚠️ No face found in: {os.path.basename(image_path)}")
-            return None, None
+            return [], label, f"No face found in: {name}"
         
         # Get face encodings
         encodings = face_recognition.face_encodings(image, face_locations)
         
-        # Get label from filename (remove extension)
-        label = os.path.splitext(os.path.basename(image_path))[0]
-        if label_prefix:
-            label = label_prefix + label
-        
-        return encodings, label
+        return encodings, label, None
                 
     except Exception as e:
-        print(f"⚠️ Error processing {os.path.basename(image_path)}: {str(e)}")
-        return None, None
+        return None, None, f"Error processing {name}: {str(e)}"
+
+def process_single_image(image_path, label_prefix=""):
+    """Process a single image and extract face encodings"""
+    encodings, label, warning = encode_image(image_path, label_prefix)
+    if warning:
+        print(f"⚠️ {warning}")
+    return encodings, label
+
+def file_digest(path):
+    """SHA-1 of a file's content"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-def process_images(directory, label_prefix=""):
-    """Process images in the given directory and extract face encodings"""
+class EncodingCache:
+    """Face encodings of every image seen so far, keyed by content hash.
+
+    Images that did not change since the last run are not encoded again,
+    including those without a face. save() drops the entries of images
+    that were not looked up this run, i.e. were removed from the dataset,
+    and leaves the file alone when nothing was added or dropped. The cache
+    is thrown away when ENCODING_SETTINGS change.
+    """
+
+    def __init__(self, path=CACHE_FILE, settings=ENCODING_SETTINGS):
+        self.path = path
+        self.settings = settings
+        self.entries = {}
+        self.used = set()
+        self.added = 0
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["settings"]) != self.settings:
+                    print("🔄 Encoding settings changed, encoding every image again")
+                    return
+                offsets = np.concatenate([[0], np.cumsum(data["counts"])])
+                encodings = data["encodings"]
+                for i, digest in enumerate(data["digests"]):
+                    self.entries[str(digest)] = encodings[offsets[i]:offsets[i + 1]]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Ignoring unreadable encoding cache {self.path}: {str(e)}")
+            self.entries = {}
+
+    def get(self, digest):
+        encodings = self.entries.get(digest)
+        if encodings is not None:
+            self.used.add(digest)
+        return encodings
+
+    def put(self, digest, encodings):
+        self.entries[digest] = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        self.used.add(digest)
+        self.added += 1
+
+    def save(self):
+        """Write the cache if this run added or dropped entries, returns whether it did"""
+        digests = sorted(self.used)
+        pruned = len(self.entries) - len(digests)
+        if not self.added and not pruned:
+            return False
+        if pruned:
+            print(f"🧹 Pruned {pruned} removed images from the encoding cache")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(tmp_path,
+                 settings=np.array(self.settings),
+                 digests=np.array(digests, dtype=str),
+                 counts=np.array([len(self.entries[d]) for d in digests], dtype=np.int64),
+                 encodings=np.concatenate([self.entries[d] for d in digests]) if digests
+                 else np.empty((0, ENCODING_SIZE), dtype=np.float32))
+        os.replace(tmp_path, self.path)
+        return True
+
+def _encode_chunk(image_paths, label_prefix):
+    return [encode_image(image_path, label_prefix) for image_path in image_paths]
+
+def _init_worker():
+    # One OpenCV thread per process, the pool already uses every core
+    cv2.setNumThreads(1)
+
+def encode_in_order(image_paths, label_prefix="", workers=ENCODE_WORKERS, chunk_size=CHUNK_SIZE):
+    """Yield encode_image results for image_paths in their order, encoded on a process pool"""
+    chunks = [image_paths[i:i + chunk_size] for i in range(0, len(image_paths), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_encode_chunk, chunk, label_prefix))
+            # Wait for the oldest chunk once enough are queued, which keeps the output in order
+            if len(pending) >= workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def process_images(directory, label_prefix="", workers=ENCODE_WORKERS, cache=None):
+    """Process images in the given directory and extract face encodings.
+
+    Returns the encodings, their names and the content hash of every image,
+    only images missing from cache are encoded.
+    """
     print(f"\nProcessing images in {directory}...")
     
     # Initialize lists to store encodings and names
     all_encodings = []
     all_names = []
+    cache = cache if cache is not None else EncodingCache()
     
-    # Get list of image files
-    image_files = [f for f in os.listdir(directory) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    # Get list of image files, sorted so the gallery comes out the same every run
+    image_files = sorted(f for f in os.listdir(directory) if f.lower().endswith(IMAGE_EXTENSIONS))
+    image_paths = [os.path.join(directory, image_file) for image_file in image_files]
+    digests = [file_digest(image_path) for image_path in image_paths]
+    missing = [(image_path, digest) for image_path, digest in zip(image_paths, digests)
+               if cache.get(digest) is None]
+    print(f"📦 {len(image_paths) - len(missing)} images unchanged, {len(missing)} to encode")
     
-    # Process each image with progress bar
-    for image_file in tqdm(image_files, desc="Processing images"):
-        image_path = os.path.join(directory, image_file)
-        
-        # Process single image and wait for completion
-        encodings, label = process_single_image(image_path, label_prefix)
-        
-        if encodings and label:
-            # Add each encoding with the same label
-            for encoding in encodings:
-                all_encodings.append(encoding)
-                all_names.append(label)
-        
-        # Add a small delay between processing images
-        time.sleep(0.1)
+    # Process new and changed images on all cores with progress bar
+    started = time.time()
+    results = encode_in_order([image_path for image_path, _ in missing], label_prefix, workers=workers)
+    for (image_path, digest), (encodings, _, warning) in zip(missing, tqdm(results, total=len(missing),
+                                                                            desc="Processing images")):
+        if warning:
+            tqdm.write(f"⚠️ {warning}")
+        # Images without a face are remembered too, unreadable ones are tried again next time
+        if encodings is not None:
+            cache.put(digest, encodings)
+    elapsed = max(time.time() - started, 1e-9)
+    if missing:
+        print(f"⏱️ Encoded {len(missing)} images in {elapsed:.1f}s ({len(missing) / elapsed:.1f} images/sec)")
     
-    return all_encodings, all_names
+    # Add each encoding with the label of its image, in file order
+    for image_file, digest in zip(image_files, digests):
+        encodings = cache.get(digest)
+        if encodings is None:
+            continue
+        label = label_prefix + os.path.splitext(image_file)[0]
+        for encoding in encodings:
+            all_encodings.append(encoding)
+            all_names.append(label)
+    
+    return all_encodings, all_names, digests
 
 def main():
+    parser = argparse.ArgumentParser(description="Encode the known and augmented faces into the face gallery")
+    parser.add_argument("--workers", type=int, default=ENCODE_WORKERS, help="Encoding processes (default: all cores)")
+    args = parser.parse_args()
+
     print("🔄 Starting face encoding process...")
+    cache = EncodingCache()
     
     # Process known faces
     print("\nProcessing known faces...")
-    known_encodings, known_names = process_images(KNOWN_FACES_DIR)
+    known_encodings, known_names, known_digests = process_images(KNOWN_FACES_DIR, workers=args.workers,
+                                                                 cache=cache)
     
     # Process augmented faces
     print("\nProcessing augmented faces...")
-    aug_encodings, aug_names = process_images(AUGMENTED_FACES_DIR, label_prefix="AUG_")
+    aug_encodings, aug_names, aug_digests = process_images(AUGMENTED_FACES_DIR, label_prefix="AUG_",
+                                                           workers=args.workers, cache=cache)
+    cache.save()
     
     # Combine all encodings and names
     all_encodings = known_encodings + aug_encodings
@@ -96,18 +243,31 @@ def main():
         print("❌ No face encodings were found!")
         return
     
-    # Save encodings and names
-    data = {
-        "encodings": all_encodings,
-        "names": all_names
-    }
+    # Nothing to write if the same images were already encoded with the same labels
+    gallery_digest = hashlib.sha1("\n".join([ENCODING_SETTINGS] + known_digests + aug_digests +
+                                             all_names).encode()).hexdigest()
+    labels = load_gallery_labels()
+    if labels and labels.get("digest") == gallery_digest and os.path.exists(GALLERY_FILE):
+        print(f"\n✅ Gallery of {len(all_encodings)} faces is up to date")
+        return
+    
+    # Save encodings as one float32 matrix plus the label table
+    encodings = np.asarray(all_encodings, dtype=np.float32)
+    save_gallery(encodings, all_names, digest=gallery_digest)
     
-    output_path = os.path.join(MODELS_DIR, "face_encodings.pkl")
-    with open(output_path, "wb") as f:
-        pickle.dump(data, f)
+    # Build the nearest neighbour index used for matching
+    index = build_index(encodings)
+    if index.kind == BruteForceIndex.kind:
+        # Exact search is rebuilt from the memory-mapped gallery at startup, a saved copy would only be slower
+        if os.path.exists(INDEX_FILE):
+            os.remove(INDEX_FILE)
+    else:
+        save_index(index, INDEX_FILE, gallery_digest=gallery_digest)
     
     print(f"\n✅ Successfully processed {len(all_encodings)} faces")
-    print(f"📁 Saved encodings to: {output_path}")
+    print(f"📁 Saved encodings to: {GALLERY_FILE} and {LABELS_FILE}")
+    if index.kind != BruteForceIndex.kind:
+        print(f"🗂️ Saved {index.kind} index to: {INDEX_FILE}")
     print(f"👤 Unique labels: {set(all_names)}")
 
 if __name__ == "__main__":
@@ -1,12 +1,61 @@
 import cv2
 import face_recognition
 import numpy as np
+import logging
+import json
 import pickle
 import os
 
+from face_index import BruteForceIndex, build_index, load_index
+from motion_detection import merge_boxes
+
+logger = logging.getLogger(__name__)
+
+ENCODING_SIZE = 128
+
+# encode_faces.py writes the gallery as a float32 matrix plus a label table,
+# the pickle is what older versions wrote
+GALLERY_FILE = "models/face_gallery.npy"
+LABELS_FILE = "models/face_labels.json"
+ENCODINGS_FILE = "models/face_encodings.pkl"
+
+def save_gallery(encodings, names, digest=None, gallery_file=GALLERY_FILE, labels_file=LABELS_FILE):
+    """Write the gallery matrix and its labels, digest identifies the images it was built from"""
+    encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    os.makedirs(os.path.dirname(gallery_file), exist_ok=True)
+    tmp_gallery = gallery_file + ".tmp.npy"
+    np.save(tmp_gallery, encodings)
+    tmp_labels = labels_file + ".tmp"
+    with open(tmp_labels, "w") as f:
+        json.dump({"names": list(names), "digest": digest}, f)
+    os.replace(tmp_gallery, gallery_file)
+    os.replace(tmp_labels, labels_file)
+
+def load_gallery_labels(labels_file=LABELS_FILE):
+    """The label table written by save_gallery, None if there is none"""
+    try:
+        with open(labels_file, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
 def load_known_faces():
-    """Load known face encodings from file"""
-    ENCODINGS_FILE = "models/face_encodings.pkl"
+    """Load known face encodings as a float32 matrix plus a list of names.
+
+    The matrix is memory-mapped from GALLERY_FILE, so startup does not
+    depend on the gallery size. Galleries only saved as a pickle by older
+    versions are still read.
+    """
+    labels = load_gallery_labels()
+    if labels is not None and os.path.exists(GALLERY_FILE):
+        try:
+            known_face_encodings = np.load(GALLERY_FILE, mmap_mode="r")
+            if known_face_encodings.shape == (len(labels["names"]), ENCODING_SIZE):
+                return known_face_encodings, labels["names"]
+            logger.warning(f"⚠️ {GALLERY_FILE} does not match {LABELS_FILE}, run encode_faces.py again")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️ Could not load {GALLERY_FILE}: {str(e)}")
+
     known_face_encodings, known_face_names = [], []
     
     if os.path.exists(ENCODINGS_FILE):
@@ -15,10 +64,85 @@ def load_known_faces():
             known_face_encodings = data.get("encodings", [])
             known_face_names = data.get("names", [])
     else:
-        print("⚠️ Warning: No known faces found!")
+        logger.warning("⚠️ Warning: No known faces found!")
     
+    known_face_encodings = np.ascontiguousarray(known_face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
     return known_face_encodings, known_face_names
 
+class FaceGallery:
+    """Known face encodings stored as one contiguous matrix behind a nearest neighbour index"""
+
+    def __init__(self, encodings, names, index=None):
+        self.encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        self.names = list(names)
+        if index is None or len(index) != len(self.names):
+            index = BruteForceIndex(self.encodings)
+        self.index = index
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, face_encodings, tolerance=0.6):
+        """Return a (name, distance) pair per face, using the closest known face"""
+        if len(face_encodings) == 0:
+            return []
+        if len(self) == 0:
+            return [("unknown", float("inf")) for _ in range(len(face_encodings))]
+
+        best_indices, best_distances = self.index.search(face_encodings)
+
+        results = []
+        for index, distance in zip(best_indices, best_distances):
+            name = self.names[index] if index >= 0 and distance <= tolerance else "unknown"
+            results.append((name, float(distance)))
+        return results
+
+def load_face_gallery():
+    """Load known faces and their saved index (if any) into a FaceGallery.
+
+    An index saved for another gallery, even one of the same size, is
+    rebuilt from the loaded encodings instead of being used.
+    """
+    known_face_encodings, known_face_names = load_known_faces()
+    index = load_index()
+    labels = load_gallery_labels() or {}
+    if index is not None and getattr(index, "gallery_digest", None) != labels.get("digest"):
+        logger.warning(f"⚠️ Saved {index.kind} index was built for another gallery, rebuilding it "
+                       f"(run encode_faces.py to save a new one)")
+        index = build_index(known_face_encodings, kind=index.kind) if len(known_face_encodings) else None
+    return FaceGallery(known_face_encodings, known_face_names, index=index)
+
+def find_face_locations(rgb_frame, regions=None, scale=1.0, padding=40):
+    """Find faces at a reduced scale, optionally only inside (top, right, bottom, left) regions.
+
+    Regions are padded, merged where they overlap, and the returned locations
+    are mapped back to full-resolution frame coordinates.
+    """
+    height, width = rgb_frame.shape[:2]
+    if regions is None:
+        regions = [(0, width, height, 0)]
+    else:
+        regions = merge_boxes([
+            (max(0, top - padding), min(width, right + padding), min(height, bottom + padding), max(0, left - padding))
+            for top, right, bottom, left in regions
+        ])
+
+    face_locations = []
+    for region_top, region_right, region_bottom, region_left in regions:
+        crop = rgb_frame[region_top:region_bottom, region_left:region_right]
+        if crop.size == 0:
+            continue
+        if scale != 1.0:
+            crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        for top, right, bottom, left in face_recognition.face_locations(crop):
+            face_locations.append((
+                min(height, region_top + int(top / scale)),
+                min(width, region_left + int(right / scale)),
+                min(height, region_top + int(bottom / scale)),
+                max(0, region_left + int(left / scale)),
+            ))
+    return face_locations
+
 def get_lighting_thresholds(brightness):
     """Get thresholds based on lighting conditions"""
     if brightness < 30:  # Very dim
@@ -54,54 +178,98 @@ def get_lighting_thresholds(brightness):
             'tolerance': 0.5
         }
 
+# Brightness level boundaries used by get_lighting_thresholds, and its thresholds per level
+LIGHTING_LEVELS = np.array([30, 60, 120])
+_LEVEL_THRESHOLDS = [get_lighting_thresholds(brightness) for brightness in (0, 30, 60, 120)]
+_EDGE_THRESHOLDS = np.array([t['edge_density'] for t in _LEVEL_THRESHOLDS], dtype=np.float32)
+_VERTICAL_THRESHOLDS = np.array([t['vertical_density'] for t in _LEVEL_THRESHOLDS], dtype=np.float32)
+_COLOR_THRESHOLDS = np.array([t['color_std'] for t in _LEVEL_THRESHOLDS], dtype=np.float32)
+
+# A face passes the quality check when its score reaches this value
+QUALITY_THRESHOLD = 1.0
+
+def _box_sums(integral, boxes):
+    """Sums over (top, right, bottom, left) boxes, looked up in an integral image"""
+    top, right, bottom, left = boxes.T
+    return integral[bottom, right] - integral[top, right] - integral[bottom, left] + integral[top, left]
+
+def _patches_for(boxes):
+    """One patch covering every box when that is compact, otherwise one patch per box"""
+    union = (boxes[:, 0].min(), boxes[:, 1].max(), boxes[:, 2].max(), boxes[:, 3].min())
+    union_area = (union[1] - union[3]) * (union[2] - union[0])
+    box_area = ((boxes[:, 1] - boxes[:, 3]) * (boxes[:, 2] - boxes[:, 0])).sum()
+    if len(boxes) == 1 or union_area <= 2 * box_area:
+        return [(union, np.arange(len(boxes)))]
+    return [(tuple(box), np.array([i])) for i, box in enumerate(boxes)]
+
+def score_face_quality(face_locations, frame):
+    """Score every detected face of a BGR frame in one pass, higher is better.
+
+    A score is the smallest ratio of edge density, vertical gradient density
+    and colour spread to their lighting-dependent thresholds, so faces with a
+    score of QUALITY_THRESHOLD or more pass. Faces with an implausible size
+    score 0. Grayscale, Canny and an int16 Sobel run once per patch of the
+    frame, and per-face statistics are read from integral images.
+    """
+    scores = np.zeros(len(face_locations), dtype=np.float32)
+    if not face_locations:
+        return scores
+
+    height, width = frame.shape[:2]
+    boxes = np.array(face_locations, dtype=np.int64).reshape(-1, 4)
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, height)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, width)
+    areas = (boxes[:, 1] - boxes[:, 3]) * (boxes[:, 2] - boxes[:, 0])
+    face_ratios = areas / float(height * width)
+    valid = (areas > 0) & (face_ratios >= 0.0005) & (face_ratios <= 0.4)
+    if not valid.any():
+        return scores
+
+    valid_indices = np.flatnonzero(valid)
+    for (top, right, bottom, left), members in _patches_for(boxes[valid_indices]):
+        patch = frame[top:bottom, left:right]
+        gray = cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY)
+        edges = cv2.Canny(gray, 30, 100)
+        vertical = cv2.convertScaleAbs(cv2.Sobel(gray, cv2.CV_16S, 0, 1, ksize=3))
+
+        gray_integral = cv2.integral(gray)
+        edge_integral = cv2.integral((edges > 0).view(np.uint8))
+        vertical_integral = cv2.integral((vertical > 20).view(np.uint8))
+        # Colour statistics cover all three channels, so integrate the patch as (h, w * 3)
+        color_sum, color_sq_sum = cv2.integral2(np.ascontiguousarray(patch).reshape(patch.shape[0], -1))
+
+        indices = valid_indices[members]
+        local = boxes[indices] - np.array([top, left, top, left])
+        pixels = areas[indices].astype(np.float64)
+        brightness = _box_sums(gray_integral, local) / pixels
+        edge_density = _box_sums(edge_integral, local) / pixels
+        vertical_density = _box_sums(vertical_integral, local) / pixels
+
+        channel_boxes = local * np.array([1, 3, 1, 3])
+        color_mean = _box_sums(color_sum, channel_boxes) / (pixels * 3)
+        color_var = _box_sums(color_sq_sum, channel_boxes) / (pixels * 3) - color_mean ** 2
+        color_std = np.sqrt(np.maximum(color_var, 0.0))
+
+        levels = np.searchsorted(LIGHTING_LEVELS, brightness, side='right')
+        scores[indices] = np.minimum.reduce([
+            edge_density / _EDGE_THRESHOLDS[levels],
+            vertical_density / _VERTICAL_THRESHOLDS[levels],
+            color_std / _COLOR_THRESHOLDS[levels],
+        ])
+
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, index in enumerate(indices):
+                if scores[index] < QUALITY_THRESHOLD:
+                    logger.debug("Face quality check failed: edge=%.4f, vertical=%.4f, color=%.2f",
+                                 edge_density[i], vertical_density[i], color_std[i])
+    return scores
+
 def check_face_quality(face_location, frame):
     """Check if the detected face meets quality criteria"""
     try:
-        # Get face coordinates and dimensions
-        top, right, bottom, left = face_location
-        face_width = right - left
-        face_height = bottom - top
-        face_area = face_width * face_height
-        frame_area = frame.shape[0] * frame.shape[1]
-        face_ratio = face_area / frame_area
-        
-        # Check face size
-        if face_ratio < 0.0005 or face_ratio > 0.4:
-            print(f"Face size check failed: {face_ratio:.4f}")
-            return False
-            
-        # Extract and validate face region
-        face_region = frame[top:bottom, left:right]
-        if face_region.size == 0:
-            print("Invalid face region")
-            return False
-            
-        # Convert to grayscale for analysis
-        gray = cv2.cvtColor(face_region, cv2.COLOR_RGB2GRAY)
-        brightness = np.mean(gray)
-        thresholds = get_lighting_thresholds(brightness)
-        
-        # Calculate edge and vertical densities
-        edges = cv2.Canny(gray, 30, 100)
-        edge_density = np.sum(edges > 0) / edges.size
-        
-        vertical_edges = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
-        vertical_density = np.sum(np.abs(vertical_edges) > 20) / vertical_edges.size
-        
-        # Calculate color variation
-        color_std = np.std(face_region)
-        
-        # Check all criteria
-        if (edge_density < thresholds['edge_density'] or
-            vertical_density < thresholds['vertical_density'] or
-            color_std < thresholds['color_std']):
-            print(f"Face quality check failed: edge={edge_density:.4f}, vertical={vertical_density:.4f}, color={color_std:.2f}")
-            return False
-            
-        return True
-        
+        return bool(score_face_quality([face_location], frame)[0] >= QUALITY_THRESHOLD)
     except Exception as e:
-        print(f"Error in face quality check: {str(e)}")
+        logger.error(f"Error in face quality check: {str(e)}")
         return False
 
 def is_human_shape(face_location, frame):
@@ -148,13 +316,14 @@ def is_human_shape(face_location, frame):
                    (motion_density >= thresholds['motion_density'] or motion_density == 0))
         
         if not is_human:
-            print(f"Human shape check failed: edge={edge_density:.4f}, vertical={vertical_density:.4f}, motion={motion_density:.4f}")
+            logger.debug("Human shape check failed: edge=%.4f, vertical=%.4f, motion=%.4f",
+                         edge_density, vertical_density, motion_density)
             return False
             
         return True
         
     except Exception as e:
-        print(f"Error in human shape check: {str(e)}")
+        logger.error(f"Error in human shape check: {str(e)}")
         return False
 
 def get_face_recognition_tolerance(face_location, frame):
@@ -193,5 +362,5 @@ def get_face_recognition_tolerance(face_location, frame):
         return min(tolerance, 0.75)  # Cap maximum tolerance
         
     except Exception as e:
-        print(f"Error calculating tolerance: {str(e)}")
+        logger.error(f"Error calculating tolerance: {str(e)}")
         return 0.6  # Default tolerance 
\ No newline at end of file
@@ -0,0 +1,144 @@
+import os
+import pickle
+import numpy as np
+
+INDEX_FILE = "models/face_index.pkl"
+
+# Galleries smaller than this are matched exactly, larger ones get an IVF index
+AUTO_IVF_THRESHOLD = 5000
+
+def _sq_norms(matrix):
+    return np.einsum("ij,ij->i", matrix, matrix)
+
+def _pairwise_distances(queries, encodings, encoding_sq_norms):
+    """Euclidean distances between every query row and every encoding row"""
+    sq_distances = _sq_norms(queries)[:, None] + encoding_sq_norms[None, :] - 2.0 * (queries @ encodings.T)
+    return np.sqrt(np.maximum(sq_distances, 0.0))
+
+class BruteForceIndex:
+    """Exact nearest neighbour search over the whole gallery"""
+
+    kind = "brute_force"
+
+    def __init__(self, encodings):
+        self.encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+        self.sq_norms = _sq_norms(self.encodings)
+
+    def __len__(self):
+        return len(self.encodings)
+
+    def search(self, queries):
+        """Return (indices, distances) of the nearest gallery entry for each query"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.encodings.shape[1])
+        distances = _pairwise_distances(queries, self.encodings, self.sq_norms)
+        indices = np.argmin(distances, axis=1)
+        return indices, distances[np.arange(len(indices)), indices]
+
+class IVFIndex:
+    """Inverted file index: k-means clusters the gallery, queries only scan the closest clusters"""
+
+    kind = "ivf"
+
+    def __init__(self, encodings, n_lists=None, n_probe=8, iterations=10, max_training_points=20000, seed=0):
+        encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+        n_lists = n_lists or max(1, int(np.sqrt(len(encodings))))
+        self.n_lists = min(n_lists, len(encodings))
+        self.n_probe = min(n_probe, self.n_lists)
+        self.centroids = self._train(encodings, iterations, max_training_points, seed)
+        self.centroid_sq_norms = _sq_norms(self.centroids)
+
+        # Store encodings grouped by list so each list is one contiguous slice
+        assignments = self._assign(encodings)
+        order = np.argsort(assignments, kind="stable")
+        self.ids = order
+        self.encodings = encodings[order]
+        self.sq_norms = _sq_norms(self.encodings)
+        self.offsets = np.searchsorted(assignments[order], np.arange(self.n_lists + 1))
+
+    def __len__(self):
+        return len(self.encodings)
+
+    def arrays(self):
+        """The arrays searches read, from_arrays() builds an equal index on top of them"""
+        return {"ids": self.ids, "encodings": self.encodings, "sq_norms": self.sq_norms, "offsets": self.offsets,
+                "centroids": self.centroids, "centroid_sq_norms": self.centroid_sq_norms}
+
+    @classmethod
+    def from_arrays(cls, ids, encodings, sq_norms, offsets, centroids, centroid_sq_norms, n_probe=8):
+        """An index over existing arrays, e.g. views of shared memory, without training or copying them"""
+        index = cls.__new__(cls)
+        index.n_lists = len(centroids)
+        index.n_probe = min(n_probe, index.n_lists)
+        index.ids = ids
+        index.encodings = encodings
+        index.sq_norms = sq_norms
+        index.offsets = offsets
+        index.centroids = centroids
+        index.centroid_sq_norms = centroid_sq_norms
+        return index
+
+    def _train(self, encodings, iterations, max_training_points, seed):
+        rng = np.random.default_rng(seed)
+        sample = encodings
+        if len(encodings) > max_training_points:
+            sample = encodings[rng.choice(len(encodings), max_training_points, replace=False)]
+        centroids = sample[rng.choice(len(sample), self.n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmin(
+                _pairwise_distances(sample, centroids, _sq_norms(centroids)), axis=1)
+            for list_id in range(self.n_lists):
+                members = sample[assignments == list_id]
+                if len(members):
+                    centroids[list_id] = members.mean(axis=0)
+        return centroids
+
+    def _assign(self, encodings, chunk_size=8192):
+        assignments = np.empty(len(encodings), dtype=np.int64)
+        for start in range(0, len(encodings), chunk_size):
+            chunk = encodings[start:start + chunk_size]
+            assignments[start:start + chunk_size] = np.argmin(
+                _pairwise_distances(chunk, self.centroids, self.centroid_sq_norms), axis=1)
+        return assignments
+
+    def search(self, queries):
+        """Return (indices, distances) of the approximate nearest gallery entry for each query"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.encodings.shape[1])
+        centroid_distances = _pairwise_distances(queries, self.centroids, self.centroid_sq_norms)
+        probes = np.argpartition(centroid_distances, self.n_probe - 1, axis=1)[:, :self.n_probe]
+
+        indices = np.empty(len(queries), dtype=np.int64)
+        distances = np.empty(len(queries), dtype=np.float32)
+        for i, query in enumerate(queries):
+            rows = np.concatenate([np.arange(self.offsets[p], self.offsets[p + 1]) for p in probes[i]])
+            if len(rows) == 0:
+                indices[i], distances[i] = -1, np.inf
+                continue
+            candidate_distances = _pairwise_distances(query[None, :], self.encodings[rows], self.sq_norms[rows])[0]
+            best = np.argmin(candidate_distances)
+            indices[i] = self.ids[rows[best]]
+            distances[i] = candidate_distances[best]
+        return indices, distances
+
+def build_index(encodings, kind="auto", **params):
+    """Build a nearest neighbour index of the given kind ("auto", "brute_force" or "ivf")"""
+    if kind == "auto":
+        kind = IVFIndex.kind if len(encodings) >= AUTO_IVF_THRESHOLD else BruteForceIndex.kind
+    if kind == IVFIndex.kind:
+        return IVFIndex(encodings, **params)
+    if kind == BruteForceIndex.kind:
+        return BruteForceIndex(encodings)
+    raise ValueError(f"Unknown index kind: {kind}")
+
+def save_index(index, path=INDEX_FILE, gallery_digest=None):
+    """Save an index, gallery_digest identifies the gallery it was built for"""
+    index.gallery_digest = gallery_digest
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        pickle.dump(index, f)
+
+def load_index(path=INDEX_FILE):
+    """Load a saved index, returns None if there isn't one"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
@@ -0,0 +1,262 @@
+import email.parser
+import email.policy
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+class FakeMessage:
+    def __init__(self, sid, from_, body, to):
+        self.sid = sid
+        self.from_ = from_
+        self.body = body
+        self.to = to
+
+class FakeMessages:
+    def __init__(self):
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def create(self, from_=None, body=None, to=None, **kwargs):
+        message = FakeMessage(f"SM{uuid.uuid4().hex}", from_, body, to)
+        with self._lock:
+            self.sent.append(message)
+        return message
+
+class FakeTwilioClient:
+    """Stands in for twilio.rest.Client, records messages instead of sending them"""
+
+    def __init__(self, *args, **kwargs):
+        self.messages = FakeMessages()
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    def _reply(self, status, payload, content_type="application/json"):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_form(self):
+        """Fields of a urlencoded or multipart body, file fields as (filename, bytes)"""
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        content_type = self.headers.get("Content-Type", "")
+        if not content_type.startswith("multipart/"):
+            return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        form = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True)
+            filename = part.get_filename()
+            form[name] = (filename, payload) if filename else payload.decode()
+        return form
+
+    def log_message(self, format, *args):
+        pass
+
+class _FakeTwilioHandler(_JSONHandler):
+    def do_POST(self):
+        match = re.match(r"^/2010-04-01/Accounts/([^/]+)/Messages\.json$", self.path)
+        if not match:
+            self._reply(404, {"code": 20404, "message": "The requested resource was not found", "status": 404})
+            return
+        status, payload = self.server.fake.handle_message(match.group(1), self._read_form())
+        self._reply(status, payload)
+
+class FakeTwilioServer:
+    """Local HTTP endpoint speaking the Twilio Messages API, for exercising the real client.
+
+    Point alert.py at it with TWILIO_API_URL=server.url. fail_next(n) makes the
+    next n requests fail with a 503, failure_rate fails a random share of them.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, failure_rate=0.0, latency=0.0):
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.sent = []
+        self.requests = 0
+        self._failures_left = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _FakeTwilioHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, count=1):
+        with self._lock:
+            self._failures_left += count
+
+    def handle_message(self, account_sid, form):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            fail = self._failures_left > 0 or random.random() < self.failure_rate
+            if self._failures_left > 0:
+                self._failures_left -= 1
+            if fail:
+                return 503, {"code": 20503, "message": "Service unavailable", "status": 503}
+            message = {"sid": f"SM{uuid.uuid4().hex}", "account_sid": account_sid, "status": "queued",
+                       "from": form.get("From"), "to": form.get("To"), "body": form.get("Body")}
+            self.sent.append(message)
+        return 201, message
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+class _FakeCloudinaryHandler(_JSONHandler):
+    def do_POST(self):
+        match = re.match(r"^/v1_1/([^/]+)/(image|video|raw|auto)/(upload|destroy)$", urlsplit(self.path).path)
+        if not match:
+            self._reply(404, {"error": {"message": "Not found"}})
+            return
+        cloud_name, resource_type, action = match.groups()
+        form = self._read_form()
+        fake = self.server.fake
+        if action == "upload":
+            self._reply(*fake.handle_upload(resource_type, form))
+        else:
+            self._reply(200, fake.destroy(form.get("public_id")))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        match = re.match(r"^/v1_1/([^/]+)/resources/(image|video|raw)/upload$", url.path)
+        if match:
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            self._reply(200, self.server.fake.list_resources(match.group(2), query))
+            return
+        match = re.match(r"^/[^/]+/(image|video|raw)/upload/(.+)\.(\w+)$", url.path)
+        resource = self.server.fake.resources.get(match.group(2)) if match else None
+        if resource is None:
+            self._reply(404, {"error": {"message": "Not found"}})
+            return
+        content_type = "video/mp4" if resource["resource_type"] == "video" else f"image/{resource['format']}"
+        self._reply(200, self.server.fake.files[resource["public_id"]], content_type)
+
+class FakeCloudinaryServer:
+    """Local HTTP endpoint speaking enough of the Cloudinary upload, admin and delivery APIs for tests.
+
+    Point the SDK at it with CLOUDINARY_UPLOAD_PREFIX=server.url (or
+    cloudinary.config(upload_prefix=server.url)). Uploaded files are kept in
+    memory and served from their secure_url. fail_next(n) makes the next n
+    uploads fail with a 503, latency delays every upload.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, cloud_name="fake", latency=0.0):
+        self.cloud_name = cloud_name
+        self.latency = latency
+        self.resources = {}
+        self.files = {}
+        self.uploads = 0
+        self._failures_left = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _FakeCloudinaryHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, count=1):
+        with self._lock:
+            self._failures_left += count
+
+    def handle_upload(self, resource_type, form):
+        if self.latency:
+            time.sleep(self.latency)
+        filename, data = form.get("file", ("", b""))
+        file_format = os.path.splitext(filename or "")[1].lstrip(".").lower() or "jpg"
+        if resource_type == "auto":
+            resource_type = "video" if file_format in ("mp4", "mov", "avi", "webm") else "image"
+        public_id = form.get("public_id") or uuid.uuid4().hex
+        with self._lock:
+            self.uploads += 1
+            if self._failures_left > 0:
+                self._failures_left -= 1
+                return 503, {"error": {"message": "Service unavailable"}}
+            self._sequence += 1
+            resource = {
+                "public_id": public_id,
+                "resource_type": resource_type,
+                "type": "upload",
+                "format": file_format,
+                "bytes": len(data),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "secure_url": f"{self.url}/{self.cloud_name}/{resource_type}/upload/{public_id}.{file_format}",
+                "_sequence": self._sequence,
+            }
+            self.resources[public_id] = resource
+            self.files[public_id] = data
+        return 200, {k: v for k, v in resource.items() if not k.startswith("_")}
+
+    def destroy(self, public_id):
+        with self._lock:
+            found = self.resources.pop(public_id, None) is not None
+            self.files.pop(public_id, None)
+        return {"result": "ok" if found else "not found"}
+
+    def list_resources(self, resource_type, query):
+        """Newest first, paged with max_results and next_cursor like the admin API"""
+        prefix = query.get("prefix", "")
+        max_results = int(query.get("max_results", 10))
+        offset = int(query.get("next_cursor") or 0)
+        with self._lock:
+            matching = sorted((r for r in self.resources.values()
+                               if r["resource_type"] == resource_type and r["public_id"].startswith(prefix)),
+                              key=lambda r: r["_sequence"], reverse=query.get("direction", "desc") != "asc")
+        page = [{k: v for k, v in r.items() if not k.startswith("_")} for r in matching[offset:offset + max_results]]
+        result = {"resources": page}
+        if offset + max_results < len(matching):
+            result["next_cursor"] = str(offset + max_results)
+        return result
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+class FakeAlertSink:
+    """Collects the alerts and snapshots the pipeline would have produced, without touching disk"""
+
+    def __init__(self):
+        self.alerts = []
+        self.snapshots = []
+        # Capture time of the frame being handled, alerts fall back to the wall clock without it
+        self.now = None
+        self._lock = threading.Lock()
+
+    def take_snapshot(self, frame, label, camera=None):
+        if camera is not None:
+            label = f"{camera}_{label}"
+        with self._lock:
+            snapshot_path = f"snapshots/{label}_{len(self.snapshots) + 1}.jpg"
+            self.snapshots.append(snapshot_path)
+        return snapshot_path
+
+    def send_alert(self, message, snapshot_path=None):
+        with self._lock:
+            sent_at = self.now if self.now is not None else time.time()
+            self.alerts.append({"time": sent_at, "message": message, "snapshot": snapshot_path})
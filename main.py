@@ -1,136 +1,325 @@
 import cv2
 import face_recognition
+import logging
 import time
-import requests
 from datetime import datetime
 import os
 
-from face_detection import load_known_faces, check_face_quality
-from motion_detection import detect_motion
+from face_detection import load_face_gallery, score_face_quality, find_face_locations, QUALITY_THRESHOLD
+from motion_detection import MotionDetector
+from clip_recorder import ClipRecorder
+from alert_policy import AlertPolicy
 from alert_system import take_snapshot, send_alert_in_background
+from pipeline import Pipeline
+from tracker import FaceTracker
+from control import ControlChannel
+from metrics import REGISTRY, METRICS_PORT, stage_timer, start_http_server
 
-print("🔄 Initializing surveillance system...")
+logger = logging.getLogger(__name__)
 
-# Initialize camera
-cap = cv2.VideoCapture(0)
-if not cap.isOpened():
-    print("❌ Error: Camera not accessible!")
-    exit()
-print("📸 Camera initialized successfully.")
-
-# Ensure snapshots folder exists
+# Snapshots folder, created when a camera starts
 SNAPSHOT_DIR = "snapshots"
-os.makedirs(SNAPSHOT_DIR, exist_ok=True)
 
-FLASK_SERVER = "http://127.0.0.1:5001/status"
+MATCH_TOLERANCE = 0.6
+
+# Pipeline sizing
+DETECT_WORKERS = 2
+ENCODE_WORKERS = 2
+QUEUE_SIZE = 2
+
+# Face detection only runs on moving regions, downscaled by DETECTION_SCALE,
+# plus a full-frame pass every FULL_FRAME_INTERVAL seconds for static faces
+DETECTION_SCALE = 0.5
+REGION_PADDING = 40
+FULL_FRAME_INTERVAL = 2.0
+
+# Tracked faces are re-encoded every REENCODE_EVERY detections or when they move a lot
+REENCODE_EVERY = 10
+UNKNOWN_DWELL_SECONDS = 5
+
+# How often run_camera reports FPS through its on_stats callback
+STATS_INTERVAL = 5.0
+
+MOTION_SECONDS = stage_timer("detect_motion")
+COLOR_CONVERSION_SECONDS = stage_timer("color_conversion")
+FACE_LOCATIONS_SECONDS = stage_timer("face_locations")
+FACE_QUALITY_SECONDS = stage_timer("check_face_quality")
+ENCODING_SECONDS = stage_timer("encoding")
+MATCHING_SECONDS = stage_timer("matching")
+FACES_REJECTED = REGISTRY.counter("faces_rejected_total", "Faces rejected by the quality check")
+
+def configure_logging(level=None):
+    """Leveled console logging, LOG_LEVEL=DEBUG brings back the per-frame detection output"""
+    logging.basicConfig(level=level or os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
+
+def open_capture(source):
+    """Open a camera by device index, or an RTSP URL / video file by path"""
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    return cv2.VideoCapture(source)
+
+class CameraProcessor:
+    """Per-camera detection state and the pipeline stages that use it"""
+
+    def __init__(self, known_faces, camera_id=None, send_alert=send_alert_in_background,
+                 take_snapshot=take_snapshot, motion_settings=None, record_clip=None,
+                 alert_policy=None, load_gallery=None):
+        self.known_faces = known_faces
+        self.load_gallery = load_gallery
+        self.tolerance = MATCH_TOLERANCE
+        self.paused = False
+        self.camera_id = camera_id
+        self.send_alert = send_alert
+        self.take_snapshot = take_snapshot
+        self.record_clip = record_clip
+        self.tracker = FaceTracker(max_age=FULL_FRAME_INTERVAL + 1.0, reencode_every=REENCODE_EVERY)
+        self.alert_policy = alert_policy or AlertPolicy()
+        self.motion_detector = MotionDetector(**(motion_settings or {}))
+        self.last_full_frame_pass = 0
 
-# Initialize tracking variables
-unknown_start_time = datetime.now()
-sent_alerts = set()
-prev_frame = None
+    def motion_gate(self, packet):
+        """Gate stage: decide whether and where to run face detection on this frame"""
+        if self.paused:
+            return False
 
-# Load known face encodings
-known_face_encodings, known_face_names = load_known_faces()
+        with MOTION_SECONDS.time():
+            motion = self.motion_detector.update(packet.frame)
+        packet.motion_detected = motion.motion_detected
+        packet.motion_fraction = motion.fraction
+        packet.motion_regions = motion.boxes
 
-print("🚀 Surveillance system is now running...")
-cv2.namedWindow("Surveillance Camera", cv2.WINDOW_NORMAL)
+        if packet.captured_at - self.last_full_frame_pass >= FULL_FRAME_INTERVAL:
+            self.last_full_frame_pass = packet.captured_at
+            packet.detect_regions = None
+            return True
 
-def is_surveillance_active():
-    try:
-        response = requests.get(FLASK_SERVER, timeout=3)
-        return response.status_code == 200 and response.json().get("running", True)
-    except:
+        packet.detect_regions = packet.motion_regions
+        return packet.motion_detected
+
+    def detect_faces(self, packet):
+        """Detection stage: find faces and keep the ones that pass quality checks"""
+        with COLOR_CONVERSION_SECONDS.time():
+            packet.rgb_frame = cv2.cvtColor(packet.frame, cv2.COLOR_BGR2RGB)
+        with FACE_LOCATIONS_SECONDS.time():
+            packet.face_locations = find_face_locations(packet.rgb_frame, packet.detect_regions,
+                                                        scale=DETECTION_SCALE, padding=REGION_PADDING)
+        logger.debug("Detected %d faces", len(packet.face_locations))
+        with FACE_QUALITY_SECONDS.time():
+            packet.quality_scores = score_face_quality(packet.face_locations, packet.frame)
+        packet.accepted_locations = [
+            face_location for face_location, score in zip(packet.face_locations, packet.quality_scores)
+            if score >= QUALITY_THRESHOLD
+        ]
+        FACES_REJECTED.inc(len(packet.face_locations) - len(packet.accepted_locations))
+
+    def track_faces(self, packet):
+        """Tracking stage: follow faces between frames and pick the ones that need encoding"""
+        packet.tracks = self.tracker.update(packet.accepted_locations, packet.captured_at)
+        packet.encode_tracks = [track for track in packet.tracks if self.tracker.needs_encoding(track)]
+        # Boxes as of this frame, the next update may move the tracks before the encoder runs
+        packet.encode_boxes = [track.box for track in packet.encode_tracks]
+        return bool(packet.encode_tracks)
+
+    def encode_and_match(self, packet):
+        """Encoding stage: encode faces in one batch and match them against known faces"""
+        boxes = packet.encode_boxes
+        with ENCODING_SECONDS.time():
+            face_encodings = face_recognition.face_encodings(packet.rgb_frame, boxes)
+        with MATCHING_SECONDS.time():
+            matches = self.known_faces.match(face_encodings, tolerance=self.tolerance)
+        for track, box, (name, distance) in zip(packet.encode_tracks, boxes, matches):
+            self.tracker.set_identity(track, name, distance, box, packet.captured_at)
+
+    def reload_faces(self, message=None):
+        """Reload the known face gallery, from disk unless a load_gallery(message) was given"""
+        self.known_faces = self.load_gallery(message) if self.load_gallery else load_face_gallery()
+        logger.info(f"🔄 Reloaded {len(self.known_faces)} known face encodings")
+
+    def attach_control(self, control):
+        """Follow pause/resume/reload/threshold commands from a ControlChannel"""
+        self.paused = control.paused
+        if control.threshold is not None:
+            self.tolerance = control.threshold
+
+        def on_command(message):
+            self.paused = control.paused
+            if control.threshold is not None:
+                self.tolerance = control.threshold
+
+        control.on("*", on_command)
+        control.on("reload_faces", self.reload_faces)
+
+    def alert(self, frame, label, message, key=None, now=None):
+        """Send an alert if the alert policy lets it through, returns whether it was sent"""
+        if not self.alert_policy.check(label, message, frame, key=key, now=now):
+            return False
+        self.send_now(frame, label, message)
         return True
 
-while True:
-    if not is_surveillance_active():
-        print("🚨 Surveillance Stopped. Exiting...")
-        break
-
-    ret, frame = cap.read()
-    if not ret:
-        print("❌ Camera feed lost! Exiting...")
-        break
-
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    face_locations = face_recognition.face_locations(rgb_frame)
-    
-    print(f"\nDetected {len(face_locations)} faces")  # Debug print
-
-    # Process detected faces
-    face_ids = []
-    for face_location in face_locations:
-        if not check_face_quality(face_location, frame):
+    def send_now(self, frame, label, message):
+        """Take a snapshot, start a clip and send an alert, tagged with the camera when there is one"""
+        if self.camera_id is not None:
+            message = f"[{self.camera_id}] {message}"
+        snapshot_path = self.take_snapshot(frame, label, camera=self.camera_id)
+        if self.record_clip is not None:
+            logger.info(f"🎬 Recording clip: {self.record_clip(label)}")
+        self.send_alert(message, snapshot_path)
+
+    def handle_result(self, packet):
+        """Decide which alerts a processed frame triggers"""
+        if self.paused:
+            return
+        now = packet.captured_at
+        for label, message, digest_frame in self.alert_policy.due_digests(now):
+            self.send_now(digest_frame, label, message)
+
+        frame = packet.frame
+        # Between full-frame passes only motion regions are searched, so a still face is
+        # missing from this frame's detections but still has a live track
+        live_tracks = self.tracker.live_tracks(now)
+        # Faces whose first encoding is still in flight have no identity yet
+        identified_tracks = [track for track in live_tracks if track.name is not None]
+        face_ids = [track.name for track in identified_tracks]
+
+        # Check for presence of known and unknown faces
+        known_present = any(face_id != "unknown" for face_id in face_ids)
+        unknown_present = any(face_id == "unknown" for face_id in face_ids)
+
+        # Handle case when both known and unknown faces are present
+        if known_present and unknown_present and len(face_ids) >= 2:
+            if self.alert(frame, "guest_with_known", "No threat, it is probably your guest", now=now):
+                logger.info("Known and unknown person detected together")
+            return
+
+        # Handle single known face
+        if known_present and not unknown_present and len(face_ids) == 1:
+            if self.alert(frame, "known_person", "Welcome My Master!", key=identified_tracks[0].track_id, now=now):
+                logger.info("Known person detected")
+            return
+
+        # Handle unknown face
+        if unknown_present:
+            # When the frame was captured, not when its result came out of the pipeline
+            current_time = datetime.fromtimestamp(now)
+            longest = max((track for track in identified_tracks if track.name == "unknown"),
+                          key=lambda track: track.dwell_time)
+
+            if longest.dwell_time > UNKNOWN_DWELL_SECONDS:  # Unknown person present for more than 5 seconds
+                if current_time.hour >= 21 or current_time.hour < 6:  # Night time (9 PM to 6 AM)
+                    if self.alert(frame, "high_threat", "Very high Threat detected", key=longest.track_id, now=now):
+                        logger.info("High threat detected at night")
+                else:  # Day time
+                    if self.alert(frame, "normal_threat", "Normal threat", key=longest.track_id, now=now):
+                        logger.info("Normal threat detected during day")
+
+        # Check for motion when no faces are detected or still tracked
+        if not packet.face_locations and not live_tracks and packet.motion_detected:
+            if self.alert(frame, "motion", "⚠️ Motion detected but no face visible. Possible threat!", now=now):
+                logger.info("Motion detected but no face visible")
+
+def run_camera(source=0, camera_id=None, known_faces=None, send_alert=send_alert_in_background,
+               show=True, on_stats=None, control=None, metrics_port=None, motion_settings=None,
+               clip_settings=None, alert_settings=None, web_port=None, load_gallery=None):
+    """Run the surveillance pipeline on one camera until it stops, fails or 'q' is pressed.
+
+    on_stats, if given, is called every STATS_INTERVAL seconds with a dict of
+    frames processed, frames dropped and FPS. Without a control channel one is
+    started on the default local control port. With metrics_port, stage metrics
+    are served in the Prometheus text format on http://127.0.0.1:<port>/metrics.
+    motion_settings are passed to this camera's MotionDetector and clip_settings
+    to its ClipRecorder, clip_settings=False turns clip recording off.
+    alert_settings (cooldowns, digest_window) configure its AlertPolicy.
+    With web_port, the index.html dashboard and its MJPEG live feed of this
+    camera are served on http://127.0.0.1:<port>/. load_gallery(message), if
+    given, replaces reading the gallery from disk on reload_faces.
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    metrics_server = start_http_server(metrics_port) if metrics_port else None
+
+    # Initialize camera
+    cap = open_capture(source)
+    if not cap.isOpened():
+        logger.error(f"❌ Error: Camera {source} not accessible!")
+        return False
+    logger.info("📸 Camera initialized successfully.")
+
+    if known_faces is None:
+        known_faces = load_face_gallery()
+    clip_recorder = None
+    if clip_settings is not False:
+        clip_recorder = ClipRecorder(camera=camera_id, **(clip_settings or {})).start()
+    processor = CameraProcessor(known_faces, camera_id=camera_id, send_alert=send_alert,
+                                motion_settings=motion_settings,
+                                record_clip=clip_recorder.trigger if clip_recorder else None,
+                                alert_policy=AlertPolicy(**(alert_settings or {})),
+                                load_gallery=load_gallery)
+    owns_control = control is None
+    if owns_control:
+        control = ControlChannel().start()
+    processor.attach_control(control)
+    pipeline = Pipeline(cap, processor.detect_faces, processor.encode_and_match,
+                        gate=processor.motion_gate, track=processor.track_faces,
+                        detect_workers=DETECT_WORKERS, encode_workers=ENCODE_WORKERS,
+                        queue_size=QUEUE_SIZE).start()
+    web_server = None
+    if web_port:
+        # Flask is only needed when this process serves the dashboard
+        from server import LiveFeed, start_web_server, stop_web_server
+        web_server = start_web_server(web_port, feed=LiveFeed(pipeline.grabber))
+
+    window_name = f"Surveillance Camera {camera_id}" if camera_id else "Surveillance Camera"
+    logger.info("🚀 Surveillance system is now running...")
+    if show:
+        cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
+
+    frames = 0
+    stats_started = time.time()
+    completed = True
+    while True:
+        if not control.running:
+            logger.info("🚨 Surveillance Stopped. Exiting...")
+            break
+
+        if on_stats and time.time() - stats_started >= STATS_INTERVAL:
+            elapsed = time.time() - stats_started
+            on_stats({"frames": frames, "frames_dropped": pipeline.frames_dropped, "fps": frames / elapsed})
+            frames = 0
+            stats_started = time.time()
+
+        packet = pipeline.get_result()
+        if packet is None:
+            if pipeline.failed:
+                logger.error("❌ Camera feed lost! Exiting...")
+                completed = False
+                break
             continue
-            
-        # Get face encoding for this specific face
-        face_encoding = face_recognition.face_encodings(rgb_frame, [face_location])[0]
-        matches = face_recognition.compare_faces(known_face_encodings, face_encoding, tolerance=0.6)
-        name = "unknown"
-        
-        if True in matches:
-            first_match_index = matches.index(True)
-            name = known_face_names[first_match_index]
-        
-        face_ids.append(name)
-    
-    # Check for presence of known and unknown faces
-    known_present = any(face_id != "unknown" for face_id in face_ids)
-    unknown_present = any(face_id == "unknown" for face_id in face_ids)
-    
-    # Handle case when both known and unknown faces are present
-    if known_present and unknown_present and len(face_ids) >= 2:
-        if "guest_with_known" not in sent_alerts:
-            print("Known and unknown person detected together")
-            snapshot_path = take_snapshot(frame, "guest_with_known")
-            send_alert_in_background("No threat, it is probably your guest", snapshot_path)
-            sent_alerts.add("guest_with_known")
-        continue
-    
-    # Handle single known face
-    if known_present and not unknown_present and len(face_ids) == 1:
-        if "known_person" not in sent_alerts:
-            print("Known person detected")
-            snapshot_path = take_snapshot(frame, "known_person")
-            send_alert_in_background("Welcome My Master!", snapshot_path)
-            sent_alerts.add("known_person")
-        continue
-    
-    # Handle unknown face
-    if unknown_present:
-        current_time = datetime.now()
-        time_diff = (current_time - unknown_start_time).total_seconds()
-        
-        if time_diff > 5:  # Unknown person present for more than 5 seconds
-            if current_time.hour >= 21 or current_time.hour < 6:  # Night time (9 PM to 6 AM)
-                if "high_threat" not in sent_alerts:
-                    print("High threat detected at night")
-                    snapshot_path = take_snapshot(frame, "high_threat")
-                    send_alert_in_background("Very high Threat detected", snapshot_path)
-                    sent_alerts.add("high_threat")
-            else:  # Day time
-                if "normal_threat" not in sent_alerts:
-                    print("Normal threat detected during day")
-                    snapshot_path = take_snapshot(frame, "normal_threat")
-                    send_alert_in_background("Normal threat", snapshot_path)
-                    sent_alerts.add("normal_threat")
-        else:
-            unknown_start_time = current_time
-
-    # Check for motion when no faces are detected
-    if not face_locations:
-        motion_detected, prev_frame = detect_motion(frame, prev_frame)
-        if motion_detected and "motion_detected" not in sent_alerts:
-            print("Motion detected but no face visible")
-            snapshot_path = take_snapshot(frame, "motion")
-            send_alert_in_background("⚠️ Motion detected but no face visible. Possible threat!", snapshot_path)
-            sent_alerts.add("motion_detected")
-
-    cv2.imshow("Surveillance Camera", frame)
-    if cv2.waitKey(1) & 0xFF == ord("q"):
-        break
-
-    time.sleep(0.1)
-
-cap.release()
-cv2.destroyAllWindows() 
\ No newline at end of file
+
+        frames += 1
+        if clip_recorder:
+            clip_recorder.add(packet.frame, packet.captured_at)
+        processor.handle_result(packet)
+
+        if show:
+            cv2.imshow(window_name, packet.frame)
+            if cv2.waitKey(1) & 0xFF == ord("q"):
+                break
+
+    pipeline.stop()
+    if clip_recorder:
+        clip_recorder.stop()
+    if owns_control:
+        control.stop()
+    if metrics_server:
+        metrics_server.shutdown()
+    if web_server:
+        stop_web_server(web_server)
+    cap.release()
+    if show:
+        cv2.destroyWindow(window_name)
+    return completed
+
+if __name__ == "__main__":
+    configure_logging()
+    logger.info("🔄 Initializing surveillance system...")
+    from server import WEB_PORT
+    run_camera(0, metrics_port=METRICS_PORT, web_port=WEB_PORT)
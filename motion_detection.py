@@ -1,48 +1,100 @@
 import cv2
 import numpy as np
 
-def detect_motion(frame, prev_frame=None):
-    """Detect motion in the frame"""
-    if prev_frame is None:
-        prev_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        return False, prev_frame
-    
-    # Convert current frame to grayscale
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    
-    # Apply Gaussian blur to reduce noise
-    gray = cv2.GaussianBlur(gray, (21, 21), 0)
-    prev_frame = cv2.GaussianBlur(prev_frame, (21, 21), 0)
-    
-    # Calculate frame difference
-    frame_diff = cv2.absdiff(gray, prev_frame)
-    
-    # Apply threshold to get binary image (increased threshold)
-    thresh = cv2.threshold(frame_diff, 30, 255, cv2.THRESH_BINARY)[1]
-    
-    # Dilate the thresholded image to fill in holes
-    thresh = cv2.dilate(thresh, None, iterations=2)
-    
-    # Find contours on thresholded image
-    contours, _ = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    # Calculate total motion area
-    total_motion_area = 0
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        if area > 100:  # Minimum area threshold increased
-            total_motion_area += area
-    
-    # Calculate motion percentage
-    frame_area = frame.shape[0] * frame.shape[1]
-    motion_percentage = total_motion_area / frame_area
-    
-    # Only return True if motion is significant (more than 0.1% of frame)
-    if motion_percentage > 0.001:
-        # Update previous frame only if significant motion is detected
-        prev_frame = gray.copy()
-        return True, prev_frame
-    
-    # Update previous frame
-    prev_frame = gray.copy()
-    return False, prev_frame 
\ No newline at end of file
+def merge_boxes(boxes):
+    """Merge overlapping (top, right, bottom, left) boxes into their union"""
+    merged = [list(box) for box in boxes]
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                a, b = merged[i], merged[j]
+                if a[0] <= b[2] and b[0] <= a[2] and a[3] <= b[1] and b[3] <= a[1]:
+                    merged[i] = [min(a[0], b[0]), max(a[1], b[1]), max(a[2], b[2]), min(a[3], b[3])]
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return [tuple(box) for box in merged]
+
+class MotionResult:
+    """Share of the frame that moved, and the merged (top, right, bottom, left) boxes where it did"""
+
+    def __init__(self, fraction, boxes, threshold):
+        self.fraction = fraction
+        self.boxes = boxes
+        self.motion_detected = fraction > threshold
+
+class MotionDetector:
+    """Running-average background model kept at reduced resolution.
+
+    Each frame is downscaled, converted to grayscale and blurred once into a
+    reused buffer, compared against the background and then folded into it.
+    Thresholds are per instance so every camera can be tuned on its own.
+    """
+
+    def __init__(self, scale=0.25, blur_size=21, learning_rate=0.05, diff_threshold=30,
+                 min_area=100, motion_threshold=0.001, dilate_iterations=2):
+        self.scale = scale
+        # Keep the blur radius the same in full-resolution pixels
+        self.blur_size = max(3, int(blur_size * scale) | 1)
+        self.learning_rate = learning_rate
+        self.diff_threshold = diff_threshold
+        self.min_area = min_area * scale * scale
+        self.motion_threshold = motion_threshold
+        self.dilate_iterations = dilate_iterations
+        self.reset()
+
+    def reset(self):
+        self.background = None
+        self._small = None
+        self._gray = None
+        self._blurred = None
+        self._background_u8 = None
+        self._diff = None
+        self._mask = None
+
+    def update(self, frame):
+        """Compare a BGR frame with the background, then learn it into the background"""
+        height, width = frame.shape[:2]
+        small_size = (max(1, int(width * self.scale)), max(1, int(height * self.scale)))
+        if self._small is not None and self._small.shape[1::-1] != small_size:
+            self.reset()
+
+        self._small = cv2.resize(frame, small_size, dst=self._small, interpolation=cv2.INTER_AREA)
+        self._gray = cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        self._blurred = cv2.GaussianBlur(self._gray, (self.blur_size, self.blur_size), 0, dst=self._blurred)
+
+        if self.background is None:
+            self.background = self._blurred.astype(np.float32)
+            return MotionResult(0.0, [], self.motion_threshold)
+
+        self._background_u8 = cv2.convertScaleAbs(self.background, dst=self._background_u8)
+        self._diff = cv2.absdiff(self._blurred, self._background_u8, dst=self._diff)
+        _, self._mask = cv2.threshold(self._diff, self.diff_threshold, 255, cv2.THRESH_BINARY, dst=self._mask)
+        cv2.accumulateWeighted(self._blurred, self.background, self.learning_rate)
+
+        mask = cv2.dilate(self._mask, None, iterations=self.dilate_iterations)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        total_motion_area = 0
+        boxes = []
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if area > self.min_area:
+                total_motion_area += area
+                x, y, w, h = cv2.boundingRect(contour)
+                boxes.append((
+                    int(y / self.scale),
+                    min(width, int((x + w) / self.scale)),
+                    min(height, int((y + h) / self.scale)),
+                    int(x / self.scale),
+                ))
+
+        fraction = total_motion_area / float(small_size[0] * small_size[1])
+        result = MotionResult(fraction, [], self.motion_threshold)
+        if result.motion_detected:
+            result.boxes = merge_boxes(boxes)
+        return result
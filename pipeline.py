@@ -0,0 +1,243 @@
+import logging
+import queue
+import threading
+import time
+
+from metrics import REGISTRY, stage_timer
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_SECONDS = stage_timer("capture")
+FRAMES_DROPPED = REGISTRY.counter("frames_dropped_total", "Frames dropped by full pipeline queues")
+
+
+class DropOldestQueue(queue.Queue):
+    """Bounded queue that discards the oldest item instead of blocking the producer"""
+
+    def __init__(self, maxsize=2):
+        super().__init__(maxsize)
+        self.dropped = 0
+
+    def put(self, item, block=False, timeout=None):
+        with self.mutex:
+            if self.maxsize > 0 and self._qsize() >= self.maxsize:
+                self._get()
+                self.dropped += 1
+                FRAMES_DROPPED.inc()
+            self._put(item)
+            self.not_empty.notify()
+
+
+class ResultQueue(DropOldestQueue):
+    """Output queue that evicts frames which skipped detection before detection results"""
+
+    def put(self, item, block=False, timeout=None):
+        with self.mutex:
+            if self.maxsize > 0 and self._qsize() >= self.maxsize:
+                skipped = next((packet for packet in self.queue if packet.detection_skipped), None)
+                if skipped is not None:
+                    self.queue.remove(skipped)
+                else:
+                    self._get()
+                self.dropped += 1
+                FRAMES_DROPPED.inc()
+            self._put(item)
+            self.not_empty.notify()
+
+
+class FramePacket:
+    """A captured frame plus everything the stages compute for it"""
+
+    def __init__(self, seq, frame, captured_at):
+        self.seq = seq
+        self.frame = frame
+        self.captured_at = captured_at
+        self.rgb_frame = None
+        self.face_locations = []
+        self.quality_scores = []
+        self.accepted_locations = []
+        self.motion_detected = False
+        self.motion_fraction = 0.0
+        self.motion_regions = []
+        self.detect_regions = None
+        self.detection_skipped = False
+        self.tracks = []
+        self.encode_tracks = []
+        self.encode_boxes = []
+
+
+class FrameGrabber(threading.Thread):
+    """Reads the camera continuously and only keeps the newest frame"""
+
+    def __init__(self, cap):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.failed = False
+        self._seq = 0
+        self._frame = None
+        self._captured_at = None
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            with CAPTURE_SECONDS.time():
+                ret, frame = self.cap.read()
+            with self._cond:
+                if not ret:
+                    self.failed = True
+                    self._cond.notify_all()
+                    return
+                self._seq += 1
+                self._frame = frame
+                self._captured_at = time.time()
+                self._cond.notify_all()
+
+    def read(self, last_seq=0, timeout=1.0):
+        """Wait for a frame newer than last_seq, returns a FramePacket or None"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > last_seq or self.failed or self._stop_event.is_set(),
+                                timeout=timeout)
+            if self._seq <= last_seq:
+                return None
+            return FramePacket(self._seq, self._frame, self._captured_at)
+
+    def stop(self):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+
+class Pipeline:
+    """Capture -> detect -> encode pipeline with bounded, drop-oldest queues between stages.
+
+    `detect` and `encode` are callables that fill in a FramePacket in place. Each
+    runs on its own pool of worker threads; results come out newest-first through
+    get_result(), and packets that finish after a newer one are discarded.
+
+    `gate` runs on every frame, in order, before detection. When it returns
+    False the frame skips detection and encoding and goes straight to the output.
+    `track` runs on a single thread between detection and encoding, in frame
+    order; when it returns False the frame has nothing new to encode.
+    """
+
+    def __init__(self, cap, detect, encode, gate=None, track=None, detect_workers=2, encode_workers=2,
+                 queue_size=2):
+        self.grabber = FrameGrabber(cap)
+        self.detect = detect
+        self.encode = encode
+        self.gate = gate
+        self.track = track
+        self.detect_queue = DropOldestQueue(queue_size)
+        self.track_queue = DropOldestQueue(queue_size)
+        self.encode_queue = DropOldestQueue(queue_size)
+        self.result_queue = ResultQueue(queue_size)
+        self._last_result_seq = 0
+        self._last_detected_seq = 0
+        self._stop_event = threading.Event()
+        self._threads = [threading.Thread(target=self._feed, daemon=True),
+                         threading.Thread(target=self._run_tracking, daemon=True)]
+        for _ in range(detect_workers):
+            self._threads.append(threading.Thread(
+                target=self._run_stage, args=(self.detect, self.detect_queue, self.track_queue), daemon=True))
+        for _ in range(encode_workers):
+            self._threads.append(threading.Thread(
+                target=self._run_stage, args=(self.encode, self.encode_queue, self.result_queue), daemon=True))
+
+    @property
+    def failed(self):
+        return self.grabber.failed
+
+    @property
+    def frames_dropped(self):
+        return (self.detect_queue.dropped + self.track_queue.dropped +
+                self.encode_queue.dropped + self.result_queue.dropped)
+
+    def start(self):
+        self.grabber.start()
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        self.grabber.stop()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        self.grabber.join(timeout=1.0)
+
+    def _feed(self):
+        last_seq = 0
+        while not self._stop_event.is_set() and not self.grabber.failed:
+            packet = self.grabber.read(last_seq, timeout=0.5)
+            if packet is None:
+                continue
+            last_seq = packet.seq
+            if self.gate is not None and not self.gate(packet):
+                packet.detection_skipped = True
+                self.result_queue.put(packet)
+                continue
+            self.detect_queue.put(packet)
+
+    def _run_tracking(self):
+        last_seq = 0
+        while not self._stop_event.is_set():
+            try:
+                packet = self.track_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            # Tracks must only move forward in time, so late detections are dropped
+            if packet.seq <= last_seq:
+                continue
+            last_seq = packet.seq
+            if self.track is None:
+                self.encode_queue.put(packet)
+                continue
+            try:
+                needs_encoding = self.track(packet)
+            except Exception as e:
+                logger.exception(f"❌ Error in pipeline stage {getattr(self.track, '__name__', self.track)}: {str(e)}")
+                continue
+            if needs_encoding:
+                self.encode_queue.put(packet)
+            else:
+                self.result_queue.put(packet)
+
+    def _run_stage(self, stage, in_queue, out_queue):
+        while not self._stop_event.is_set():
+            try:
+                packet = in_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                stage(packet)
+            except Exception as e:
+                logger.exception(f"❌ Error in pipeline stage {getattr(stage, '__name__', stage)}: {str(e)}")
+                continue
+            out_queue.put(packet)
+
+    def get_result(self, timeout=1.0):
+        """Return the next processed packet, skipping any older than the last one returned.
+
+        Frames that skipped detection come out while earlier frames are
+        still being detected, so they do not hold back detection results:
+        a detected packet is only dropped if a newer detected one was
+        already returned.
+        """
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            try:
+                packet = self.result_queue.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if packet.detection_skipped:
+                if packet.seq > max(self._last_result_seq, self._last_detected_seq):
+                    self._last_result_seq = packet.seq
+                    return packet
+            elif packet.seq > self._last_detected_seq:
+                self._last_detected_seq = packet.seq
+                self._last_result_seq = max(self._last_result_seq, packet.seq)
+                return packet
@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+import cv2
+import numpy as np
+
+import alert
+from fakes import FakeAlertSink, FakeTwilioClient
+from face_detection import load_face_gallery
+from main import CameraProcessor, DETECT_WORKERS, ENCODE_WORKERS, QUEUE_SIZE, configure_logging
+from pipeline import FramePacket, Pipeline
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+DEFAULT_FPS = 10.0
+
+# Never reach the real Twilio account from a replay
+alert.client = FakeTwilioClient()
+
+class ImageDirectoryCapture:
+    """cv2.VideoCapture look-alike that reads a directory of images in name order"""
+
+    def __init__(self, directory):
+        self.paths = sorted(
+            os.path.join(directory, f) for f in os.listdir(directory) if f.lower().endswith(IMAGE_EXTENSIONS))
+        self.position = 0
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    def read(self):
+        while self.position < len(self.paths):
+            frame = cv2.imread(self.paths[self.position])
+            self.position += 1
+            if frame is not None:
+                return True, frame
+        return False, None
+
+    def get(self, prop):
+        return 0.0
+
+    def release(self):
+        self.position = len(self.paths)
+
+class ReplayCapture:
+    """Wraps a capture to stop after max_frames, time every read and optionally pace reads to fps"""
+
+    def __init__(self, cap, timer, fps=None, max_frames=None):
+        self.cap = cap
+        self.timer = timer
+        self.interval = 1.0 / fps if fps else 0.0
+        self.max_frames = max_frames
+        self.frames_read = 0
+        self._next_due = None
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        if self.max_frames is not None and self.frames_read >= self.max_frames:
+            return False, None
+        if self.interval:
+            now = time.perf_counter()
+            if self._next_due is None:
+                self._next_due = now
+            if self._next_due > now:
+                time.sleep(self._next_due - now)
+            self._next_due += self.interval
+
+        start = time.perf_counter()
+        ret, frame = self.cap.read()
+        self.timer.record("capture", time.perf_counter() - start)
+        if ret:
+            self.frames_read += 1
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+class StageTimer:
+    """Collects per-stage latencies so percentiles can be reported at the end"""
+
+    def __init__(self):
+        self.latencies = {}
+
+    def record(self, stage, seconds):
+        self.latencies.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage, fn):
+        def timed(*args):
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        timed.__name__ = stage
+        return timed
+
+    def summary(self):
+        summary = {}
+        for stage, values in self.latencies.items():
+            ms = np.array(values) * 1000
+            summary[stage] = {
+                "count": len(ms),
+                "mean_ms": round(float(ms.mean()), 3),
+                "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                "p95_ms": round(float(np.percentile(ms, 95)), 3),
+                "p99_ms": round(float(np.percentile(ms, 99)), 3),
+            }
+        return summary
+
+def open_source(source):
+    """Open a video file or a directory of images"""
+    if os.path.isdir(source):
+        return ImageDirectoryCapture(source)
+    return cv2.VideoCapture(source)
+
+def replay_fast(cap, processor, timer, fps, sink, start_time):
+    """Push every frame through every stage on this thread, as fast as possible"""
+    gate = timer.wrap("motion_gate", processor.motion_gate)
+    detect = timer.wrap("detect", processor.detect_faces)
+    track = timer.wrap("track", processor.track_faces)
+    encode = timer.wrap("encode", processor.encode_and_match)
+    handle = timer.wrap("alert_decision", processor.handle_result)
+
+    frames = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames += 1
+        # Frames are stamped with video time from start_time, so dwell-time and
+        # day/night rules behave as they would have live
+        packet = FramePacket(frames, frame, start_time + frames / fps)
+        if gate(packet):
+            detect(packet)
+            if track(packet):
+                encode(packet)
+        sink.now = packet.captured_at
+        handle(packet)
+    return frames, 0
+
+def replay_realtime(cap, processor, timer, sink):
+    """Run the threaded pipeline on frames delivered at the source frame rate, like a live camera"""
+    pipeline = Pipeline(cap,
+                        timer.wrap("detect", processor.detect_faces),
+                        timer.wrap("encode", processor.encode_and_match),
+                        gate=timer.wrap("motion_gate", processor.motion_gate),
+                        track=timer.wrap("track", processor.track_faces),
+                        detect_workers=DETECT_WORKERS, encode_workers=ENCODE_WORKERS,
+                        queue_size=QUEUE_SIZE).start()
+    handle = timer.wrap("alert_decision", processor.handle_result)
+
+    frames = 0
+    while True:
+        packet = pipeline.get_result(timeout=0.1)
+        if packet is None:
+            if pipeline.failed:
+                break
+            continue
+        frames += 1
+        sink.now = packet.captured_at
+        handle(packet)
+    pipeline.stop()
+    return frames, pipeline.frames_dropped
+
+def replay(source, realtime=False, fps=None, max_frames=None, known_faces=None, start_time=None):
+    """Run the detection and alerting pipeline headlessly over recorded footage and return a report.
+
+    start_time is when the footage was recorded, in epoch seconds, and defaults
+    to now. Realtime replays always run on the wall clock, like a live camera.
+    """
+    source_cap = open_source(source)
+    if not source_cap.isOpened():
+        raise ValueError(f"Could not open {source}")
+    fps = fps or source_cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+    if start_time is None:
+        start_time = time.time()
+
+    timer = StageTimer()
+    sink = FakeAlertSink()
+    if known_faces is None:
+        known_faces = load_face_gallery()
+    processor = CameraProcessor(known_faces, send_alert=sink.send_alert, take_snapshot=sink.take_snapshot)
+    cap = ReplayCapture(source_cap, timer, fps=fps if realtime else None, max_frames=max_frames)
+
+    started = time.perf_counter()
+    if realtime:
+        frames, dropped = replay_realtime(cap, processor, timer, sink)
+    else:
+        frames, dropped = replay_fast(cap, processor, timer, fps, sink, start_time)
+    elapsed = time.perf_counter() - started
+    cap.release()
+
+    return {
+        "source": source,
+        "mode": "realtime" if realtime else "fast",
+        "source_fps": fps,
+        "frames_read": cap.frames_read,
+        "frames_processed": frames,
+        "frames_dropped": dropped,
+        "elapsed_s": round(elapsed, 3),
+        "fps": round(frames / elapsed, 2) if elapsed else 0.0,
+        "stages": timer.summary(),
+        "alerts": sink.alerts,
+    }
+
+def print_report(report):
+    print(f"\n📊 Replay of {report['source']} ({report['mode']})")
+    print(f"   {report['frames_processed']} of {report['frames_read']} frames processed in {report['elapsed_s']} s "
+          f"-> {report['fps']} FPS ({report['frames_dropped']} dropped)")
+    print(f"   {'stage':<16}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for stage, stats in report["stages"].items():
+        print(f"   {stage:<16}{stats['count']:>8}{stats['mean_ms']:>10}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    print(f"\n🔔 {len(report['alerts'])} alerts would have fired")
+    for fired in report["alerts"]:
+        print(f"   - {fired['message']} ({fired['snapshot']})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded footage through the surveillance pipeline")
+    parser.add_argument("source", help="Video file or directory of images")
+    parser.add_argument("--realtime", action="store_true",
+                        help="Feed frames at the source frame rate through the threaded pipeline "
+                             "(default: every frame, as fast as possible)")
+    parser.add_argument("--fps", type=float, help="Override the source frame rate")
+    parser.add_argument("--max-frames", type=int, help="Stop after this many frames")
+    parser.add_argument("--start", type=datetime.fromisoformat,
+                        help="When the footage was recorded, e.g. 2024-05-01T23:00, "
+                             "for the day/night rules (default: now)")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    # Only warnings by default, per-frame logging would skew the numbers
+    configure_logging(os.getenv("LOG_LEVEL", "WARNING"))
+    report = replay(args.source, realtime=args.realtime, fps=args.fps, max_frames=args.max_frames,
+                    start_time=args.start.timestamp() if args.start else None)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=4)
+
+if __name__ == "__main__":
+    main()
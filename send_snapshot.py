@@ -1,20 +1,8 @@
-import cv2
-import os
-import time
-from database import save_snapshot
-from alert import send_whatsapp_alert
-
-SNAPSHOT_DIR = "snapshots"
-
-# Ensure directory exists
-if not os.path.exists(SNAPSHOT_DIR):
-    os.makedirs(SNAPSHOT_DIR)
+from alert_system import send_alert_in_background
+from snapshot_service import get_snapshot_service
 
 def capture_and_send_snapshot(frame):
-    timestamp = time.strftime("%Y%m%d_%H%M%S")
-    filepath = os.path.join(SNAPSHOT_DIR, f"snapshot_{timestamp}.jpg")
-    cv2.imwrite(filepath, frame)  # Save snapshot
-    save_snapshot(filepath)  # Store in database
-
-    send_whatsapp_alert(f"🚨 High-threat detected! Snapshot saved at {filepath}")
+    # Written and registered in the database in the background
+    filepath = get_snapshot_service().save(frame, "snapshot")
+    send_alert_in_background(f"🚨 High-threat detected! Snapshot saved at {filepath}", filepath)
     print(f"[SNAPSHOT SAVED] {filepath}")
@@ -0,0 +1,356 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import cv2
+from flask import Flask, Response, abort, jsonify, render_template, send_file, send_from_directory, url_for
+from werkzeug.serving import make_server
+
+from alert_store import get_store
+from control import send_command
+from database import get_catalog, PAGE_SIZE
+from metrics import REGISTRY
+from stats_service import get_stats
+from thumbnails import existing_thumbnails
+
+logger = logging.getLogger(__name__)
+
+WEB_HOST = "127.0.0.1"
+WEB_PORT = 5001
+SNAPSHOT_DIR = "snapshots"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+# The live feed is sent at most this often, each frame is encoded once for every viewer
+FEED_FPS = 10
+FEED_QUALITY = 75
+
+RECENT_ALERTS = 10
+# The event watcher checks for new alerts and changed stats this often, on behalf of every viewer
+ALERT_POLL_INTERVAL = 1.0
+SYSTEM_INFO_INTERVAL = 5.0
+# Idle event streams send a comment this often so proxies keep them open
+KEEPALIVE_INTERVAL = 15.0
+# Events a slow viewer may fall behind by before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+def format_size(size):
+    if size < 1024:
+        return f"{size} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size / (1024 * 1024):.1f} MB"
+
+def format_uptime(first_alert):
+    if not first_alert:
+        return "00:00:00"
+    seconds = int(time.time() - first_alert)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def surveillance_status():
+    """The control channel's state, or stopped if no surveillance process is listening"""
+    try:
+        return send_command("status")
+    except OSError:
+        return {"running": False, "paused": False, "threshold": None}
+
+def alert_to_json(alert):
+    snapshot = alert["snapshot"]
+    return {
+        "id": alert["id"],
+        "timestamp": alert["timestamp"],
+        "message": alert["message"],
+        "snapshot": os.path.basename(snapshot) if snapshot else None,
+        "snapshot_exists": bool(snapshot) and os.path.exists(snapshot),
+    }
+
+class LiveFeed:
+    """JPEG frames for MJPEG viewers, read from a pipeline's latest-frame buffer.
+
+    Frames are only encoded while someone is watching, and each one only
+    once however many viewers there are.
+    """
+
+    def __init__(self, grabber, fps=FEED_FPS, quality=FEED_QUALITY):
+        self.grabber = grabber
+        self.interval = 1.0 / fps
+        self.quality = quality
+        self.viewers = 0
+        self._seq = 0
+        self._jpeg = None
+        self._lock = threading.Lock()
+        REGISTRY.gauge("feed_viewers", "Clients watching the MJPEG live feed", read=lambda: self.viewers)
+
+    def frame(self, last_seq=0, timeout=1.0):
+        """(seq, JPEG bytes) of a frame newer than last_seq, None if there is none yet"""
+        packet = self.grabber.read(last_seq, timeout=timeout)
+        if packet is None:
+            return None
+        with self._lock:
+            if packet.seq != self._seq:
+                ok, encoded = cv2.imencode(".jpg", packet.frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                if not ok:
+                    return None
+                self._seq, self._jpeg = packet.seq, encoded.tobytes()
+            return self._seq, self._jpeg
+
+    def stream(self):
+        """multipart/x-mixed-replace parts, newest frame only, at most fps a second"""
+        with self._lock:
+            self.viewers += 1
+        try:
+            last_seq = 0
+            # The grabber thread ends when the camera fails or the pipeline stops
+            while self.grabber.is_alive():
+                started = time.time()
+                frame = self.frame(last_seq)
+                if frame is None:
+                    continue
+                last_seq, jpeg = frame
+                yield (b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(jpeg)).encode() +
+                       b"\r\n\r\n" + jpeg + b"\r\n")
+                time.sleep(max(0.0, self.interval - (time.time() - started)))
+        finally:
+            with self._lock:
+                self.viewers -= 1
+
+class EventBroker:
+    """Fans server-sent events out to every connected dashboard.
+
+    One watcher thread looks for new alerts and changed system info and
+    publishes them, so the database work depends on how often things
+    happen, not on how many dashboards are open.
+    """
+
+    def __init__(self, store=None, stats=None):
+        self.store = store or get_store()
+        self.stats = stats or get_stats()
+        self.system_info = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        REGISTRY.gauge("event_subscribers", "Dashboards connected to the event stream",
+                       read=lambda: len(self._subscribers))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._watch, name="event-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def subscribe(self):
+        subscriber = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            # A viewer that stopped reading loses its oldest events rather than blocking everyone
+            while True:
+                try:
+                    subscriber.put_nowait(message)
+                    break
+                except queue.Full:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def read_system_info(self):
+        summary = self.stats.summary()
+        status = surveillance_status()
+        return {
+            "stats": {
+                "num_snapshots": summary["num_snapshots"],
+                "total_alerts": summary["total_alerts"],
+                "recent_alerts": summary["recent_alerts"],
+                "threat_alerts": summary["threat_alerts"],
+                "system_uptime": format_uptime(summary["first_alert"]),
+            },
+            "surveillance_active": status["running"] and not status["paused"],
+        }
+
+    def refresh_system_info(self):
+        """Publish system info if it changed since the last check"""
+        system_info = self.read_system_info()
+        previous, self.system_info = self.system_info, system_info
+        # Uptime changes every second, it is not a reason to push
+        if previous is None or ({**previous["stats"], "system_uptime": None} !=
+                                {**system_info["stats"], "system_uptime": None}
+                                or previous["surveillance_active"] != system_info["surveillance_active"]):
+            self.publish("system_info", system_info)
+
+    def _watch(self):
+        last_id = self.store.last_id()
+        last_info = 0.0
+        while not self._stop_event.wait(ALERT_POLL_INTERVAL):
+            try:
+                new_alerts = self.store.after(last_id)
+                for alert in new_alerts:
+                    self.publish("alert", alert_to_json(alert))
+                    last_id = alert["id"]
+                if not new_alerts and self.store.last_id() < last_id:
+                    # The alerts were cleared by another process
+                    last_id = self.store.last_id()
+                    self.publish("alerts", [])
+                if time.time() - last_info >= SYSTEM_INFO_INTERVAL:
+                    last_info = time.time()
+                    self.refresh_system_info()
+            except Exception as e:
+                logger.error(f"❌ Error watching for dashboard events: {str(e)}")
+
+    def stream(self):
+        """text/event-stream lines, starting with the current alerts and system info"""
+        subscriber = self.subscribe()
+        try:
+            recent = [alert_to_json(alert) for alert in reversed(self.store.last_n(RECENT_ALERTS))]
+            yield f"event: alerts\ndata: {json.dumps(recent)}\n\n"
+            if self.system_info is None:
+                self.system_info = self.read_system_info()
+            yield f"event: system_info\ndata: {json.dumps(self.system_info)}\n\n"
+            while True:
+                try:
+                    yield subscriber.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+def create_app(feed=None, broker=None, snapshot_dir=SNAPSHOT_DIR):
+    """The index.html dashboard and its API, feed is a LiveFeed or None when no camera runs here"""
+    app = Flask(__name__, template_folder=os.path.dirname(os.path.abspath(__file__)))
+    broker = broker or EventBroker().start()
+    snapshot_root = os.path.abspath(snapshot_dir)
+
+    def snapshot_file(filename):
+        path = os.path.join(snapshot_root, os.path.basename(filename))
+        if not os.path.isfile(path):
+            abort(404)
+        return path
+
+    @app.route("/")
+    def index():
+        system_info = broker.system_info or broker.read_system_info()
+        return render_template("index.html", stats=system_info["stats"],
+                               surveillance_active=system_info["surveillance_active"])
+
+    @app.route("/video_feed")
+    def video_feed():
+        if feed is None:
+            abort(404)
+        return Response(feed.stream(), mimetype="multipart/x-mixed-replace; boundary=frame",
+                        headers={"Cache-Control": "no-store"})
+
+    @app.route("/events")
+    def events():
+        return Response(broker.stream(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.route("/alerts")
+    def alerts():
+        return jsonify({"alerts": [alert_to_json(alert) for alert in reversed(broker.store.last_n(RECENT_ALERTS))]})
+
+    @app.route("/snapshots")
+    def snapshots():
+        rows = get_catalog().page(1, PAGE_SIZE, extensions=IMAGE_EXTENSIONS)
+        return jsonify({"snapshots": [{
+            "filename": os.path.basename(row["filepath"]),
+            "path": url_for("snapshot", filename=os.path.basename(row["filepath"])),
+            "timestamp": row["timestamp"],
+            "size": format_size(row["size"] or 0),
+        } for row in rows]})
+
+    @app.route("/snapshots/<path:filename>")
+    def snapshot(filename):
+        return send_from_directory(snapshot_root, os.path.basename(filename), max_age=3600)
+
+    @app.route("/latest_snapshot")
+    def latest_snapshot():
+        latest = get_catalog().latest(extensions=IMAGE_EXTENSIONS)
+        if latest is None:
+            abort(404)
+        return send_file(snapshot_file(latest["filepath"]), max_age=0)
+
+    @app.route("/system_info")
+    def system_info():
+        return jsonify(broker.read_system_info())
+
+    @app.route("/status")
+    def status():
+        return jsonify(surveillance_status())
+
+    @app.route("/toggle_surveillance", methods=["POST"])
+    def toggle_surveillance():
+        try:
+            state = send_command("status")
+            state = send_command("resume" if state["paused"] else "pause")
+        except OSError as e:
+            return jsonify({"success": False, "error": f"Surveillance is not running: {str(e)}"}), 503
+        broker.refresh_system_info()
+        return jsonify({"success": True, "surveillance_active": state["running"] and not state["paused"]})
+
+    @app.route("/delete_snapshot/<path:filename>")
+    def delete_snapshot(filename):
+        path = snapshot_file(filename)
+        for _, thumb_path in existing_thumbnails(path):
+            os.remove(thumb_path)
+        os.remove(path)
+        catalog = get_catalog()
+        # The catalog has the path the snapshot service wrote, relative to the working directory
+        catalog.delete(os.path.join(snapshot_dir, os.path.basename(path)))
+        catalog.flush(2.0)
+        broker.refresh_system_info()
+        return jsonify({"success": True})
+
+    @app.route("/clear_alerts")
+    def clear_alerts():
+        broker.store.clear()
+        broker.publish("alerts", [])
+        broker.refresh_system_info()
+        return jsonify({"success": True})
+
+    return app
+
+def start_web_server(port=WEB_PORT, host=WEB_HOST, feed=None):
+    """Serve the dashboard on http://host:port/ from a background thread, stop it with stop_web_server()"""
+    broker = EventBroker()
+    server = make_server(host, port, create_app(feed=feed, broker=broker), threaded=True)
+    server.broker = broker.start()
+    threading.Thread(target=server.serve_forever, name="web-server", daemon=True).start()
+    logger.info(f"🌐 Dashboard on http://{host}:{port}/")
+    return server
+
+def stop_web_server(server):
+    """Stop serving and stop the server's event watcher"""
+    server.shutdown()
+    server.server_close()
+    server.broker.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the index.html dashboard without a camera")
+    parser.add_argument("--host", default=WEB_HOST)
+    parser.add_argument("--port", type=int, default=WEB_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
+    logger.info(f"🌐 Dashboard on http://{args.host}:{args.port}/ (live feed needs run_camera(web_port=...))")
+    make_server(args.host, args.port, create_app(), threaded=True).serve_forever()
+
+if __name__ == "__main__":
+    main()
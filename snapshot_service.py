@@ -0,0 +1,181 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import cv2
+
+from database import save_snapshot
+from metrics import REGISTRY, stage_timer
+from thumbnails import THUMBNAIL_SIZES, write_thumbnails
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = "snapshots"
+# Snapshots are written here, inside SNAPSHOT_DIR, and renamed into place when complete
+INCOMING_DIR = ".incoming"
+SNAPSHOT_FORMAT = "jpg"
+SNAPSHOT_QUALITY = 90
+# Frames wider than this are downscaled before encoding, None keeps full resolution
+SNAPSHOT_MAX_WIDTH = None
+SNAPSHOT_WORKERS = 2
+
+ENCODE_PARAMS = {
+    "jpg": cv2.IMWRITE_JPEG_QUALITY,
+    "webp": cv2.IMWRITE_WEBP_QUALITY,
+}
+
+WRITE_SECONDS = stage_timer("snapshot_write")
+
+def fsync_file(path):
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+class SnapshotService:
+    """Encodes and writes snapshots on a thread pool so the capture loop never waits on disk.
+
+    save() returns the final path at once. The frame is kept by reference, so
+    the caller must not draw on it afterwards. Files are written under
+    <directory>/.incoming and renamed into place when complete, then
+    registered in the snapshot database and passed to every on_durable
+    listener. Images get their letterboxed thumbnails (thumbnails.py)
+    written before they appear, a failed thumbnail is logged and does not
+    cost the snapshot. Other media, like clips, use reserve_path() and
+    write().
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR, image_format=SNAPSHOT_FORMAT, quality=SNAPSHOT_QUALITY,
+                 max_width=SNAPSHOT_MAX_WIDTH, workers=SNAPSHOT_WORKERS, register=save_snapshot,
+                 thumbnail_sizes=THUMBNAIL_SIZES):
+        if image_format not in ENCODE_PARAMS:
+            raise ValueError(f"Unsupported snapshot format: {image_format}")
+        self.directory = directory
+        self.incoming_dir = os.path.join(directory, INCOMING_DIR)
+        self.image_format = image_format
+        self.quality = quality
+        self.max_width = max_width
+        self.thumbnail_sizes = thumbnail_sizes
+        self.register = register
+        self._listeners = []
+        self._pending = {}
+        self._reserved = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snapshot")
+        os.makedirs(self.incoming_dir, exist_ok=True)
+        REGISTRY.gauge("snapshots_pending", "Snapshots waiting to be written", read=lambda: len(self._pending))
+
+    def on_durable(self, listener):
+        """Call listener(path) after each file is written and registered"""
+        self._listeners.append(listener)
+        return self
+
+    def reserve_path(self, label, extension=None, camera=None):
+        """Pick a free path for a new file, e.g. snapshots/<camera>_<label>_<timestamp>.jpg"""
+        extension = extension or self.image_format
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        name = f"{camera}_{label}" if camera is not None else label
+        with self._lock:
+            path = os.path.join(self.directory, f"{name}_{timestamp}.{extension}")
+            suffix = 1
+            # Several files with the same label can land in the same second
+            while path in self._pending or path in self._reserved or os.path.exists(path):
+                path = os.path.join(self.directory, f"{name}_{timestamp}_{suffix}.{extension}")
+                suffix += 1
+            self._reserved.add(path)
+        return path
+
+    def write(self, path, write_file, label=None, camera=None):
+        """Run write_file(tmp_path) on the pool, then move the result to path and publish it"""
+        with self._lock:
+            self._reserved.discard(path)
+            future = self._pending[path] = self._executor.submit(self._write, write_file, path, label, camera)
+        future.add_done_callback(lambda future: self._finish(path))
+
+    def save(self, frame, label, camera=None):
+        """Queue frame for writing and return the path it will have"""
+        path = self.reserve_path(label, camera=camera)
+
+        def write_file(tmp_path):
+            self._encode_image(frame, tmp_path)
+            # Thumbnails exist by the time the snapshot itself appears, but a snapshot
+            # without them is still worth keeping, the gallery falls back to the full image
+            try:
+                write_thumbnails(frame, path, self.thumbnail_sizes)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not write thumbnails for {path}: {str(e)}")
+
+        self.write(path, write_file, label=label, camera=camera)
+        return path
+
+    def _encode_image(self, frame, tmp_path):
+        if self.max_width and frame.shape[1] > self.max_width:
+            height = round(frame.shape[0] * self.max_width / frame.shape[1])
+            frame = cv2.resize(frame, (self.max_width, height), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(f".{self.image_format}", frame, [ENCODE_PARAMS[self.image_format], self.quality])
+        if not ok:
+            raise IOError(f"Could not encode {tmp_path}")
+        with open(tmp_path, "wb") as f:
+            f.write(encoded.tobytes())
+
+    def _write(self, write_file, path, label, camera):
+        tmp_path = os.path.join(self.incoming_dir, os.path.basename(path))
+        try:
+            with WRITE_SECONDS.time():
+                write_file(tmp_path)
+                fsync_file(tmp_path)
+                os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if self.register is not None:
+            try:
+                self.register(path, label=label, camera=camera, size=os.path.getsize(path))
+            except Exception as e:
+                logger.error(f"❌ Error registering snapshot {path}: {str(e)}")
+        for listener in self._listeners:
+            try:
+                listener(path)
+            except Exception as e:
+                logger.error(f"❌ Error notifying snapshot listener: {str(e)}")
+
+    def _finish(self, path):
+        with self._lock:
+            future = self._pending.pop(path, None)
+        if future is not None and future.exception() is not None:
+            logger.error(f"❌ Error writing snapshot {path}: {str(future.exception())}")
+
+    def wait(self, path, timeout=None):
+        """Block until path is on disk, returns False if writing it failed or timed out.
+
+        Paths written by another process are polled for, since files only
+        appear under their final name once they are complete.
+        """
+        with self._lock:
+            future = self._pending.get(path)
+        if future is None:
+            deadline = time.monotonic() + (timeout or 0)
+            while not os.path.exists(path) and time.monotonic() < deadline:
+                time.sleep(0.05)
+            return os.path.exists(path)
+        try:
+            future.result(timeout=timeout)
+        except Exception:
+            return False
+        return True
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_snapshot_service():
+    """The process-wide snapshot service"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = SnapshotService()
+        return _service
@@ -0,0 +1,137 @@
+import sqlite3
+import threading
+import time
+
+STATS_DB = "stats.db"
+HOUR = 3600
+# Hourly buckets older than this are dropped, the dashboard only looks back a day
+BUCKET_RETENTION_HOURS = 48
+
+ALERTS = "alerts"
+THREAT_ALERTS = "threat_alerts"
+SNAPSHOTS = "snapshots"
+# Clips share the snapshot catalog but are not counted as snapshots
+SNAPSHOT_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+class StatsService:
+    """Dashboard counters kept up to date by the alert and snapshot writers.
+
+    Totals live in a counters table and recent activity in hourly buckets,
+    so summary() reads a handful of rows however much history exists.
+    rebuild() recomputes everything from the alert store and the snapshot
+    catalog, which the dashboard does once when the stats are new.
+    """
+
+    def __init__(self, path=STATS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT NOT NULL,
+                hour INTEGER NOT NULL,
+                value INTEGER NOT NULL,
+                PRIMARY KEY (name, hour)
+            )
+        """)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL)")
+
+    def _count(self, name, amount):
+        self._conn.execute("INSERT INTO counters (name, value) VALUES (?, ?) "
+                           "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value", (name, amount))
+
+    def _bucket(self, name, at, amount):
+        self._conn.execute("INSERT INTO buckets (name, hour, value) VALUES (?, ?, ?) "
+                           "ON CONFLICT (name, hour) DO UPDATE SET value = value + excluded.value",
+                           (name, int(at // HOUR), amount))
+
+    def adjust(self, name, amount=1):
+        """Add amount to a running total, e.g. adjust(SNAPSHOTS, -1) for a deleted snapshot"""
+        with self._lock:
+            self._count(name, amount)
+
+    def record_alert(self, message, at=None):
+        at = time.time() if at is None else at
+        names = (ALERTS, THREAT_ALERTS) if "threat" in message.lower() else (ALERTS,)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            for name in names:
+                self._count(name, 1)
+                self._bucket(name, at, 1)
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('first_alert', ?) "
+                               "ON CONFLICT (key) DO UPDATE SET value = MIN(value, excluded.value)", (at,))
+            self._conn.execute("DELETE FROM buckets WHERE hour < ?", (int(at // HOUR) - BUCKET_RETENTION_HOURS,))
+            self._conn.execute("COMMIT")
+
+    def reset_alerts(self):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM counters WHERE name IN (?, ?)", (ALERTS, THREAT_ALERTS))
+            self._conn.execute("DELETE FROM buckets WHERE name IN (?, ?)", (ALERTS, THREAT_ALERTS))
+            self._conn.execute("DELETE FROM meta WHERE key = 'first_alert'")
+            self._conn.execute("COMMIT")
+
+    def _counter(self, name):
+        row = self._conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def _recent(self, name, hours, now):
+        # Hourly buckets, so "last 24 hours" starts at the top of the hour a day ago
+        row = self._conn.execute("SELECT COALESCE(SUM(value), 0) FROM buckets WHERE name = ? AND hour > ?",
+                                 (name, int(now // HOUR) - hours)).fetchone()
+        return row[0]
+
+    def summary(self, now=None):
+        """Totals, last-24-hour alerts and the first alert time (epoch seconds or None)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            first_alert = self._conn.execute("SELECT value FROM meta WHERE key = 'first_alert'").fetchone()
+            return {
+                "total_alerts": self._counter(ALERTS),
+                "recent_alerts": self._recent(ALERTS, 24, now),
+                "threat_alerts": self._counter(THREAT_ALERTS),
+                "num_snapshots": self._counter(SNAPSHOTS),
+                "first_alert": first_alert[0] if first_alert else None,
+            }
+
+    def is_built(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM meta WHERE key = 'built'").fetchone() is not None
+
+    def rebuild(self, alert_store, catalog):
+        """Recompute every counter from the alert store and the snapshot catalog"""
+        now = time.time()
+        recent = alert_store.range(start=now - BUCKET_RETENTION_HOURS * HOUR)
+        first_alert = alert_store.first()
+        totals = {
+            ALERTS: alert_store.count(),
+            THREAT_ALERTS: alert_store.count(contains="threat"),
+            SNAPSHOTS: catalog.count(extensions=SNAPSHOT_EXTENSIONS),
+        }
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM counters")
+            self._conn.execute("DELETE FROM buckets")
+            self._conn.execute("DELETE FROM meta")
+            self._conn.executemany("INSERT INTO counters (name, value) VALUES (?, ?)", totals.items())
+            for alert in recent:
+                for name in (ALERTS, THREAT_ALERTS) if "threat" in alert["message"].lower() else (ALERTS,):
+                    self._bucket(name, alert["created_at"], 1)
+            if first_alert:
+                self._conn.execute("INSERT INTO meta (key, value) VALUES ('first_alert', ?)",
+                                   (first_alert["created_at"],))
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('built', ?)", (now,))
+            self._conn.execute("COMMIT")
+
+_stats = None
+_stats_lock = threading.Lock()
+
+def get_stats():
+    """The process-wide stats service"""
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = StatsService()
+        return _stats
@@ -0,0 +1,308 @@
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import queue
+import re
+import time
+from datetime import datetime
+from multiprocessing import shared_memory
+import numpy as np
+
+from face_detection import FaceGallery, load_face_gallery
+from face_index import IVFIndex
+from alert_system import send_alert_in_background
+from main import configure_logging, run_camera
+from control import ControlChannel
+from metrics import REGISTRY, METRICS_PORT, start_http_server
+
+logger = logging.getLogger(__name__)
+
+CAMERAS_FILE = "cameras.json"
+STATUS_FILE = "camera_status.json"
+STATUS_INTERVAL = 5.0
+
+# A worker that has not reported stats for this long is considered hung
+HEARTBEAT_TIMEOUT = 30.0
+MAX_RESTART_DELAY = 60.0
+# A worker that reports heartbeats for this long after a restart starts its restart backoff over
+HEALTHY_PERIOD = 300.0
+
+# Arrays in the shared gallery block start on cache line boundaries
+SHARED_ALIGNMENT = 64
+
+def load_cameras(path=CAMERAS_FILE):
+    """Read the camera list, e.g. {"cameras": [{"id": "front_door", "source": 0}]}.
+
+    `source` is a device index, an RTSP URL or a video file path.
+    """
+    with open(path, "r") as f:
+        config = json.load(f)
+    cameras = config.get("cameras", [])
+    for i, camera in enumerate(cameras):
+        camera.setdefault("id", f"camera_{i}")
+    return cameras
+
+def share_gallery(gallery):
+    """Copy the gallery matrix and its index arrays into one shared memory block.
+
+    Returns the block and a picklable spec for attach_gallery(). An IVF index
+    is rebuilt in each worker on top of the shared arrays, brute force on top
+    of the shared matrix, so no worker holds a private copy of either.
+    """
+    arrays = {"encodings": gallery.encodings}
+    index_spec = None
+    if isinstance(gallery.index, IVFIndex):
+        arrays.update({f"ivf_{name}": array for name, array in gallery.index.arrays().items()})
+        index_spec = {"kind": IVFIndex.kind, "n_probe": gallery.index.n_probe}
+
+    layout = {}
+    size = 0
+    for name, array in arrays.items():
+        size = -(-size // SHARED_ALIGNMENT) * SHARED_ALIGNMENT
+        layout[name] = (size, array.shape, array.dtype.str)
+        size += array.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+    for name, array in arrays.items():
+        offset, shape, dtype = layout[name]
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = array
+    spec = {"shm_name": shm.name, "arrays": layout, "names": gallery.names, "index": index_spec}
+    return shm, spec
+
+def attach_gallery(spec):
+    """Build a FaceGallery whose matrix and index read straight from shared memory.
+
+    The gallery keeps the block open, it is closed when the gallery is
+    garbage collected, i.e. once no pipeline thread is matching against it.
+    """
+    shm = shared_memory.SharedMemory(name=spec["shm_name"])
+    arrays = {}
+    for name, (offset, shape, dtype) in spec["arrays"].items():
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        arrays[name].flags.writeable = False
+    index = None
+    if spec["index"] is not None:
+        index = IVFIndex.from_arrays(n_probe=spec["index"]["n_probe"],
+                                     **{name[len("ivf_"):]: array for name, array in arrays.items()
+                                        if name.startswith("ivf_")})
+    gallery = FaceGallery(arrays["encodings"], spec["names"], index=index)
+    gallery.shared_memory = shm
+    return gallery
+
+def camera_worker(camera, gallery_spec, events, commands, control_state):
+    """Process entry point: run one camera and report alerts and stats to the supervisor"""
+    configure_logging()
+
+    camera_id = camera["id"]
+    control = ControlChannel(port=None, command_queue=commands, state=control_state).start()
+
+    def load_gallery(message):
+        # The supervisor loads and shares the new gallery, workers only attach to it
+        return attach_gallery(message["gallery"])
+
+    def send_alert(message, snapshot_path=None):
+        events.put({"type": "alert", "camera_id": camera_id, "message": message, "snapshot": snapshot_path})
+
+    def on_stats(stats):
+        events.put({"type": "stats", "camera_id": camera_id, "time": time.time(), **stats})
+
+    try:
+        completed = run_camera(camera["source"], camera_id=camera_id, known_faces=attach_gallery(gallery_spec),
+                               send_alert=send_alert, show=camera.get("show", False), on_stats=on_stats,
+                               control=control, metrics_port=camera.get("metrics_port"),
+                               motion_settings=camera.get("motion"), clip_settings=camera.get("clips"),
+                               alert_settings=camera.get("alerts"), web_port=camera.get("web_port"),
+                               load_gallery=load_gallery)
+    finally:
+        control.stop()
+    raise SystemExit(0 if completed else 1)
+
+class CameraSupervisor:
+    """Runs one worker process per camera, restarts crashed ones and dispatches their alerts"""
+
+    def __init__(self, cameras, gallery=None, send_alert=send_alert_in_background):
+        self.cameras = {camera["id"]: camera for camera in cameras}
+        self.gallery = gallery if gallery is not None else load_face_gallery()
+        self.send_alert = send_alert
+        self.context = mp.get_context("spawn")
+        self.events = self.context.Queue()
+        self.commands = {camera_id: self.context.Queue() for camera_id in self.cameras}
+        self.control = ControlChannel().on("*", self._forward_command).on("reload_faces", self.reload_gallery)
+        self.processes = {}
+        self.health = {
+            camera_id: {"source": camera["source"], "alive": False, "fps": 0.0, "frames_dropped": 0,
+                        "last_heartbeat": None, "restarts": 0, "crashes": 0, "next_start": 0.0,
+                        "finished": False}
+            for camera_id, camera in self.cameras.items()
+        }
+        for camera_id, health in self.health.items():
+            metric_id = re.sub(r"\W", "_", camera_id)
+            REGISTRY.gauge(f"camera_{metric_id}_up", f"Whether the worker for camera {camera_id} is running",
+                           read=lambda health=health: int(health["alive"]))
+            REGISTRY.gauge(f"camera_{metric_id}_fps", f"Frames per second processed by camera {camera_id}",
+                           read=lambda health=health: health["fps"])
+            REGISTRY.gauge(f"camera_{metric_id}_restarts", f"Worker restarts for camera {camera_id}",
+                           read=lambda health=health: health["restarts"])
+        self.shm = None
+        self.gallery_spec = None
+        self._retired_shm = None
+        self._stopping = False
+
+    def start(self):
+        self.shm, self.gallery_spec = share_gallery(self.gallery)
+        self.control.start()
+        for camera_id in self.cameras:
+            self._start_worker(camera_id)
+        return self
+
+    def _start_worker(self, camera_id):
+        process = self.context.Process(target=camera_worker, name=f"camera-{camera_id}",
+                                       args=(self.cameras[camera_id], self.gallery_spec, self.events,
+                                             self.commands[camera_id], self.control.state()),
+                                       daemon=True)
+        process.start()
+        self.processes[camera_id] = process
+        health = self.health[camera_id]
+        health["alive"] = True
+        health["started"] = time.time()
+        health["last_heartbeat"] = None
+        logger.info(f"📸 Started worker for camera {camera_id} (pid {process.pid})")
+
+    def _forward_command(self, message):
+        """Fan a control command out to every camera worker, reloads go through reload_gallery()"""
+        if message["command"] == "reload_faces":
+            return
+        for commands in self.commands.values():
+            commands.put(message)
+
+    def reload_gallery(self, message=None):
+        """Load the gallery from disk once, share it and switch every worker over to it"""
+        gallery = load_face_gallery()
+        shm, spec = share_gallery(gallery)
+        # Keep the previous block until the next reload, so a worker still starting up can attach to it
+        self._unlink(self._retired_shm)
+        self._retired_shm = self.shm
+        self.gallery, self.shm, self.gallery_spec = gallery, shm, spec
+        for commands in self.commands.values():
+            commands.put({"command": "reload_faces", "gallery": spec})
+        logger.info(f"🔄 Shared {len(gallery)} known face encodings with the camera workers")
+
+    @staticmethod
+    def _unlink(shm):
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    def _handle_event(self, event):
+        camera_id = event["camera_id"]
+        if event["type"] == "alert":
+            self.send_alert(event["message"], event["snapshot"])
+        elif event["type"] == "stats":
+            health = self.health[camera_id]
+            health["fps"] = round(event["fps"], 2)
+            health["frames_dropped"] = event["frames_dropped"]
+            health["last_heartbeat"] = event["time"]
+
+    def _check_workers(self):
+        now = time.time()
+        for camera_id, process in list(self.processes.items()):
+            health = self.health[camera_id]
+            if health["finished"]:
+                continue
+
+            last_seen = health["last_heartbeat"] or health["started"]
+            if process.is_alive() and now - last_seen > HEARTBEAT_TIMEOUT:
+                logger.warning(f"⚠️ Camera {camera_id} stopped reporting, restarting it")
+                process.terminate()
+                process.join(timeout=5)
+
+            if process.is_alive():
+                # restarts stays cumulative for status and metrics, the backoff only counts recent crashes
+                if (health["crashes"] and health["last_heartbeat"]
+                        and health["last_heartbeat"] - health["started"] >= HEALTHY_PERIOD):
+                    health["crashes"] = 0
+                continue
+
+            if health["alive"]:
+                health["alive"] = False
+                health["fps"] = 0.0
+                if process.exitcode == 0:
+                    logger.info(f"🚨 Camera {camera_id} stopped")
+                    health["finished"] = True
+                    continue
+                delay = min(MAX_RESTART_DELAY, 2 ** health["crashes"])
+                health["next_start"] = now + delay
+                logger.error(f"❌ Camera {camera_id} worker exited with code {process.exitcode}, restarting in {delay}s")
+
+            if now >= health["next_start"]:
+                health["restarts"] += 1
+                health["crashes"] += 1
+                self._start_worker(camera_id)
+
+    def status(self):
+        """Per-camera health: alive, fps, frames dropped, last heartbeat and restart count"""
+        return {
+            camera_id: {
+                "source": health["source"],
+                "alive": health["alive"],
+                "fps": health["fps"],
+                "frames_dropped": health["frames_dropped"],
+                "restarts": health["restarts"],
+                "last_heartbeat": (datetime.fromtimestamp(health["last_heartbeat"]).strftime("%Y-%m-%d %H:%M:%S")
+                                   if health["last_heartbeat"] else None),
+            }
+            for camera_id, health in self.health.items()
+        }
+
+    def _write_status(self):
+        with open(STATUS_FILE, "w") as f:
+            json.dump(self.status(), f, indent=4)
+
+    def run(self):
+        """Dispatch events and watch workers until every camera has stopped"""
+        last_status = 0
+        try:
+            while not self._stopping and not all(h["finished"] for h in self.health.values()):
+                try:
+                    self._handle_event(self.events.get(timeout=0.5))
+                except queue.Empty:
+                    pass
+                self._check_workers()
+                if time.time() - last_status >= STATUS_INTERVAL:
+                    self._write_status()
+                    last_status = time.time()
+        except KeyboardInterrupt:
+            logger.info("Stopping cameras...")
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stopping = True
+        self.control.stop()
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join(timeout=5)
+        self._unlink(self.shm)
+        self._unlink(self._retired_shm)
+        self.shm = self._retired_shm = None
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the surveillance pipeline on several cameras")
+    parser.add_argument("--config", default=CAMERAS_FILE, help="JSON file with the camera list")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="Port for the supervisor's Prometheus metrics (cameras use their own metrics_port)")
+    args = parser.parse_args()
+
+    configure_logging()
+    start_http_server(args.metrics_port)
+    logger.info("🔄 Initializing surveillance system...")
+    cameras = load_cameras(args.config)
+    if not cameras:
+        logger.error(f"❌ Error: No cameras configured in {args.config}")
+        return
+    CameraSupervisor(cameras).start().run()
+
+if __name__ == "__main__":
+    main()
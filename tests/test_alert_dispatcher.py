@@ -0,0 +1,128 @@
+import importlib
+import json
+import time
+
+import pytest
+
+from alert_dispatcher import AlertDispatcher
+from fakes import FakeTwilioServer
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeTwilioServer().start()
+    monkeypatch.setenv("TWILIO_API_URL", server.url)
+    monkeypatch.setenv("TWILIO_ACCOUNT_SID", "ACtest")
+    monkeypatch.setenv("TWILIO_AUTH_TOKEN", "token")
+    monkeypatch.setenv("TWILIO_WHATSAPP_NUMBER", "+15550001111")
+    monkeypatch.setenv("RECIPIENT_WHATSAPP_NUMBER", "+15550002222")
+    yield server
+    server.stop()
+
+@pytest.fixture
+def send_whatsapp_alert(server):
+    # alert.py builds its client on import, from the environment set above
+    import alert
+    return importlib.reload(alert).send_whatsapp_alert
+
+@pytest.fixture
+def spool_file(tmp_path):
+    return str(tmp_path / "alerts_dead_letter.jsonl")
+
+def spooled(spool_file):
+    try:
+        with open(spool_file) as f:
+            return [json.loads(line) for line in f]
+    except FileNotFoundError:
+        return []
+
+def test_failed_delivery_is_retried_with_backoff(server, send_whatsapp_alert, spool_file):
+    server.fail_next(2)
+    dispatcher = AlertDispatcher(send_whatsapp_alert, workers=1, base_delay=0.05, spool_file=spool_file).start()
+    dispatcher.submit("Unknown person at the door")
+
+    assert wait_for(lambda: server.sent)
+    dispatcher.shutdown()
+    assert server.requests == 3
+    assert [message["body"] for message in server.sent] == ["Unknown person at the door"]
+    assert server.sent[0]["to"] == "whatsapp:+15550002222"
+    assert spooled(spool_file) == []
+
+def test_alert_is_spooled_after_the_last_attempt(server, send_whatsapp_alert, spool_file):
+    server.fail_next(3)
+    dispatcher = AlertDispatcher(send_whatsapp_alert, workers=1, max_attempts=3, base_delay=0.01,
+                                 spool_file=spool_file).start()
+    dispatcher.submit("Threat detected")
+
+    assert wait_for(lambda: spooled(spool_file))
+    dispatcher.shutdown()
+    assert server.requests == 3
+    assert server.sent == []
+    assert spooled(spool_file)[0]["message"] == "Threat detected"
+
+def test_alerts_are_spooled_when_the_queue_is_full(server, send_whatsapp_alert, spool_file):
+    server.latency = 0.5
+    dispatcher = AlertDispatcher(send_whatsapp_alert, workers=1, queue_size=1, spool_file=spool_file).start()
+    assert dispatcher.submit("first")
+    # The worker is busy sending the first alert, the second fills the queue
+    assert wait_for(lambda: dispatcher.queue.qsize() == 0)
+    assert dispatcher.submit("second")
+    assert not dispatcher.submit("third")
+
+    assert [(alert["message"], alert["reason"]) for alert in spooled(spool_file)] == \
+        [("third", "dispatch queue is full")]
+    dispatcher.shutdown()
+    assert [message["body"] for message in server.sent] == ["first", "second"]
+
+def test_spooled_alerts_are_replayed_on_restart(server, send_whatsapp_alert, spool_file):
+    server.fail_next(2)
+    recorded = []
+    dispatcher = AlertDispatcher(send_whatsapp_alert, record=recorded.append, workers=1, max_attempts=1,
+                                 spool_file=spool_file).start()
+    dispatcher.submit("one")
+    dispatcher.submit("two")
+    assert wait_for(lambda: len(spooled(spool_file)) == 2)
+    dispatcher.shutdown()
+    assert server.sent == []
+    assert len(recorded) == 2
+
+    restarted = AlertDispatcher(send_whatsapp_alert, record=recorded.append, workers=1,
+                                spool_file=spool_file).start()
+    assert wait_for(lambda: len(server.sent) == 2)
+    restarted.shutdown()
+    assert sorted(message["body"] for message in server.sent) == ["one", "two"]
+    # Both were recorded before their first attempt, the replay does not record them again
+    assert len(recorded) == 2
+    assert spooled(spool_file) == []
+
+def test_shutdown_delivers_queued_alerts(server, send_whatsapp_alert, spool_file):
+    server.latency = 0.05
+    dispatcher = AlertDispatcher(send_whatsapp_alert, workers=2, spool_file=spool_file).start()
+    for i in range(10):
+        assert dispatcher.submit(f"alert {i}")
+
+    dispatcher.shutdown(timeout=10.0)
+    assert sorted(message["body"] for message in server.sent) == sorted(f"alert {i}" for i in range(10))
+    assert spooled(spool_file) == []
+    # Alerts raised after shutdown go straight to the spool
+    assert not dispatcher.submit("late")
+    assert [alert["message"] for alert in spooled(spool_file)] == ["late"]
+
+def test_shutdown_spools_what_it_cannot_deliver_in_time(server, send_whatsapp_alert, spool_file):
+    server.latency = 0.3
+    dispatcher = AlertDispatcher(send_whatsapp_alert, workers=1, spool_file=spool_file).start()
+    for i in range(10):
+        dispatcher.submit(f"alert {i}")
+
+    dispatcher.shutdown(timeout=0.5)
+    delivered = {message["body"] for message in server.sent}
+    left = {alert["message"] for alert in spooled(spool_file)}
+    assert delivered and left
+    assert delivered | left == {f"alert {i}" for i in range(10)}
@@ -0,0 +1,58 @@
+import json
+import queue
+import socket
+import time
+
+import pytest
+
+from control import ControlChannel, send_command
+
+INVALID_MESSAGES = [
+    {"command": "set_threshold", "value": None},
+    {"command": "set_threshold", "value": [0.5]},
+    {"command": "set_threshold", "value": "close"},
+    {"command": "set_threshold", "value": "nan"},
+    {"command": "set_threshold"},
+    {"command": "explode"},
+    {"value": 0.5},
+    ["pause"],
+    "pause",
+    None,
+]
+
+@pytest.mark.parametrize("message", INVALID_MESSAGES)
+def test_apply_rejects_invalid_messages_with_value_error(message):
+    channel = ControlChannel(port=None)
+    with pytest.raises(ValueError):
+        channel.apply(message)
+    assert channel.threshold is None
+
+def test_queue_reader_survives_invalid_messages():
+    commands = queue.Queue()
+    channel = ControlChannel(port=None, command_queue=commands).start()
+    for message in INVALID_MESSAGES:
+        commands.put(message)
+    commands.put({"command": "set_threshold", "value": "0.45"})
+    commands.put({"command": "pause"})
+
+    deadline = time.time() + 5
+    while not channel.paused and time.time() < deadline:
+        time.sleep(0.01)
+    channel.stop()
+    assert channel.paused
+    assert channel.threshold == 0.45
+
+def test_socket_replies_with_an_error_and_keeps_the_connection():
+    channel = ControlChannel(port=0).start()
+    port = channel._server.server_address[1]
+    lines = [json.dumps(message) for message in INVALID_MESSAGES] + ["not json", json.dumps({"command": "pause"})]
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as sock:
+        sock.sendall(("\n".join(lines) + "\n").encode())
+        sock.shutdown(socket.SHUT_WR)
+        replies = [json.loads(line) for line in sock.makefile("r")]
+
+    assert len(replies) == len(lines)
+    assert all("error" in reply for reply in replies[:-1])
+    assert replies[-1]["paused"] is True
+    assert send_command("status", port=port)["paused"] is True
+    channel.stop()
@@ -0,0 +1,108 @@
+import sqlite3
+import threading
+
+import pytest
+
+from alert_store import AlertStore
+from database import SnapshotCatalog
+from stats_service import StatsService
+
+class FlakyConnection:
+    """Wraps the writer's connection and takes the statements to fail, once each, from fail"""
+
+    def __init__(self, conn, fail):
+        self.conn = conn
+        self.fail = fail
+
+    @property
+    def in_transaction(self):
+        return self.conn.in_transaction
+
+    def execute(self, sql, params=()):
+        if sql in self.fail:
+            self.fail.remove(sql)
+            raise sqlite3.OperationalError("database is locked")
+        return self.conn.execute(sql, params)
+
+    def close(self):
+        self.conn.close()
+
+@pytest.fixture
+def catalog(tmp_path):
+    return SnapshotCatalog(str(tmp_path / "snapshots.db"), write_interval=0.01)
+
+def fail_writer(catalog, monkeypatch, *statements):
+    connection = catalog.connection
+    fail = list(statements)
+    flaky = {}
+
+    def writer_connection():
+        conn = connection()
+        if threading.current_thread().name != "snapshot-catalog":
+            return conn
+        if conn not in flaky:
+            flaky.clear()
+            flaky[conn] = FlakyConnection(conn, fail)
+        return flaky[conn]
+
+    monkeypatch.setattr(catalog, "connection", writer_connection)
+
+def test_batch_is_written_one_by_one_when_begin_fails(catalog, monkeypatch):
+    fail_writer(catalog, monkeypatch, "BEGIN")
+    catalog.add("/snapshots/a.jpg")
+    catalog.add("/snapshots/b.jpg")
+
+    # ROLLBACK fails too, there is no transaction to roll back
+    assert catalog.flush(5.0)
+    assert catalog.count() == 2
+
+def test_batch_is_dropped_when_rollback_fails(catalog, monkeypatch):
+    fail_writer(catalog, monkeypatch, "COMMIT", "ROLLBACK")
+    catalog.add("/snapshots/a.jpg")
+
+    assert not catalog.flush(5.0)
+    assert catalog.lost_writes == 1
+    assert catalog.count() == 0
+
+    # The writer is still running, on a fresh connection
+    catalog.add("/snapshots/b.jpg")
+    assert catalog.flush(5.0)
+    assert catalog.get("/snapshots/b.jpg") is not None
+
+def test_bad_write_is_lost_alone(catalog):
+    catalog.add("/snapshots/a.jpg")
+    catalog._write("INSERT INTO missing_table VALUES (?)", (1,))
+    catalog.add("/snapshots/b.jpg")
+
+    assert not catalog.flush(5.0)
+    assert catalog.count() == 2
+    assert catalog.flush(5.0)
+
+def test_snapshot_count_follows_committed_images(tmp_path):
+    stats = StatsService(str(tmp_path / "stats.db"))
+    catalog = SnapshotCatalog(str(tmp_path / "snapshots.db"), write_interval=0.01, stats=stats)
+    catalog.add("/snapshots/a.jpg")
+    catalog.add("/snapshots/b.png")
+    catalog.add("/clips/motion.mp4")
+    assert catalog.flush(5.0)
+    assert stats.summary()["num_snapshots"] == 2
+
+    catalog.delete("/snapshots/a.jpg")
+    catalog.delete("/snapshots/never_added.jpg")
+    catalog.delete("/clips/motion.mp4")
+    assert catalog.flush(5.0)
+    assert stats.summary()["num_snapshots"] == 1
+
+    catalog.add("/clips/person.mp4")
+    assert catalog.flush(5.0)
+    stats.rebuild(AlertStore(str(tmp_path / "alerts.db"), legacy_file=str(tmp_path / "alerts.json")), catalog)
+    assert stats.summary()["num_snapshots"] == 1
+
+def test_lost_write_is_not_counted(tmp_path, monkeypatch):
+    stats = StatsService(str(tmp_path / "stats.db"))
+    catalog = SnapshotCatalog(str(tmp_path / "snapshots.db"), write_interval=0.01, stats=stats)
+    fail_writer(catalog, monkeypatch, "COMMIT", "ROLLBACK")
+    catalog.add("/snapshots/a.jpg")
+
+    assert not catalog.flush(5.0)
+    assert stats.summary()["num_snapshots"] == 0
@@ -0,0 +1,64 @@
+import time
+
+import numpy as np
+
+from pipeline import Pipeline
+
+class StaticCapture:
+    """A camera looking at a scene where nothing moves"""
+
+    def __init__(self, fps=100):
+        self.interval = 1.0 / fps
+        self.frame = np.zeros((48, 64, 3), dtype=np.uint8)
+
+    def read(self):
+        time.sleep(self.interval)
+        return True, self.frame
+
+def run_pipeline(pipeline, seconds):
+    results = []
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        packet = pipeline.get_result(timeout=0.1)
+        if packet is not None:
+            results.append(packet)
+    pipeline.stop()
+    return results
+
+def test_periodic_full_frame_pass_reaches_the_output_on_a_static_scene():
+    # Like CameraProcessor.motion_gate without motion: detection only every 0.2s
+    last_pass = [0.0]
+
+    def gate(packet):
+        if packet.captured_at - last_pass[0] >= 0.2:
+            last_pass[0] = packet.captured_at
+            return True
+        return False
+
+    def detect(packet):
+        time.sleep(0.05)
+        packet.face_locations = [(10, 30, 30, 10)]
+
+    pipeline = Pipeline(StaticCapture(), detect, lambda packet: None, gate=gate).start()
+    results = run_pipeline(pipeline, 2.0)
+
+    detected = [packet for packet in results if not packet.detection_skipped]
+    assert len(detected) >= 5
+    assert all(packet.face_locations for packet in detected)
+    assert any(packet.detection_skipped for packet in results)
+
+def test_results_never_go_back_past_a_detection():
+    def detect(packet):
+        time.sleep(0.02)
+
+    pipeline = Pipeline(StaticCapture(), detect, lambda packet: None,
+                        gate=lambda packet: packet.seq % 3 == 0).start()
+    results = run_pipeline(pipeline, 1.0)
+
+    last_detected = 0
+    for packet in results:
+        if packet.detection_skipped:
+            assert packet.seq > last_detected
+        else:
+            assert packet.seq > last_detected
+            last_detected = packet.seq
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+# replay runs the real detection stages
+pytest.importorskip("face_recognition")
+
+from fakes import FakeAlertSink
+from main import CameraProcessor, UNKNOWN_DWELL_SECONDS
+from replay import StageTimer, replay_fast
+
+FACE = (10, 50, 50, 10)
+
+class FrameList:
+    def __init__(self, frames):
+        self.frames = list(frames)
+
+    def read(self):
+        if not self.frames:
+            return False, None
+        return True, self.frames.pop(0)
+
+def replay_lingering_stranger(start_time):
+    """Replay one frame of an unknown face that has been around longer than the dwell time"""
+    sink = FakeAlertSink()
+    processor = CameraProcessor(None, send_alert=sink.send_alert, take_snapshot=sink.take_snapshot)
+    for seconds_ago in range(UNKNOWN_DWELL_SECONDS + 1, -1, -1):
+        track, = processor.tracker.update([FACE], start_time - seconds_ago)
+    processor.tracker.set_identity(track, "unknown", 0.9, FACE, start_time)
+
+    replay_fast(FrameList([np.zeros((120, 160, 3), dtype=np.uint8)]), processor, StageTimer(), 10.0, sink,
+                start_time)
+    return sink.alerts
+
+def test_replay_of_night_footage_raises_a_high_threat():
+    start_time = datetime(2024, 5, 1, 23, 0).timestamp()
+
+    alerts = replay_lingering_stranger(start_time)
+    assert [fired["message"] for fired in alerts] == ["Very high Threat detected"]
+    assert alerts[0]["time"] == pytest.approx(start_time + 0.1)
+
+def test_replay_of_day_footage_raises_a_normal_threat():
+    alerts = replay_lingering_stranger(datetime(2024, 5, 1, 12, 0).timestamp())
+    assert [fired["message"] for fired in alerts] == ["Normal threat"]
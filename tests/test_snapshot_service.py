@@ -0,0 +1,36 @@
+import os
+
+import numpy as np
+
+import snapshot_service
+from snapshot_service import SnapshotService
+from thumbnails import existing_thumbnails
+
+def make_service(tmp_path, registered):
+    return SnapshotService(directory=str(tmp_path / "snapshots"),
+                           register=lambda path, **fields: registered.append((path, fields)))
+
+def test_snapshot_is_written_with_its_thumbnails(tmp_path):
+    registered = []
+    service = make_service(tmp_path, registered)
+    path = service.save(np.zeros((240, 320, 3), dtype=np.uint8), "motion", camera="door")
+
+    assert service.wait(path, timeout=5)
+    assert os.path.exists(path)
+    assert len(existing_thumbnails(path)) == len(service.thumbnail_sizes)
+    assert [(p, fields["label"], fields["camera"]) for p, fields in registered] == [(path, "motion", "door")]
+
+def test_failed_thumbnails_do_not_lose_the_snapshot(tmp_path, monkeypatch):
+    def broken_thumbnails(frame, path, sizes):
+        raise OSError("disk quota exceeded")
+
+    monkeypatch.setattr(snapshot_service, "write_thumbnails", broken_thumbnails)
+    registered = []
+    service = make_service(tmp_path, registered)
+    path = service.save(np.zeros((240, 320, 3), dtype=np.uint8), "motion")
+
+    assert service.wait(path, timeout=5)
+    assert os.path.exists(path)
+    assert existing_thumbnails(path) == []
+    assert [p for p, _ in registered] == [path]
+    assert os.listdir(service.incoming_dir) == []
@@ -0,0 +1,32 @@
+from tracker import FaceTracker
+
+SEATED = (100, 200, 200, 100)
+WALKING_IN = (100, 500, 200, 400)
+
+def test_live_tracks_include_faces_the_current_frame_missed():
+    tracker = FaceTracker(max_age=3.0)
+    seated, = tracker.update([SEATED], now=0.0)
+    # Between full-frame passes only the guest's motion region is searched
+    guest, = tracker.update([WALKING_IN], now=1.0)
+
+    assert {track.track_id for track in tracker.live_tracks(1.0)} == {seated.track_id, guest.track_id}
+    assert [track.track_id for track in tracker.live_tracks(3.5)] == [guest.track_id]
+
+def test_live_tracks_leave_out_tracks_from_later_frames():
+    tracker = FaceTracker()
+    seated, = tracker.update([SEATED], now=0.0)
+    tracker.update([SEATED, WALKING_IN], now=2.0)
+
+    # The tracking stage can run ahead of the frame whose alerts are being decided
+    assert [track.track_id for track in tracker.live_tracks(1.0)] == [seated.track_id]
+
+def test_older_encoding_result_does_not_replace_a_newer_one():
+    tracker = FaceTracker()
+    track, = tracker.update([SEATED], now=0.0)
+    moved = (110, 210, 210, 110)
+    tracker.update([moved], now=1.0)
+
+    # The encoder for the frame at 1.0 finishes before the one for 0.0
+    assert tracker.set_identity(track, "alice", 0.3, moved, now=1.0)
+    assert not tracker.set_identity(track, "unknown", 0.7, SEATED, now=0.0)
+    assert (track.name, track.last_encoded_box, track.last_encoded_at) == ("alice", moved, 1.0)
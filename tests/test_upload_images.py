@@ -0,0 +1,169 @@
+import sqlite3
+import sys
+import time
+import types
+
+import cloudinary
+import pytest
+
+# config.py holds the Cloudinary credentials each installation creates (see README),
+# the fake server needs none
+sys.modules.setdefault("config", types.ModuleType("config"))
+
+import upload_images
+from database import SnapshotCatalog, UPLOAD_DONE, UPLOAD_FAILED, UPLOAD_PENDING, UPLOAD_UNKNOWN
+from fakes import FakeCloudinaryServer
+from upload_images import UploadManager, make_public_id
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+@pytest.fixture
+def server():
+    server = FakeCloudinaryServer().start()
+    cloudinary.config(cloud_name=server.cloud_name, api_key="key", api_secret="secret", upload_prefix=server.url)
+    yield server
+    server.stop()
+
+@pytest.fixture
+def catalog(tmp_path):
+    return SnapshotCatalog(str(tmp_path / "snapshots.db"), write_interval=0.01)
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(upload_images, "backoff_delay", lambda attempt: 0.05)
+
+def make_snapshots(tmp_path, catalog, count, name="cam_motion"):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f"{name}_{i}.jpg"
+        path.write_bytes(b"\xff\xd8" + bytes([i % 256]) * 1000)
+        catalog.add(str(path), label="motion", camera="cam")
+        paths.append(str(path))
+    catalog.flush()
+    return paths
+
+def uploaded(catalog, paths):
+    catalog.flush()
+    return all(catalog.get(path)["upload_status"] == UPLOAD_DONE for path in paths)
+
+def test_uploads_run_concurrently(tmp_path, server, catalog):
+    server.latency = 0.2
+    paths = make_snapshots(tmp_path, catalog, 12)
+    manager = UploadManager(catalog=catalog, workers=4).start()
+    started = time.time()
+    for path in paths:
+        manager.submit(path, ready=True)
+
+    assert wait_for(lambda: uploaded(catalog, paths))
+    # One at a time would take 12 x 0.2s
+    assert time.time() - started < 1.8
+    assert manager.stats()["uploaded"] == 12
+    manager.stop()
+
+def test_upload_is_retried_after_failures(tmp_path, server, catalog):
+    paths = make_snapshots(tmp_path, catalog, 1)
+    server.fail_next(2)
+    manager = UploadManager(catalog=catalog, workers=1).start()
+    manager.submit(paths[0], ready=True)
+
+    assert wait_for(lambda: uploaded(catalog, paths))
+    row = catalog.get(paths[0])
+    assert server.uploads == 3
+    # The retries reuse the public_id, so there is exactly one resource
+    assert list(server.resources) == [row["public_id"]]
+    assert row["remote_url"] == server.resources[row["public_id"]]["secure_url"]
+    manager.stop()
+
+def test_gives_up_and_marks_failed(tmp_path, server, catalog):
+    paths = make_snapshots(tmp_path, catalog, 1)
+    server.fail_next(10)
+    manager = UploadManager(catalog=catalog, workers=1, max_attempts=3).start()
+    manager.submit(paths[0], ready=True)
+
+    assert wait_for(lambda: catalog.flush() and catalog.get(paths[0])["upload_status"] == UPLOAD_FAILED)
+    assert manager.stats()["failed"] == 1
+    manager.stop()
+
+def test_resume_uploads_pending_and_failed_rows(tmp_path, server, catalog):
+    pending, failed, done = make_snapshots(tmp_path, catalog, 3)
+    catalog.set_upload_status(failed, UPLOAD_FAILED, public_id="surveillance_failed_keep")
+    catalog.set_upload_status(done, UPLOAD_DONE)
+    catalog.flush()
+
+    manager = UploadManager(catalog=catalog, workers=2).start()
+
+    assert wait_for(lambda: uploaded(catalog, [pending, failed]))
+    assert server.uploads == 2
+    # A file that failed before keeps its public_id
+    assert "surveillance_failed_keep" in server.resources
+    manager.stop()
+
+def test_retry_sweep_skips_uploads_whose_status_is_not_committed_yet(tmp_path, server, catalog, monkeypatch):
+    paths = make_snapshots(tmp_path, catalog, 1)
+    commit = catalog._commit
+
+    def slow_commit(statements):
+        time.sleep(0.3)
+        return commit(statements)
+
+    monkeypatch.setattr(catalog, "_commit", slow_commit)
+    manager = UploadManager(catalog=catalog, workers=1).start()
+    manager.submit(paths[0], ready=True)
+
+    assert wait_for(lambda: manager.stats()["uploaded"] == 1)
+    # The periodic sweep runs while the UPLOAD_DONE write is still queued
+    manager.resume()
+    assert wait_for(lambda: uploaded(catalog, paths))
+    time.sleep(0.3)
+    assert server.uploads == 1
+    manager.stop()
+
+def test_public_ids_do_not_collide(tmp_path, server, catalog):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    first = make_snapshots(tmp_path / "a", catalog, 1)
+    second = make_snapshots(tmp_path / "b", catalog, 1)
+    assert len({make_public_id(first[0]) for _ in range(100)}) == 100
+
+    manager = UploadManager(catalog=catalog, workers=2).start()
+    # Same file name, written in the same second by two cameras
+    manager.submit(first[0], ready=True)
+    manager.submit(second[0], ready=True)
+
+    assert wait_for(lambda: uploaded(catalog, first + second))
+    assert len(server.resources) == 2
+    assert catalog.get(first[0])["public_id"] != catalog.get(second[0])["public_id"]
+    manager.stop()
+
+def test_uploader_does_not_add_catalog_rows(tmp_path, server, catalog, monkeypatch):
+    monkeypatch.setattr(upload_images, "ROW_WAIT_TIMEOUT", 0.2)
+    path = tmp_path / "copied_in.jpg"
+    path.write_bytes(b"\xff\xd8" + b"\0" * 100)
+    manager = UploadManager(catalog=catalog, workers=1).start()
+    manager.submit(str(path), ready=True)
+
+    assert wait_for(lambda: server.resources)
+    catalog.flush()
+    assert catalog.count() == 0
+    manager.stop()
+
+def test_rows_from_before_upload_tracking_are_not_uploaded_again(tmp_path, server):
+    path = tmp_path / "snapshots.db"
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE snapshots (id INTEGER PRIMARY KEY AUTOINCREMENT, filepath TEXT NOT NULL, "
+                 "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)")
+    snapshot = tmp_path / "old.jpg"
+    snapshot.write_bytes(b"\xff\xd8")
+    conn.execute("INSERT INTO snapshots (filepath) VALUES (?)", (str(snapshot),))
+    conn.commit()
+    conn.close()
+
+    catalog = SnapshotCatalog(str(path))
+    assert catalog.get(str(snapshot))["upload_status"] == UPLOAD_UNKNOWN
+    assert catalog.count(upload_status=UPLOAD_PENDING) == 0
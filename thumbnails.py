@@ -0,0 +1,52 @@
+import os
+import cv2
+import numpy as np
+
+# The dashboard tile size, more sizes can be added as (width, height)
+THUMBNAIL_SIZES = ((400, 300),)
+THUMBNAIL_DIR = "thumbs"
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_BACKGROUND = (255, 255, 255)
+
+def letterbox(frame, size, background=THUMBNAIL_BACKGROUND):
+    """Shrink frame to fit size keeping its aspect ratio and center it on a plain background"""
+    width, height = size
+    scale = min(width / frame.shape[1], height / frame.shape[0], 1.0)
+    resized_width, resized_height = round(frame.shape[1] * scale), round(frame.shape[0] * scale)
+    if scale < 1.0:
+        frame = cv2.resize(frame, (resized_width, resized_height), interpolation=cv2.INTER_AREA)
+    canvas = np.empty((height, width, 3), dtype=np.uint8)
+    canvas[:] = background
+    x = (width - resized_width) // 2
+    y = (height - resized_height) // 2
+    canvas[y:y + resized_height, x:x + resized_width] = frame
+    return canvas
+
+def thumbnail_path(path, size):
+    """snapshots/thumbs/<name>_<width>x<height>.jpg for snapshots/<name>.<ext>"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(os.path.dirname(path), THUMBNAIL_DIR, f"{stem}_{size[0]}x{size[1]}.jpg")
+
+def thumbnail_public_id(public_id, size):
+    """Where the derivative of an uploaded snapshot lives, e.g. thumbs/surveillance_..._400x300"""
+    return f"{THUMBNAIL_DIR}/{public_id}_{size[0]}x{size[1]}"
+
+def write_thumbnails(frame, path, sizes=THUMBNAIL_SIZES, quality=THUMBNAIL_QUALITY):
+    """Write the letterboxed thumbnails of a snapshot next to it, returns their paths"""
+    paths = []
+    for size in sizes:
+        thumb_path = thumbnail_path(path, size)
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        ok, encoded = cv2.imencode(".jpg", letterbox(frame, size), [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise IOError(f"Could not encode thumbnail {thumb_path}")
+        tmp_path = thumb_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(encoded.tobytes())
+        os.replace(tmp_path, thumb_path)
+        paths.append(thumb_path)
+    return paths
+
+def existing_thumbnails(path, sizes=THUMBNAIL_SIZES):
+    """(size, thumbnail path) for the thumbnails of path that are on disk"""
+    return [(size, thumbnail_path(path, size)) for size in sizes if os.path.exists(thumbnail_path(path, size))]
@@ -0,0 +1,118 @@
+import itertools
+import threading
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    if intersection == 0:
+        return 0.0
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return intersection / float(area_a + area_b - intersection)
+
+def box_centroid(box):
+    top, right, bottom, left = box
+    return (left + right) / 2.0, (top + bottom) / 2.0
+
+class Track:
+    """A face followed across frames, with its cached identity"""
+
+    def __init__(self, track_id, box, now):
+        self.track_id = track_id
+        self.box = box
+        self.first_seen = now
+        self.last_seen = now
+        self.name = None
+        self.distance = None
+        self.last_encoded_at = None
+        self.last_encoded_box = None
+        self.updates_since_encoding = 0
+
+    @property
+    def dwell_time(self):
+        """Seconds this face has been continuously tracked"""
+        return self.last_seen - self.first_seen
+
+class FaceTracker:
+    """Associates face boxes between frames by IoU, falling back to centroid distance.
+
+    A track is only re-encoded every `reencode_every` updates, or sooner when its
+    box has moved so much that the IoU with the last encoded box drops below
+    `reencode_iou`. Tracks that go unseen for `max_age` seconds are dropped.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=3.0, reencode_every=10, reencode_iou=0.5):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.reencode_every = reencode_every
+        self.reencode_iou = reencode_iou
+        self.tracks = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def update(self, face_locations, now):
+        """Match face boxes to tracks and return the track for each box, in order"""
+        with self._lock:
+            for track_id in [t.track_id for t in self.tracks.values() if now - t.last_seen > self.max_age]:
+                del self.tracks[track_id]
+
+            candidates = []
+            for i, box in enumerate(face_locations):
+                for track in self.tracks.values():
+                    iou = box_iou(box, track.box)
+                    if iou >= self.iou_threshold:
+                        candidates.append((iou, i, track))
+                    else:
+                        # Fast movers may not overlap their previous box at all
+                        cx, cy = box_centroid(box)
+                        tx, ty = box_centroid(track.box)
+                        size = max(track.box[1] - track.box[3], track.box[2] - track.box[0])
+                        if ((cx - tx) ** 2 + (cy - ty) ** 2) ** 0.5 < size * 0.5:
+                            candidates.append((0.0, i, track))
+
+            assigned = [None] * len(face_locations)
+            used_tracks = set()
+            for _, i, track in sorted(candidates, key=lambda c: c[0], reverse=True):
+                if assigned[i] is None and track.track_id not in used_tracks:
+                    assigned[i] = track
+                    used_tracks.add(track.track_id)
+
+            for i, box in enumerate(face_locations):
+                track = assigned[i]
+                if track is None:
+                    track = Track(next(self._ids), box, now)
+                    self.tracks[track.track_id] = track
+                    assigned[i] = track
+                track.box = box
+                track.last_seen = now
+                track.updates_since_encoding += 1
+            return assigned
+
+    def live_tracks(self, now):
+        """Tracks that existed at now and have not expired, including faces the current frame missed"""
+        with self._lock:
+            return [track for track in self.tracks.values()
+                    if track.first_seen <= now and now - track.last_seen <= self.max_age]
+
+    def needs_encoding(self, track):
+        """Whether the track has no identity yet, is due, or has moved too much since its last encoding"""
+        if track.name is None or track.last_encoded_box is None:
+            return True
+        if track.updates_since_encoding >= self.reencode_every:
+            return True
+        return box_iou(track.box, track.last_encoded_box) < self.reencode_iou
+
+    def set_identity(self, track, name, distance, box, now):
+        """Store the result of encoding and matching a track, unless a newer frame's result is already stored"""
+        with self._lock:
+            # Encode workers can finish out of order
+            if track.last_encoded_at is not None and now < track.last_encoded_at:
+                return False
+            track.name = name
+            track.distance = distance
+            track.last_encoded_at = now
+            track.last_encoded_box = box
+            track.updates_since_encoding = 0
+            return True
@@ -1,70 +1,317 @@
-import time
+import argparse
+import heapq
+import itertools
+import logging
 import os
+import queue
+import threading
+import time
+import uuid
+import cloudinary
 import cloudinary.uploader
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import config
-from datetime import datetime
 
-FOLDER_TO_WATCH = r"C:\Users\Acer\OneDrive\Desktop\VISION GUARD\snapshots"
+from alert_dispatcher import backoff_delay
+from database import get_catalog, UPLOAD_PENDING, UPLOAD_DONE, UPLOAD_FAILED
+from metrics import REGISTRY, start_http_server
+from snapshot_service import INCOMING_DIR
+from thumbnails import existing_thumbnails, thumbnail_public_id
+
+logger = logging.getLogger(__name__)
+
+FOLDER_TO_WATCH = os.getenv("FOLDER_TO_WATCH", r"C:\Users\Acer\OneDrive\Desktop\VISION GUARD\snapshots")
+# Send uploads to another Cloudinary-compatible API, e.g. fakes.FakeCloudinaryServer
+if os.getenv("CLOUDINARY_UPLOAD_PREFIX"):
+    cloudinary.config(upload_prefix=os.getenv("CLOUDINARY_UPLOAD_PREFIX"))
+
+MEDIA_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.mp4')
+UPLOAD_WORKERS = 4
+MAX_UPLOAD_ATTEMPTS = 6
+# Files from unknown writers are uploaded once their size stops changing
+STABLE_INTERVAL = 0.25
+STABLE_TIMEOUT = 60.0
+# Ready files wait this long for the writer's catalog row, files nobody catalogs are uploaded after it
+ROW_WAIT_INTERVAL = 0.25
+ROW_WAIT_TIMEOUT = 10.0
+# Failed uploads are picked up from the catalog again this often
+RETRY_SWEEP_INTERVAL = 300.0
+STATS_INTERVAL = 30.0
+UPLOAD_METRICS_PORT = 9110
+
+UPLOAD_SECONDS = REGISTRY.histogram("upload_seconds", "Time spent uploading one file")
+UPLOADS = REGISTRY.counter("uploads_total", "Files uploaded")
+UPLOAD_BYTES = REGISTRY.counter("upload_bytes_total", "Bytes uploaded")
+UPLOAD_FAILURES = REGISTRY.counter("upload_failures_total", "Failed upload attempts")
+
+def make_public_id(path):
+    """surveillance_<file name>_<random suffix>, unique even for files written in the same second"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"surveillance_{stem}_{uuid.uuid4().hex[:8]}"
+
+class UploadManager:
+    """Uploads snapshots and clips on a bounded worker pool, retrying until they get through.
+
+    submit(path, ready=True) is the handoff from a writer that only exposes
+    complete files (the snapshot service renames them into place); other
+    files are uploaded once their size is stable. Upload state lives in the
+    snapshot catalog, so pending and failed files are picked up again after
+    a restart or an outage. The catalog rows belong to the writer, a file
+    waits up to ROW_WAIT_TIMEOUT for its row before it is uploaded.
+    """
+
+    def __init__(self, uploader=cloudinary.uploader, catalog=None, workers=UPLOAD_WORKERS,
+                 max_attempts=MAX_UPLOAD_ATTEMPTS, stable_interval=STABLE_INTERVAL):
+        self.uploader = uploader
+        self.catalog = catalog or get_catalog()
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.stable_interval = stable_interval
+        self.uploaded = 0
+        self.failed = 0
+        self.bytes_uploaded = 0
+        self.started_at = None
+        self._queue = queue.Queue()
+        self._scheduled = []
+        self._sequence = itertools.count()
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stop_event = threading.Event()
+        self._threads = []
+        REGISTRY.gauge("upload_backlog", "Files waiting to be uploaded", read=self.backlog)
+
+    def backlog(self):
+        with self._lock:
+            return len(self._active)
+
+    def start(self):
+        self.started_at = time.time()
+        self._threads = [threading.Thread(target=self._work, name=f"upload-{i}", daemon=True)
+                         for i in range(self.workers)]
+        self._threads.append(threading.Thread(target=self._schedule_loop, name="upload-scheduler", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        self.resume()
+        return self
+
+    def submit(self, path, ready=False, public_id=None):
+        """Queue a file for upload, ignoring files that are already queued"""
+        if not path.lower().endswith(MEDIA_EXTENSIONS):
+            return
+        with self._lock:
+            if path in self._active:
+                return
+            self._active[path] = public_id or make_public_id(path)
+        if ready:
+            self._schedule(0, ("row", path, time.time()))
+        else:
+            self._schedule(self.stable_interval, ("check", path, -1, time.time()))
+
+    def submit_ready(self, path):
+        """on_durable listener for the snapshot service"""
+        self.submit(path, ready=True)
+
+    def resume(self):
+        """Queue every catalogued file that has not been uploaded yet"""
+        resumed = 0
+        for status in (UPLOAD_PENDING, UPLOAD_FAILED):
+            for row in self.catalog.iter_rows(upload_status=status):
+                if os.path.exists(row["filepath"]):
+                    self.submit(row["filepath"], ready=True, public_id=row["public_id"])
+                    resumed += 1
+        if resumed:
+            logger.info(f"🔄 Resuming {resumed} pending uploads")
+
+    def _schedule(self, delay, task):
+        with self._wakeup:
+            heapq.heappush(self._scheduled, (time.time() + delay, next(self._sequence), task))
+            self._wakeup.notify()
+
+    def _schedule_loop(self):
+        last_sweep = time.time()
+        while not self._stop_event.is_set():
+            with self._wakeup:
+                now = time.time()
+                due = []
+                while self._scheduled and self._scheduled[0][0] <= now:
+                    due.append(heapq.heappop(self._scheduled)[2])
+                if not due:
+                    timeout = self._scheduled[0][0] - now if self._scheduled else 1.0
+                    self._wakeup.wait(min(timeout, 1.0))
+            for task in due:
+                self._run_task(task)
+            if time.time() - last_sweep >= RETRY_SWEEP_INTERVAL:
+                last_sweep = time.time()
+                self.resume()
+
+    def _run_task(self, task):
+        kind, path = task[0], task[1]
+        if kind == "retry":
+            self._queue.put((path, task[2]))
+            return
+        if kind == "row":
+            first_seen = task[2]
+            if self.catalog.get(path) is not None:
+                self._queue.put((path, 0))
+            elif time.time() - first_seen >= ROW_WAIT_TIMEOUT:
+                logger.debug(f"{path} is not in the catalog, uploading it without tracking its state")
+                self._queue.put((path, 0))
+            else:
+                self._schedule(ROW_WAIT_INTERVAL, ("row", path, first_seen))
+            return
+
+        _, path, last_size, first_seen = task
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            self._forget(path)
+            return
+        if size > 0 and size == last_size:
+            self._schedule(0, ("row", path, time.time()))
+        elif time.time() - first_seen > STABLE_TIMEOUT:
+            logger.warning(f"⚠️ {path} is still changing after {STABLE_TIMEOUT:.0f}s, uploading it anyway")
+            self._queue.put((path, 0))
+        else:
+            self._schedule(self.stable_interval, ("check", path, size, first_seen))
+
+    def _forget(self, path):
+        with self._lock:
+            self._active.pop(path, None)
+
+    def _work(self):
+        while True:
+            path, attempts = self._queue.get()
+            if path is None:
+                return
+            self._upload(path, attempts)
+
+    def _upload(self, path, attempts):
+        with self._lock:
+            public_id = self._active.get(path)
+        if public_id is None or not os.path.exists(path):
+            self._forget(path)
+            return
+
+        try:
+            with UPLOAD_SECONDS.time():
+                response = self.uploader.upload(path, public_id=public_id, overwrite=True, resource_type="auto")
+                # Derivatives go up with their original and are retried with it
+                for size, thumb_path in existing_thumbnails(path):
+                    self.uploader.upload(thumb_path, public_id=thumbnail_public_id(public_id, size),
+                                         overwrite=True, resource_type="image")
+        except Exception as e:
+            attempts += 1
+            UPLOAD_FAILURES.inc()
+            if attempts >= self.max_attempts:
+                logger.error(f"❌ Giving up on {path} for now after {attempts} attempts: {str(e)}")
+                with self._lock:
+                    self.failed += 1
+                self.catalog.set_upload_status(path, UPLOAD_FAILED, public_id=public_id)
+                self._forget(path)
+                return
+            delay = backoff_delay(attempts)
+            logger.warning(f"⚠️ Upload of {path} failed ({str(e)}), retry {attempts} in {delay:.1f}s")
+            # Keep the public_id so a retry after a lost response overwrites instead of duplicating
+            self.catalog.set_upload_status(path, UPLOAD_PENDING, public_id=public_id)
+            self._schedule(delay, ("retry", path, attempts))
+            return
+
+        size = response.get("bytes") or os.path.getsize(path)
+        with self._lock:
+            self.uploaded += 1
+            self.bytes_uploaded += size
+        UPLOADS.inc()
+        UPLOAD_BYTES.inc(size)
+        self.catalog.set_upload_status(path, UPLOAD_DONE, remote_url=response.get("secure_url"),
+                                       public_id=response.get("public_id", public_id))
+        # Until the status is committed the retry sweep would still read the row as pending
+        self.catalog.flush(5.0)
+        self._forget(path)
+        logger.info(f"✅ Uploaded {path}: {response.get('secure_url')}")
+
+    def stats(self):
+        elapsed = max(time.time() - (self.started_at or time.time()), 1e-9)
+        return {
+            "uploaded": self.uploaded,
+            "failed": self.failed,
+            "backlog": self.backlog(),
+            "files_per_second": round(self.uploaded / elapsed, 3),
+            "bytes_per_second": round(self.bytes_uploaded / elapsed, 1),
+        }
+
+    def stop(self):
+        self._stop_event.set()
+        with self._wakeup:
+            self._wakeup.notify()
+        for _ in range(self.workers):
+            self._queue.put((None, 0))
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self.catalog.flush(5.0)
 
 class SnapshotHandler(FileSystemEventHandler):
+    def __init__(self, manager):
+        self.manager = manager
+
     def on_created(self, event):
+        # The snapshot service writes into .incoming and renames complete files
+        # into the watched folder, which a non-recursive watch reports as created
+        if event.is_directory:
+            return
+        ready = os.path.basename(os.path.dirname(event.src_path)) != INCOMING_DIR
+        self.manager.submit(event.src_path, ready=ready)
+
+    def on_moved(self, event):
         if event.is_directory:
             return
-        if event.src_path.lower().endswith(('.png', '.jpg', '.jpeg')):
-            print(f"[{datetime.now()}] New image detected: {event.src_path}")
-            try:
-                # Add a small delay to ensure file is completely written
-                time.sleep(0.5)
-                image_url = upload_to_cloudinary(event.src_path)
-                if image_url:
-                    print(f"[{datetime.now()}] Successfully uploaded: {image_url}")
-            except Exception as e:
-                print(f"[{datetime.now()}] Error uploading image: {str(e)}")
+        self.manager.submit(event.dest_path, ready=True)
 
 def upload_to_cloudinary(image_path):
+    """Upload one file right away and return its URL, None if it failed"""
     try:
-        # Verify file exists and is readable
-        if not os.path.exists(image_path):
-            print(f"Error: File does not exist: {image_path}")
-            return None
-            
-        print(f"Attempting to upload file: {image_path}")
-        print(f"File size: {os.path.getsize(image_path)} bytes")
-        
-        # Add unique public_id based on timestamp
-        timestamp = int(time.time())
-        response = cloudinary.uploader.upload(
-            image_path,
-            public_id=f"surveillance_{timestamp}",
-            overwrite=True
-        )
-        print(f"Upload response: {response}")  # Debug print
+        response = cloudinary.uploader.upload(image_path, public_id=make_public_id(image_path),
+                                              overwrite=True, resource_type="auto")
         return response['secure_url']
     except Exception as e:
-        print(f"Upload error: {str(e)}")
-        print(f"Error type: {type(e)}")  # Print error type
+        logger.error(f"❌ Upload error for {image_path}: {str(e)}")
         return None
 
-if __name__ == "__main__":
-    print(f"[{datetime.now()}] Starting surveillance monitoring...")
-    print(f"Watching folder: {FOLDER_TO_WATCH}")
-    
+def main():
+    parser = argparse.ArgumentParser(description="Upload new snapshots and clips to Cloudinary")
+    parser.add_argument("--folder", default=FOLDER_TO_WATCH, help="Folder to watch (default: $FOLDER_TO_WATCH)")
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS)
+    parser.add_argument("--metrics-port", type=int, default=UPLOAD_METRICS_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
+    logger.info("🔄 Starting surveillance upload monitoring...")
+    logger.info(f"Watching folder: {args.folder}")
+
     # Verify folder exists
-    if not os.path.exists(FOLDER_TO_WATCH):
-        os.makedirs(FOLDER_TO_WATCH)
-        print(f"Created monitoring folder: {FOLDER_TO_WATCH}")
+    if not os.path.exists(args.folder):
+        os.makedirs(args.folder)
+        logger.info(f"Created monitoring folder: {args.folder}")
 
-    event_handler = SnapshotHandler()
+    start_http_server(args.metrics_port)
+    manager = UploadManager(workers=args.workers).start()
     observer = Observer()
-    observer.schedule(event_handler, FOLDER_TO_WATCH, recursive=False)
+    observer.schedule(SnapshotHandler(manager), args.folder, recursive=False)
     observer.start()
 
     try:
         while True:
-            time.sleep(1)
+            time.sleep(STATS_INTERVAL)
+            stats = manager.stats()
+            logger.info(f"📊 {stats['uploaded']} uploaded ({stats['files_per_second']}/s, "
+                        f"{stats['bytes_per_second'] / 1024:.1f} KiB/s), {stats['failed']} failed, "
+                        f"{stats['backlog']} in backlog")
     except KeyboardInterrupt:
-        print("\nStopping surveillance monitoring...")
+        logger.info("\nStopping surveillance monitoring...")
         observer.stop()
     observer.join()
+    manager.stop()
+
+if __name__ == "__main__":
+    main()